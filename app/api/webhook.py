@@ -1,6 +1,17 @@
 from fastapi import APIRouter, Request, BackgroundTasks
+from fastapi.responses import PlainTextResponse
 from app.services.message_handler import process_message
-from app.utils.logger import logger
+from app.utils.logger import logger, log_payload
+from app.utils.embedding_cache import embedding_cache
+from app.models.semantic_cache import cache_semantico
+from app.services.fila_envio import fila_envio
+from app.services.fila_webhook import fila_webhook
+from app.services.agendador import agendador
+from app.services.llm_gateway import gateway_llm
+from app.utils.write_behind import persistencia, DEAD_LETTER as WRITE_BEHIND_DEAD_LETTER
+from app.utils.deduplicador import deduplicador
+from app.config.config import WEBHOOK_MODO
+from app.utils.metrics import metricas
 
 router = APIRouter()
 
@@ -11,19 +22,64 @@ router = APIRouter()
 async def receive_message(request: Request, background_tasks: BackgroundTasks):
     try:
         body = await request.json()
-        logger.info(f"[📬 WEBHOOK RECEBIDO] {body}")
+        log_payload("[📬 WEBHOOK RECEBIDO]", body)
 
-        # Executar o process_message no fundo
+        # Reentrega da Z-API: já foi (ou está sendo) processada
+        if not await deduplicador.primeira_entrega(body):
+            return {"status": "ok", "duplicado": True}
+
+        if WEBHOOK_MODO == "fila":
+            try:
+                await fila_webhook.enfileirar(body)
+                return {"status": "ok"}
+            except Exception as e:
+                logger.error("[FilaWebhook] Falha ao enfileirar, processando no próprio worker: %s", e)
+
+        # Executar o process_message no fundo, na vez da clínica
         background_tasks.add_task(process_message, body)
 
         # Retornar imediatamente para ZAPI
         return {"status": "ok"}
 
     except Exception as e:
-        logger.error(f"❌ Erro ao receber webhook: {e}")
+        logger.error("❌ Erro ao receber webhook: %s", e)
         return {"status": "error", "message": str(e)}
 
 
 @router.get("/ping")
 def ping():
     return {"pong": True}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    medidores = {
+        "embedding_cache_hit_ratio": embedding_cache.hit_ratio,
+        "resposta_cache_hits_total": cache_semantico.hits,
+        "resposta_cache_misses_total": cache_semantico.misses,
+    }
+    for chave, valor in agendador.stats().items():
+        medidores[f"agendador_{chave}"] = valor
+    for chave, valor in gateway_llm.stats().items():
+        medidores[f"llm_{chave}"] = valor
+    for chave, valor in persistencia.stats().items():
+        medidores[f"write_behind_{chave}"] = valor
+    try:
+        profundidade = await fila_envio.profundidade()
+        medidores["fila_envio_pendentes"] = profundidade["stream"]
+        medidores["fila_envio_adiadas"] = profundidade["adiadas"]
+        medidores["fila_envio_dead_letter"] = profundidade["dead_letter"]
+        entrada = await fila_webhook.profundidade()
+        medidores["fila_webhook_lag"] = entrada["lag"]
+        medidores["fila_webhook_pendentes"] = entrada["pendentes"]
+        medidores["fila_webhook_atraso_segundos"] = entrada["atraso_s"]
+        medidores["fila_webhook_dead_letter"] = entrada["dead_letter"]
+        medidores["write_behind_dead_letter"] = await persistencia.redis.llen(WRITE_BEHIND_DEAD_LETTER)
+    except Exception as e:
+        logger.warning("[Metrics] Falha ao ler profundidade da fila: %s", e)
+    return PlainTextResponse(metricas.exportar(medidores), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/cache/stats")
+def cache_stats():
+    return {"embeddings": embedding_cache.stats(), "respostas": cache_semantico.stats()}
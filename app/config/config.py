@@ -6,3 +6,111 @@ ZAPI_PHONE_HEADER = os.environ.get("ZAPI_PHONE_HEADER")
 REDIS_URL = os.environ.get("REDIS_URL")
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+
+# Cache local (L1) de config/funnel por processo, invalidado via pub/sub
+LOCAL_CACHE_TTL = int(os.environ.get("LOCAL_CACHE_TTL", 300))
+LOCAL_CACHE_MAXSIZE = int(os.environ.get("LOCAL_CACHE_MAXSIZE", 512))
+CACHE_INVALIDATION_CHANNEL = os.environ.get("CACHE_INVALIDATION_CHANNEL", "cache_invalidation")
+
+# Acesso assíncrono ao Supabase (PostgREST)
+SUPABASE_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT", 10))
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get("SUPABASE_MAX_CONNECTIONS", 20))
+SUPABASE_MAX_CONCURRENCY = int(os.environ.get("SUPABASE_MAX_CONCURRENCY", 10))
+
+# Write-behind da persistência (history/user_info) no Supabase
+WRITE_BEHIND_INTERVAL = float(os.environ.get("WRITE_BEHIND_INTERVAL", 5))
+WRITE_BEHIND_MAX_PENDENTES = int(os.environ.get("WRITE_BEHIND_MAX_PENDENTES", 200))
+# Flushes com erro que uma linha aguenta antes de ir para o dead-letter (write_behind:dead_letter)
+WRITE_BEHIND_MAX_TENTATIVAS = int(os.environ.get("WRITE_BEHIND_MAX_TENTATIVAS", 5))
+
+# Cache de embeddings (LRU local + Redis)
+EMBEDDING_CACHE_TTL = int(os.environ.get("EMBEDDING_CACHE_TTL", 604800))
+EMBEDDING_CACHE_LOCAL_TTL = int(os.environ.get("EMBEDDING_CACHE_LOCAL_TTL", 3600))
+EMBEDDING_CACHE_MAXSIZE = int(os.environ.get("EMBEDDING_CACHE_MAXSIZE", 2048))
+
+# Pinecone: threads do pool de conexões por índice e executor dedicado às queries
+PINECONE_POOL_THREADS = int(os.environ.get("PINECONE_POOL_THREADS", 4))
+PINECONE_QUERY_WORKERS = int(os.environ.get("PINECONE_QUERY_WORKERS", 8))
+
+# Busca vetorial local (NumPy) exportada do Pinecone
+VECTOR_STORE_DIR = os.environ.get("VECTOR_STORE_DIR", "data/vectors")
+
+# Transcrição de áudio
+AUDIO_MAX_BYTES = int(os.environ.get("AUDIO_MAX_BYTES", 16 * 1024 * 1024))
+AUDIO_TRANSCRICOES_SIMULTANEAS = int(os.environ.get("AUDIO_TRANSCRICOES_SIMULTANEAS", 4))
+AUDIO_CACHE_TTL = int(os.environ.get("AUDIO_CACHE_TTL", 604800))
+
+# Pool HTTP compartilhado (Z-API e demais chamadas de saída)
+ZAPI_TIMEOUT = float(os.environ.get("ZAPI_TIMEOUT", 10))
+ZAPI_MAX_CONNECTIONS = int(os.environ.get("ZAPI_MAX_CONNECTIONS", 50))
+ZAPI_MAX_KEEPALIVE = int(os.environ.get("ZAPI_MAX_KEEPALIVE", 20))
+ZAPI_MAX_CONEXOES_POR_INSTANCIA = int(os.environ.get("ZAPI_MAX_CONEXOES_POR_INSTANCIA", 5))
+HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Fila de envio Z-API (Redis Streams)
+ZAPI_SENDER_WORKERS = int(os.environ.get("ZAPI_SENDER_WORKERS", 2))
+ZAPI_RATE_POR_SEGUNDO = float(os.environ.get("ZAPI_RATE_POR_SEGUNDO", 5))
+ZAPI_RATE_BURST = int(os.environ.get("ZAPI_RATE_BURST", 10))
+ZAPI_MAX_TENTATIVAS = int(os.environ.get("ZAPI_MAX_TENTATIVAS", 5))
+ZAPI_BACKOFF_BASE = float(os.environ.get("ZAPI_BACKOFF_BASE", 1))
+ZAPI_BACKOFF_MAX = float(os.environ.get("ZAPI_BACKOFF_MAX", 30))
+
+# Orçamento de tokens do prompt (histórico e chunks da clínica)
+PROMPT_HISTORICO_MAX_TOKENS = int(os.environ.get("PROMPT_HISTORICO_MAX_TOKENS", 1500))
+PROMPT_CHUNKS_MAX_TOKENS = int(os.environ.get("PROMPT_CHUNKS_MAX_TOKENS", 1200))
+
+# Cache semântico de respostas (opt-in por cliente)
+SEMANTIC_CACHE_TTL = int(os.environ.get("SEMANTIC_CACHE_TTL", 86400))
+SEMANTIC_CACHE_MAX_POR_NAMESPACE = int(os.environ.get("SEMANTIC_CACHE_MAX_POR_NAMESPACE", 200))
+
+# Logging assíncrono (fila + thread de escrita)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Nível por módulo, ex.: "openai_service=WARNING,search_chunks=WARNING"
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+LOG_FILA_MAX = int(os.environ.get("LOG_FILA_MAX", 10000))
+LOG_MAX_CHARS = int(os.environ.get("LOG_MAX_CHARS", 8000))
+# Logs de payload grande (webhook, prompt, chunks): tamanho máximo e fração amostrada
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get("LOG_PAYLOAD_MAX_CHARS", 2000))
+LOG_PAYLOAD_AMOSTRAGEM = float(os.environ.get("LOG_PAYLOAD_AMOSTRAGEM", 1.0))
+
+# Ingestão do webhook: "fila" (Redis Stream + workers) ou "background" (BackgroundTasks do FastAPI)
+WEBHOOK_MODO = os.environ.get("WEBHOOK_MODO", "fila").lower()
+# Entradas da fila em andamento neste processo (0 = só o processo `worker` do Procfile consome). A maior
+# parte delas fica dormindo no debounce, sem custo; as chamadas ao LLM são limitadas à parte, por
+# AGENDADOR_MAX_CONCORRENCIA, então este número pode ser bem maior que o de respostas simultâneas.
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", 500))
+# Entrada sem ACK há mais que isso (worker caiu) é reprocessada; precisa cobrir debounce + LLM
+WEBHOOK_RECLAIM_IDLE_MS = int(os.environ.get("WEBHOOK_RECLAIM_IDLE_MS", 120000))
+# No deploy/desligamento, espera até isso pelas entradas em andamento antes de cancelá-las
+WEBHOOK_DRENAGEM_S = float(os.environ.get("WEBHOOK_DRENAGEM_S", 25))
+# Deduplicação de reentregas da Z-API por messageId
+WEBHOOK_DEDUP_TTL = int(os.environ.get("WEBHOOK_DEDUP_TTL", 86400))
+WEBHOOK_DEDUP_LOCAL_MAX = int(os.environ.get("WEBHOOK_DEDUP_LOCAL_MAX", 10000))
+
+# Agendador por clínica (connectedPhone) da metade LLM/resposta do process_message (após o debounce)
+AGENDADOR_MAX_CONCORRENCIA = int(os.environ.get("AGENDADOR_MAX_CONCORRENCIA", 32))
+TENANT_MAX_CONCORRENCIA = int(os.environ.get("TENANT_MAX_CONCORRENCIA", 8))
+# Exceções por clínica, ex.: "5511999990000=16,5511888880000=2"
+TENANT_LIMITES = os.environ.get("TENANT_LIMITES", "")
+# Pesos da fila justa, ex.: "5511999990000=2" (padrão 1)
+TENANT_PESOS = os.environ.get("TENANT_PESOS", "")
+
+# Gateway das chamadas de chat à OpenAI
+LLM_REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT", 30))
+LLM_MAX_CONEXOES = int(os.environ.get("LLM_MAX_CONEXOES", 100))
+# Backoff exponencial com jitter entre tentativas; Retry-After acima do teto vai direto ao fallback
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 8))
+# Falhas seguidas que abrem o circuito de um modelo e por quanto tempo ele fica aberto
+LLM_CIRCUITO_FALHAS = int(os.environ.get("LLM_CIRCUITO_FALHAS", 5))
+LLM_CIRCUITO_ABERTO_S = float(os.environ.get("LLM_CIRCUITO_ABERTO_S", 30))
+# Segunda chamada igual se a primeira não responder nesse tempo (0 = desligado)
+LLM_HEDGE_APOS_S = float(os.environ.get("LLM_HEDGE_APOS_S", 0))
+# Orçamento por modelo (por processo: divida o limite da conta entre os processos), ex.:
+# "gpt-4o-mini=500:200000,gpt-3.5-turbo=3500:160000" (requisições:tokens por minuto). Sem entrada = sem limite
+LLM_LIMITES = os.environ.get("LLM_LIMITES", "")
+# Fração do orçamento que só respostas ao paciente podem usar
+LLM_RESERVA_RESPOSTAS = float(os.environ.get("LLM_RESERVA_RESPOSTAS", 0.2))
+# Espera máxima por orçamento antes de tentar o modelo de fallback
+LLM_ESPERA_MAX_S = float(os.environ.get("LLM_ESPERA_MAX_S", 20))
@@ -0,0 +1,84 @@
+import asyncio
+import importlib.util
+import httpx
+from typing import Dict, Optional
+
+from app.config.config import (
+    SUPABASE_URL, SUPABASE_KEY, SUPABASE_TIMEOUT, SUPABASE_MAX_CONNECTIONS,
+    ZAPI_TIMEOUT, ZAPI_MAX_CONNECTIONS, ZAPI_MAX_KEEPALIVE, ZAPI_MAX_CONEXOES_POR_INSTANCIA, HTTP2_ENABLED
+)
+from app.utils.logger import logger
+
+# HTTP/2 depende do pacote opcional `h2` (pip install httpx[http2])
+HTTP2_DISPONIVEL = importlib.util.find_spec("h2") is not None
+
+
+class HttpClientPool:
+    """
+    Clientes httpx.AsyncClient nomeados e compartilhados pelo processo inteiro (abertos e fechados
+    no lifespan do FastAPI), para reaproveitar DNS, TCP e TLS entre mensagens.
+    """
+
+    def __init__(self, max_por_instancia: int = ZAPI_MAX_CONEXOES_POR_INSTANCIA):
+        self._configs: Dict[str, dict] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._semaforos: Dict[str, asyncio.Semaphore] = {}
+        self.max_por_instancia = max_por_instancia
+
+    def registrar(self, nome: str, http2: bool = False, **kwargs) -> None:
+        if http2 and not HTTP2_DISPONIVEL:
+            logger.warning("[HttpClientPool] HTTP/2 pedido para '%s', mas o pacote h2 não está instalado", nome)
+            http2 = False
+        self._configs[nome] = {"http2": http2, **kwargs}
+
+    def get(self, nome: str) -> httpx.AsyncClient:
+        client = self._clients.get(nome)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(**self._configs[nome])
+            self._clients[nome] = client
+        return client
+
+    def limitador(self, chave: str, limite: Optional[int] = None) -> asyncio.Semaphore:
+        """Semáforo por chave (ex.: instância Z-API) para limitar conexões simultâneas por destino."""
+        semaforo = self._semaforos.get(chave)
+        if semaforo is None:
+            semaforo = self._semaforos[chave] = asyncio.Semaphore(limite or self.max_por_instancia)
+        return semaforo
+
+    def abrir(self) -> None:
+        for nome in self._configs:
+            self.get(nome)
+
+    async def aclose(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+http_pool = HttpClientPool()
+
+http_pool.registrar(
+    "zapi",
+    base_url="https://api.z-api.io",
+    timeout=ZAPI_TIMEOUT,
+    limits=httpx.Limits(max_connections=ZAPI_MAX_CONNECTIONS, max_keepalive_connections=ZAPI_MAX_KEEPALIVE),
+    http2=HTTP2_ENABLED,
+)
+http_pool.registrar(
+    "supabase",
+    base_url=f"{(SUPABASE_URL or '').rstrip('/')}/rest/v1",
+    headers={
+        "apikey": SUPABASE_KEY or "",
+        "Authorization": f"Bearer {SUPABASE_KEY or ''}",
+        "Content-Type": "application/json",
+    },
+    timeout=SUPABASE_TIMEOUT,
+    limits=httpx.Limits(max_connections=SUPABASE_MAX_CONNECTIONS, max_keepalive_connections=SUPABASE_MAX_CONNECTIONS),
+    http2=HTTP2_ENABLED,
+)
+http_pool.registrar(
+    "audio",
+    timeout=30,
+    follow_redirects=True,
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+)
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import pinecone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable
+
+from app.config.config import API_KEY_PINECONE, PINECONE_POOL_THREADS, PINECONE_QUERY_WORKERS
+from app.utils.logger import logger
+
+pinecone_client = pinecone.Pinecone(api_key=API_KEY_PINECONE)
+
+
+class PineconeIndexRegistry:
+    """
+    Handles de índice do Pinecone compartilhados pelo processo (um por pinecone_index_name),
+    mantendo as conexões TLS quentes, e um executor limitado só para as queries bloqueantes do SDK.
+    """
+
+    def __init__(self, client: pinecone.Pinecone = pinecone_client, pool_threads: int = PINECONE_POOL_THREADS,
+                 max_workers: int = PINECONE_QUERY_WORKERS):
+        self.client = client
+        self.pool_threads = pool_threads
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pinecone")
+        self._indices: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, nome: str) -> Any:
+        index = self._indices.get(nome)
+        if index is None:
+            with self._lock:
+                index = self._indices.get(nome)
+                if index is None:
+                    index = self.client.Index(nome, pool_threads=self.pool_threads)
+                    self._indices[nome] = index
+        return index
+
+    async def executar(self, func: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def aquecer(self, nomes: Iterable[str]) -> None:
+        """Cria os handles e faz uma chamada leve em cada índice para abrir as conexões."""
+        for nome in {n for n in nomes if n}:
+            try:
+                index = self.get(nome)
+                await self.executar(index.describe_index_stats)
+                logger.info("[Pinecone] Índice aquecido: %s", nome)
+            except Exception as e:
+                logger.warning("[Pinecone] Falha ao aquecer índice %s: %s", nome, e)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+pinecone_indices = PineconeIndexRegistry()
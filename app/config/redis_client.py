@@ -13,4 +13,14 @@ redis_client = aioredis.from_url(
     health_check_interval=30,
     # ativa TCP keep-alive para não derrubar por inatividade
     socket_keepalive=True
-)
\ No newline at end of file
+)
+
+# Cliente sem decode, para valores binários (ex.: embeddings em float32)
+redis_binary_client = aioredis.from_url(
+    REDIS_URL,
+    decode_responses=False,
+    max_connections=20,
+    socket_timeout=5,
+    health_check_interval=30,
+    socket_keepalive=True
+)
@@ -1,17 +1,78 @@
-from supabase import create_client, Client
-from app.config.config import SUPABASE_URL, SUPABASE_KEY
+import asyncio
+import httpx
+from typing import Any, Dict, List, Optional, Union
 from datetime import datetime, timedelta, timezone
 
+from app.config.config import SUPABASE_MAX_CONCURRENCY
+from app.config.http_client import HttpClientPool, http_pool
+from app.utils.logger import logger
+
 # Defina o offset do seu fuso horário (Brasília normalmente é UTC-3)
 fuso_brasilia = timezone(timedelta(hours=-3))
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-def registrar_interacao(interacoes):
+class SupabaseRepository:
+    """
+    Camada assíncrona de acesso ao PostgREST do Supabase (account_data, user_data, sor_table).
+    Usa o cliente "supabase" do pool HTTP compartilhado (conexões keep-alive) e um semáforo
+    para limitar a concorrência, sem bloquear o event loop.
+    """
+
+    def __init__(self, http_pool: HttpClientPool = http_pool, max_concurrency: int = SUPABASE_MAX_CONCURRENCY):
+        self.http_pool = http_pool
+        self.semaforo = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self.http_pool.get("supabase")
+
+    async def _request(self, method: str, table: str, params: Optional[dict] = None,
+                       json: Any = None, prefer: Optional[str] = None) -> Any:
+        headers = {"Prefer": prefer} if prefer else None
+        async with self.semaforo:
+            resp = await self.client.request(method, f"/{table}", params=params, json=json, headers=headers)
+        resp.raise_for_status()
+        if not resp.content:
+            return None
+        return resp.json()
+
+    async def select(self, table: str, columns: str, filtros: Dict[str, Any],
+                     order: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        params = {"select": columns, **{k: f"eq.{v}" for k, v in filtros.items()}}
+        if order:
+            params["order"] = order
+        if limit:
+            params["limit"] = limit
+        return await self._request("GET", table, params=params) or []
+
+    async def select_one(self, table: str, columns: str, filtros: Dict[str, Any],
+                         order: Optional[str] = None) -> Optional[dict]:
+        rows = await self.select(table, columns, filtros, order=order, limit=1)
+        return rows[0] if rows else None
+
+    async def upsert(self, table: str, rows: Union[dict, List[dict]], on_conflict: str) -> None:
+        await self._request(
+            "POST", table, params={"on_conflict": on_conflict}, json=rows,
+            prefer="resolution=merge-duplicates,return=minimal"
+        )
+
+    async def insert(self, table: str, rows: Union[dict, List[dict]]) -> None:
+        await self._request("POST", table, json=rows, prefer="return=minimal")
+
+    async def delete(self, table: str, filtros: Dict[str, Any]) -> int:
+        params = {k: f"eq.{v}" for k, v in filtros.items()}
+        deleted = await self._request("DELETE", table, params=params, prefer="return=representation")
+        return len(deleted or [])
+
+
+supabase = SupabaseRepository()
+
+
+async def registrar_interacao(interacoes):
     for interacao in interacoes:
         interacao["anomesdia"] = datetime.now(fuso_brasilia).strftime("%Y%m%d")
         interacao["horaminuto"] = datetime.now(fuso_brasilia).strftime("%H%M")
     try:
-        supabase.table("sor_table").insert(interacoes).execute()
+        await supabase.insert("sor_table", interacoes)
     except Exception as e:
-        print(f"Erro ao registrar interação: {e}")
\ No newline at end of file
+        logger.error("Erro ao registrar interação: %s", e)
@@ -1,10 +1,58 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.utils.logger import logger
+from app.utils.local_cache import escutar_invalidacoes
+from app.config.http_client import http_pool
+from app.utils.write_behind import persistencia
+from app.config.pinecone_client import pinecone_indices
+from app.models.config_info import carregar_todas_configs
+from app.services.fila_envio import fila_envio
+from app.services.fila_webhook import fila_webhook
+from app.services.llm_gateway import gateway_llm
+from app.utils.tokens import aquecer_tokens
 from app.api.webhook import router as webhook_router
 
 logger.info("🚀 Iniciado com sucesso 🚀")
 
-app = FastAPI()
+
+async def aquecer_pinecone():
+    try:
+        configs = await carregar_todas_configs()
+        await pinecone_indices.aquecer(c.pinecone_index_name for c in configs)
+    except Exception as e:
+        logger.warning("Falha no aquecimento do Pinecone: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Invalidação do cache local (config/funnel) publicada por qualquer worker
+    # Clientes HTTP de saída (Z-API, Supabase, áudio) com keep-alive durante todo o processo
+    http_pool.abrir()
+    invalidacoes = asyncio.create_task(escutar_invalidacoes())
+    # Gravação em lote de history/user_info no Supabase
+    persistencia.start()
+    # Workers de envio da fila Z-API (0 = só o processo `sender` do Procfile envia)
+    await fila_envio.start()
+    # Workers do pipeline consumindo a fila de webhooks (0 = só o processo `worker` do Procfile)
+    await fila_webhook.start()
+    # Handles dos índices de todos os clientes prontos antes da primeira mensagem
+    aquecimento = asyncio.create_task(aquecer_pinecone())
+    # Encodings do tiktoken (o primeiro uso baixa o BPE) carregados numa thread, fora do loop
+    aquecimento_tokens = asyncio.create_task(asyncio.to_thread(aquecer_tokens))
+    yield
+    aquecimento.cancel()
+    aquecimento_tokens.cancel()
+    invalidacoes.cancel()
+    await fila_webhook.stop()
+    await fila_envio.stop()
+    await persistencia.stop()
+    pinecone_indices.shutdown()
+    await gateway_llm.aclose()
+    await http_pool.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(
     webhook_router
 )
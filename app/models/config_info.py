@@ -1,12 +1,15 @@
 import json
 import pytz
 from app.utils.logger import logger
+from app.utils.codec import codificar, decodificar
 from dataclasses import dataclass
-from typing import Optional, Any
+from typing import Optional, Any, List
 from datetime import datetime
 
 from app.config.redis_client import redis_client
 from app.config.supabase_client import supabase
+from app.utils.local_cache import LocalCache, local_cache
+from app.utils.metrics import cronometrado
 
 @dataclass
 class ConfigInfo:
@@ -17,6 +20,15 @@ class ConfigInfo:
     tempo_espera_debounce: Optional[int] = 0
     chave_parar_atendimento: Optional[str] = None
     horario_atendimento: Optional[dict] = None
+    # "pinecone" (padrão) ou "local" (busca NumPy exportada via app.services.vector_sync)
+    busca_vetorial: Optional[str] = "pinecone"
+    # Abreviações que não encerram frase na segmentação da resposta (None = padrão)
+    abreviacoes: Optional[List[str]] = None
+    # Envia cada frase assim que o LLM termina de gerá-la (stream)
+    resposta_streaming: Optional[bool] = False
+    # Cache semântico de respostas (FAQ) por pinecone_namespace
+    cache_semantico: Optional[bool] = False
+    cache_semantico_limiar: Optional[float] = 0.95
 
     @classmethod
     def from_dict(cls, data: dict) -> "ConfigInfo":
@@ -27,7 +39,12 @@ class ConfigInfo:
             pinecone_index_name=data.get("pinecone_index_name", ""),
             tempo_espera_debounce=data.get("tempo_espera_debounce", 0),
             chave_parar_atendimento=data.get("chave_parar_atendimento", None),
-            horario_atendimento=data.get("horario_atendimento", None)
+            horario_atendimento=data.get("horario_atendimento", None),
+            busca_vetorial=data.get("busca_vetorial", "pinecone"),
+            abreviacoes=data.get("abreviacoes", None),
+            resposta_streaming=data.get("resposta_streaming", False),
+            cache_semantico=data.get("cache_semantico", False),
+            cache_semantico_limiar=data.get("cache_semantico_limiar", 0.95)
         )
 
     def to_dict(self) -> dict:
@@ -38,7 +55,12 @@ class ConfigInfo:
             "pinecone_index_name": self.pinecone_index_name,
             "tempo_espera_debounce": self.tempo_espera_debounce,
             "chave_parar_atendimento": self.chave_parar_atendimento,
-            "horario_atendimento": self.horario_atendimento
+            "horario_atendimento": self.horario_atendimento,
+            "busca_vetorial": self.busca_vetorial,
+            "abreviacoes": self.abreviacoes,
+            "resposta_streaming": self.resposta_streaming,
+            "cache_semantico": self.cache_semantico,
+            "cache_semantico_limiar": self.cache_semantico_limiar
         }
     
     def desativar_assistente(self, mensagem: Optional[str]) -> bool:
@@ -73,7 +95,7 @@ class ConfigInfo:
             return True
 
         if not horarios or len(horarios) != 2:
-            logger.info(f"Erro no horário do TimeWindow, IMPORTANTE REVER")
+            logger.info("Erro no horário do TimeWindow, IMPORTANTE REVER")
             return True
 
         inicio = datetime.strptime(horarios[0], "%H:%M").time()
@@ -90,25 +112,39 @@ class ConfigInfo:
             return inicio <= hora_atual <= fim
 
 class ConfigService:                                                                                                                    #43200
-    def __init__(self, telefone_cliente: str, redis_client: Any = redis_client, supabase_client: Any = supabase, cache_ttl: Optional[int] = 43200, config: Optional[ConfigInfo] = None):
+    def __init__(self, telefone_cliente: str, redis_client: Any = redis_client, supabase_client: Any = supabase, cache_ttl: Optional[int] = 43200, config: Optional[ConfigInfo] = None, local_cache: LocalCache = local_cache):
         self.telefone_cliente = telefone_cliente
         self.redis_client = redis_client
+        self.local_cache = local_cache
         self.supabase = supabase_client
         self.cache_ttl = cache_ttl
         self.table = "account_data"
         self.field = "config_info"
         self.config = config
+        # De onde veio a última carga: "local" | "redis" | "supabase" (métricas)
+        self.origem = ""
 
+    @cronometrado("carga_config", origem="origem")
     async def get(self) -> ConfigInfo:
         if self.config:
+            self.origem = "local"
             return self.config  # ← Reuso
 
         key = f"{self.field}:{self.telefone_cliente}"
+        config = self.local_cache.get(key)
+        if config:
+            self.origem = "local"
+            self.config = config
+            return self.config
+
+        self.origem = "redis"
         config = await self.get_from_cache(key)
         if not config:
+            self.origem = "supabase"
             config = await self.get_from_supabase()
             await self.set_cache(key, config)
 
+        self.local_cache.set(key, config)
         self.config = config
         #return config
 
@@ -117,40 +153,35 @@ class ConfigService:
         if not raw:
             return None
         try:
-            return ConfigInfo.from_dict(json.loads(raw))
+            return ConfigInfo.from_dict(decodificar(raw))
         except json.JSONDecodeError:
-            logger.warning(f"[ConfigService] JSON inválido no cache Redis: {key}")
+            logger.warning("[ConfigService] JSON inválido no cache Redis: %s", key)
             await self.redis_client.delete(key)
             return None
 
     async def get_from_supabase(self) -> ConfigInfo:
         try:
-            res = self.supabase.table(self.table) \
-                .select(self.field) \
-                .eq("telefone_cliente", self.telefone_cliente) \
-                .order("id", desc=True) \
-                .limit(1) \
-                .single() \
-                .execute()
-
-            data = res.data or {}
+            res = await self.supabase.select_one(
+                self.table, self.field, {"telefone_cliente": self.telefone_cliente}, order="id.desc")
+
+            data = res or {}
             raw = data.get(self.field)
             if not raw:
-                logger.error(f"[ConfigService] Campo '{self.field}' ausente para telefone {self.telefone_cliente}")
+                logger.error("[ConfigService] Campo '%s' ausente para telefone %s", self.field, self.telefone_cliente)
                 raise RuntimeError(f"Configurações ausentes para {self.telefone_cliente}")
 
             return ConfigInfo.from_dict(raw)
 
         except Exception as e:
-            logger.exception(f"[ConfigService] Erro ao buscar no Supabase: {e}")
+            logger.exception("[ConfigService] Erro ao buscar no Supabase: %s", e)
             raise RuntimeError(f"Erro ao carregar config para {self.telefone_cliente}")
 
     async def set_cache(self, key: str, config: ConfigInfo):
         try:
             payload = config.to_dict()
-            await self.redis_client.set(key, json.dumps(payload), ex=self.cache_ttl)
+            await self.redis_client.set(key, codificar(payload), ex=self.cache_ttl)
         except Exception as e:
-            logger.warning(f"[ConfigService] Falha cachear config para {key}: {e}")
+            logger.warning("[ConfigService] Falha cachear config para %s: %s", key, e)
     
     def __getattr__(self, attr):
         if self.config:
@@ -159,3 +190,9 @@ class ConfigService:
     
     def __repr__(self):
         return f"<ConfigService telefone={self.telefone_cliente}>"
+
+
+async def carregar_todas_configs(supabase_client: Any = supabase) -> List[ConfigInfo]:
+    """Configurações de todos os clientes (usado no aquecimento de recursos na inicialização)."""
+    rows = await supabase_client.select("account_data", "config_info", {})
+    return [ConfigInfo.from_dict(row["config_info"]) for row in rows if row.get("config_info")]
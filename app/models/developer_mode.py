@@ -1,45 +1,45 @@
 from typing import Any
 from app.utils.logger import logger
 from app.config.redis_client import redis_client
-from app.config.supabase_client import supabase
+from app.utils.local_cache import publicar_invalidacao
+from app.utils.write_behind import PersistenciaWriteBehind, persistencia
 
 class DeveloperMode:
-    def __init__(self, telefone_cliente: str, telefone_usuario: str, redis_client: Any = redis_client):
+    def __init__(self, telefone_cliente: str, telefone_usuario: str, redis_client: Any = redis_client, persistencia: PersistenciaWriteBehind = persistencia):
         self.telefone_cliente = telefone_cliente
         self.telefone_usuario = telefone_usuario
         self.redis = redis_client
+        self.persistencia = persistencia
         self.key = f"{telefone_cliente}:{telefone_usuario}"
     
     async def clear_user_redis_record(self) -> int:
         history_key   = f"history:{self.key}"
+        history_log_key = f"history:log:{self.key}"
         user_info_key = f"user_info:{self.key}"
-        deleted_count = await self.redis.delete(history_key, user_info_key)
-        logger.info(f"✔️ Redis delete count={deleted_count} for {history_key}, {user_info_key}")
+        deleted_count = await self.redis.delete(history_key, history_log_key, user_info_key)
+        logger.info("✔️ Redis delete count=%s for %s, %s", deleted_count, history_key, user_info_key)
         return deleted_count
 
-    def clear_user_supabase_record(self) -> int:
-        response = (
-            supabase
-            .table("user_data")
-            .delete()
-            .eq("id_cliente_usuario", self.key)
-            .execute()
-        )
-        deleted_rows = len(response.data or [])
-        logger.info(f"✔️ Supabase delete count={deleted_rows} for id={self.key}")
+    async def clear_user_supabase_record(self) -> int:
+        # Descarta as gravações pendentes deste processo e apaga sob o lock do flush, para o
+        # registro não ser recriado. Pendências no buffer de outro processo ainda podem recriá-lo
+        # (ver PersistenciaWriteBehind).
+        deleted_rows = await self.persistencia.apagar(self.key)
+        logger.info("✔️ Supabase delete count=%s for id=%s", deleted_rows, self.key)
         return deleted_rows
 
     async def clear_client_redis_record(self) -> int:
         config_key = f"config_info:{self.telefone_cliente}"
         funnel_key = f"funnel_info:{self.telefone_cliente}"
         deleted_count = await self.redis.delete(config_key, funnel_key)
-        logger.info(f"✔️ Redis delete count={deleted_count} for {config_key}, {funnel_key}")
+        await publicar_invalidacao(config_key, funnel_key, redis_client=self.redis)
+        logger.info("✔️ Redis delete count=%s for %s, %s", deleted_count, config_key, funnel_key)
         return deleted_count
 
     async def developer_mode(self, cmd: str) -> str:
         if cmd == "/adminresetuser":
             r = await self.clear_user_redis_record()
-            s = self.clear_user_supabase_record()
+            s = await self.clear_user_supabase_record()
             return (
                 f"✅ Usuário resetado:\n"
                 f"- BD Cache: {r} chave(s) removida(s)\n"
@@ -4,7 +4,10 @@ import json
 
 from app.config.redis_client import redis_client
 from app.config.supabase_client import supabase
+from app.utils.local_cache import LocalCache, local_cache
 from app.utils.logger import logger
+from app.utils.codec import codificar, decodificar
+from app.utils.metrics import cronometrado
 
 @dataclass
 class EtapaFunil:
@@ -20,6 +23,8 @@ class FunnelInfo:
     funil: List[EtapaFunil]
     prompt_apresentacao_inicial: str
     prompt_encerramento: str
+    # "por_etapa": uma chamada LLM por etapa | "unica": todas as etapas numa chamada JSON
+    modo_extracao: str = "por_etapa"
 
     @staticmethod
     def from_dict(data: Dict[str, Any]) -> "FunnelInfo":
@@ -29,7 +34,8 @@ class FunnelInfo:
             prompt_base=data.get("prompt_base", ""),
             funil=funil,
             prompt_apresentacao_inicial=data.get("prompt_apresentacao_inicial", ""),
-            prompt_encerramento=data.get("prompt_encerramento", "")
+            prompt_encerramento=data.get("prompt_encerramento", ""),
+            modo_extracao=data.get("modo_extracao", "por_etapa")
         )
     
     def to_tracking_dict(self, preenchidos: Dict[str, Any] = None, estado_atual: Optional[str] = None) -> Dict[str, Any]:
@@ -46,39 +52,46 @@ class FunnelService:
     TABLE = "account_data"
     FIELD = "funnel_info"
                                                                     #43200
-    def __init__(self, telefone_cliente: str, cache_ttl: Optional[int] = 43200, redis_client: Any = redis_client, supabase_client: Any = supabase):
+    def __init__(self, telefone_cliente: str, cache_ttl: Optional[int] = 43200, redis_client: Any = redis_client, supabase_client: Any = supabase, local_cache: LocalCache = local_cache):
         self.telefone = telefone_cliente
+        self.local_cache = local_cache
         self.cache_ttl = cache_ttl
         self.redis_client = redis_client
         self.supabase_client = supabase_client
         self.funnel: Optional[FunnelInfo] = None
+        self.origem = ""
 
+    @cronometrado("carga_funil", origem="origem")
     async def get(self) -> FunnelInfo:
         key = f"{self.FIELD}:{self.telefone}"
+        self.origem = "local"
+        self.funnel = self.local_cache.get(key)
+        if self.funnel:
+            return self.funnel
+
+        self.origem = "redis"
         raw = await self.redis_client.get(key)
         if raw:
             try:
-                self.funnel = FunnelInfo.from_dict(json.loads(raw))
+                self.funnel = FunnelInfo.from_dict(decodificar(raw))
+                self.local_cache.set(key, self.funnel)
                 # Eu tirei os returns dos outros, mas é interessante deixar...
                 return self.funnel
             except json.JSONDecodeError:
                 await self.redis_client.delete(key)
-                logger.warning(f"JSON inválido em cache: {key}")
+                logger.warning("JSON inválido em cache: %s", key)
 
-        res = self.supabase_client.table(self.TABLE)\
-            .select(self.FIELD)\
-            .eq("telefone_cliente", self.telefone)\
-            .order("id", desc=True)\
-            .limit(1)\
-            .single()\
-            .execute()
+        self.origem = "supabase"
+        res = await self.supabase_client.select_one(
+            self.TABLE, self.FIELD, {"telefone_cliente": self.telefone}, order="id.desc")
 
-        data = res.data or {}
+        data = res or {}
         funnel = data.get(self.FIELD)
         if not funnel:
-            logger.error(f"Nenhum funnel encontrado para {self.telefone}")
+            logger.error("Nenhum funnel encontrado para %s", self.telefone)
             raise RuntimeError
         
         self.funnel = FunnelInfo.from_dict(funnel)
-        await self.redis_client.set(key, json.dumps(funnel), ex=self.cache_ttl)
+        await self.redis_client.set(key, codificar(funnel), ex=self.cache_ttl)
+        self.local_cache.set(key, self.funnel)
         return self.funnel
\ No newline at end of file
@@ -1,42 +1,85 @@
-import json
 import asyncio
-from typing import Any, List
+from typing import Any, List, Optional
 from datetime import datetime
 from app.utils.logger import logger
+from app.utils.codec import codificar, decodificar
 from app.config.redis_client import redis_client
 from app.config.supabase_client import supabase
+from app.utils.write_behind import PersistenciaWriteBehind, persistencia
+from app.utils.metrics import cronometrado, metricas
+
+# Primeira gravação depois de carregar do Supabase (ou do blob JSON antigo): a semente só entra se
+# ninguém criou a lista nesse meio-tempo; as mensagens novas entram sempre.
+_LUA_SEMEAR = """
+local inicio = 4
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    inicio = 4 + tonumber(ARGV[3])
+end
+for i = inicio, #ARGV do
+    redis.call('RPUSH', KEYS[1], ARGV[i])
+end
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[1]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('DEL', KEYS[2])
+return redis.call('LRANGE', KEYS[1], 0, -1)
+"""
+
 
 class HistoricoConversas:
+    """
+    Histórico da conversa como lista no Redis (uma mensagem JSON por item, limitada a
+    max_mensagens): salvar só acrescenta as mensagens novas (RPUSH + LTRIM + EXPIRE numa
+    transação), então mensagens simultâneas da mesma conversa não se sobrescrevem.
+    """
     TABLE = "user_data"
     FIELD = "history"
                                                                                                                                                                 #14400
-    def __init__(self, telefone_cliente: str, telefone_usuario: str, redis_client: Any = redis_client, tentativas: int = 3, mensagens: list = [], cache_ttl_seconds: int = 14400):
+    def __init__(self, telefone_cliente: str, telefone_usuario: str, redis_client: Any = redis_client, tentativas: int = 3, mensagens: Optional[list] = None, cache_ttl_seconds: int = 14400, supabase_client: Any = supabase, persistencia: PersistenciaWriteBehind = persistencia, max_mensagens: int = 8):
         self.telefone_cliente = telefone_cliente
         self.telefone_usuario = telefone_usuario
         self.redis = redis_client
+        self.supabase = supabase_client
+        self.persistencia = persistencia
         self.tentativas = tentativas
-        self.mensagens = mensagens
+        self.mensagens = list(mensagens or [])
         self.cache_ttl_seconds = cache_ttl_seconds
+        self.max_mensagens = max_mensagens
+        # Blob JSON do formato antigo; lido só para migrar conversas em andamento
         self.key = f"{self.FIELD}:{telefone_cliente}:{telefone_usuario}"
+        self.key_lista = f"{self.FIELD}:log:{telefone_cliente}:{telefone_usuario}"
         self.primeiro_contato: bool = False
+        self.origem = ""
+        # Mensagens que ainda não estão na lista do Redis
+        self._semente: List[dict] = []
+        self._novas: List[dict] = []
 
         self.mensagens_usuario: List[str] = []
         self._atualizar_mensagens_usuario()
 
+    @cronometrado("carga_historico", origem="origem")
     async def carregar(self):
         for tentativa in range(self.tentativas):
             try:
-                data = await self.redis.get(self.key)
-                if data:
-                    self.mensagens = json.loads(data)
+                # Só a cauda que entra no prompt, item a item
+                itens = await self.redis.lrange(self.key_lista, -self.max_mensagens, -1)
+                if itens:
+                    self.origem = "redis"
+                    self.mensagens = [decodificar(item) for item in itens]
+                elif legado := await self.redis.get(self.key):
+                    self.origem = "redis_legado"
+                    self.mensagens = decodificar(legado)
+                    self._semente = list(self.mensagens)
                 else:
+                    self.origem = "supabase"
                     await self._carregar_de_supabase()
                 break
             except Exception as e:
-                logger.error(f"[{self.key}] Erro Redis GET ({tentativa+1}): {e}")
+                logger.error("[%s] Erro Redis LRANGE (%s): %s", self.key_lista, tentativa+1, e)
+                metricas.retentativas.incrementar(fase="carga_historico")
                 await asyncio.sleep(1)
         else:
-            logger.critical(f"[{self.key}] Falha ao acessar Redis. Histórico mínimo carregado.")
+            logger.critical("[%s] Falha ao acessar Redis. Histórico mínimo carregado.", self.key_lista)
+            self.origem = "falha"
             self.mensagens = [self._mensagem_inicial()]
 
         # atualiza sempre que recarrega
@@ -46,22 +89,20 @@ class HistoricoConversas:
     async def _carregar_de_supabase(self):
         try:
             id_cliente_usuario = f"{self.telefone_cliente}:{self.telefone_usuario}"
-            res = supabase.table(self.TABLE)\
-                .select(self.FIELD)\
-                .eq("id_cliente_usuario", id_cliente_usuario)\
-                .limit(1)\
-                .execute()
+            res = await self.supabase.select_one(
+                self.TABLE, self.FIELD, {"id_cliente_usuario": id_cliente_usuario})
 
-            if res.data and res.data[0].get(self.FIELD):
-                self.mensagens = res.data[0][self.FIELD]
-                logger.info(f"[{self.key}] Histórico carregado via Supabase.")
-                await self.redis.set(self.key, json.dumps(self.mensagens), ex=self.cache_ttl_seconds)
+            if res and res.get(self.FIELD):
+                self.mensagens = res[self.FIELD]
+                logger.info("[%s] Histórico carregado via Supabase.", self.key_lista)
             else:
-                logger.info(f"[{self.key}] Nenhum histórico encontrado no Supabase.")
+                logger.info("[%s] Nenhum histórico encontrado no Supabase.", self.key_lista)
                 self.mensagens = [self._mensagem_inicial()]
         except Exception as e:
-            logger.error(f"[{self.key}] Erro ao consultar Supabase: {e}")
+            logger.error("[%s] Erro ao consultar Supabase: %s", self.key_lista, e)
             self.mensagens = [self._mensagem_inicial()]
+        # Vai para o Redis junto com a primeira mensagem nova
+        self._semente = list(self.mensagens)
         
         # Atualiza Mensagens do Usuário para uso no RAG.
         self._atualizar_mensagens_usuario()
@@ -74,42 +115,59 @@ class HistoricoConversas:
         }
 
     def adicionar_interacao(self, role: str, content: str):
-        self.mensagens.append({
+        mensagem = {
             "role": role,
             "content": content
-        })
+        }
+        self.mensagens.append(mensagem)
+        self._novas.append(mensagem)
+
+    async def _gravar_redis(self, max_mensagens: int) -> List[dict]:
+        """Acrescenta as mensagens novas e devolve a lista resultante (já com as de outros workers)."""
+        if self._semente:
+            itens = await self.redis.register_script(_LUA_SEMEAR)(
+                keys=[self.key_lista, self.key],
+                args=[max_mensagens, self.cache_ttl_seconds, len(self._semente),
+                      *(codificar(m) for m in self._semente + self._novas)])
+        else:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.rpush(self.key_lista, *(codificar(m) for m in self._novas))
+                pipe.ltrim(self.key_lista, -max_mensagens, -1)
+                pipe.expire(self.key_lista, self.cache_ttl_seconds)
+                pipe.lrange(self.key_lista, 0, -1)
+                *_, itens = await pipe.execute()
+        self._semente, self._novas = [], []
+        return [decodificar(item) for item in itens]
 
-    async def salvar(self, max_mensagens: int = 8):
+    async def salvar(self, max_mensagens: Optional[int] = None):
+        max_mensagens = max_mensagens or self.max_mensagens
+        if not self._novas:
+            return
         mensagens_finais = self.mensagens[-max_mensagens:]
 
         # Tenta salvar no Redis
         for tentativa in range(self.tentativas):
             try:
-                await self.redis.set(self.key, json.dumps(mensagens_finais), ex=self.cache_ttl_seconds)
+                mensagens_finais = await self._gravar_redis(max_mensagens)
                 break
             except Exception as e:
-                logger.error(f"[{self.key}] Erro Redis SET ({tentativa+1}): {e}")
+                logger.error("[%s] Erro Redis RPUSH (%s): %s", self.key_lista, tentativa+1, e)
                 await asyncio.sleep(1)
         else:
-            logger.critical(f"[{self.key}] Falha ao salvar histórico no Redis.")
+            logger.critical("[%s] Falha ao salvar histórico no Redis.", self.key_lista)
 
-        # Salva também no Supabase
-        try:
-            id_cliente_usuario = f"{self.telefone_cliente}:{self.telefone_usuario}"
-            # Gerar updated_at no fuso de São Paulo, sem offset
-            updated_at = datetime.now().astimezone().isoformat()
+        # Supabase via write-behind (gravado em lote fora do caminho da resposta)
+        id_cliente_usuario = f"{self.telefone_cliente}:{self.telefone_usuario}"
+        # Gerar updated_at no fuso de São Paulo, sem offset
+        updated_at = datetime.now().astimezone().isoformat()
 
-            supabase.table(self.TABLE).upsert({
-                "id_cliente_usuario": id_cliente_usuario,
-                "telefone_cliente": self.telefone_cliente,
-                "telefone_usuario": self.telefone_usuario,
-                "history": mensagens_finais,
-                "updated_at": updated_at
-            }, 
-            on_conflict=["id_cliente_usuario"]
-            ).execute()
-        except Exception as e:
-            logger.error(f"[{self.key}] Erro ao salvar histórico no Supabase: {e}")
+        self.persistencia.marcar({
+            "id_cliente_usuario": id_cliente_usuario,
+            "telefone_cliente": self.telefone_cliente,
+            "telefone_usuario": self.telefone_usuario,
+            "history": mensagens_finais,
+            "updated_at": updated_at
+        })
 
     def _atualizar_mensagens_usuario(self):
         """
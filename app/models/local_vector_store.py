@@ -0,0 +1,133 @@
+import os
+import re
+import json
+import time
+import threading
+import numpy as np
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.config.config import VECTOR_STORE_DIR
+from app.utils.logger import logger
+
+
+@dataclass
+class NamespaceVetorial:
+    matriz: np.ndarray          # (n, dim) float32, linhas já normalizadas (memmap)
+    ids: List[str]
+    metadados: List[Dict[str, Any]]
+    mtime: float
+
+    def consultar_lote(self, embeddings: np.ndarray, top_k: int) -> List[List[dict]]:
+        """Top-k por similaridade de cosseno para um lote de consultas (q, dim)."""
+        if not len(self.ids):
+            return [[] for _ in range(len(embeddings))]
+
+        normas = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        consultas = embeddings / np.where(normas == 0, 1, normas)
+        scores = consultas @ self.matriz.T
+
+        k = min(top_k, scores.shape[1])
+        resultados = []
+        for linha in scores:
+            topo = np.argpartition(-linha, k - 1)[:k]
+            topo = topo[np.argsort(-linha[topo])]
+            resultados.append([
+                {"id": self.ids[i], "score": float(linha[i]), "metadata": self.metadados[i]}
+                for i in topo
+            ])
+        return resultados
+
+
+class LocalVectorStore:
+    """
+    Backend de busca local: cada namespace vira um arquivo float32 (memmap) + um JSON com ids/metadados,
+    gerados por `python -m app.services.vector_sync`.
+
+    O JSON é o ponteiro da versão: ele nomeia o arquivo da matriz (`<namespace>.<versão>.f32`, nunca
+    sobrescrito) e traz n e dim. Trocar o JSON com um único os.replace troca a versão inteira; o
+    carregar ainda confere n x dim com o tamanho do arquivo antes de mapear.
+    """
+
+    def __init__(self, diretorio: str = VECTOR_STORE_DIR):
+        self.diretorio = diretorio
+        self._namespaces: Dict[str, NamespaceVetorial] = {}
+        self._lock = threading.Lock()
+
+    def _caminho_meta(self, namespace: str) -> str:
+        return os.path.join(self.diretorio, f"{namespace}.json")
+
+    def disponivel(self, namespace: str) -> bool:
+        return os.path.exists(self._caminho_meta(namespace))
+
+    def carregar(self, namespace: str) -> Optional[NamespaceVetorial]:
+        caminho_meta = self._caminho_meta(namespace)
+        if not os.path.exists(caminho_meta):
+            return None
+
+        mtime = os.path.getmtime(caminho_meta)
+        atual = self._namespaces.get(namespace)
+        if atual and atual.mtime == mtime:
+            return atual
+
+        with self._lock:
+            with open(caminho_meta, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            n, dim = meta.get("n", len(meta["ids"])), meta["dim"]
+            # Formato anterior (sem "matriz" no JSON): arquivo fixo <namespace>.f32
+            caminho_matriz = os.path.join(self.diretorio, meta.get("matriz", f"{namespace}.f32"))
+            if n != len(meta["ids"]) or (n and os.path.getsize(caminho_matriz) != n * dim * 4):
+                if atual is not None:
+                    logger.error("[LocalVectorStore] %s inconsistente com %s; mantendo a versão carregada", caminho_meta, caminho_matriz)
+                    return atual
+                raise ValueError(f"Namespace vetorial local inconsistente: {namespace} ({caminho_matriz})")
+            matriz = (np.memmap(caminho_matriz, dtype=np.float32, mode="r", shape=(n, dim))
+                      if n else np.zeros((0, dim), dtype=np.float32))
+            atual = NamespaceVetorial(matriz=matriz, ids=meta["ids"], metadados=meta["metadados"], mtime=mtime)
+            self._namespaces[namespace] = atual
+            logger.info("[LocalVectorStore] Namespace %s carregado: %s vetores, dim %s", namespace, n, dim)
+            return atual
+
+    def query(self, namespace: str, embedding: Sequence[float], top_k: int) -> List[dict]:
+        ns = self.carregar(namespace)
+        if ns is None:
+            raise FileNotFoundError(f"Namespace vetorial local ausente: {namespace}")
+        return ns.consultar_lote(np.asarray([embedding], dtype=np.float32), top_k)[0]
+
+    def salvar(self, namespace: str, ids: List[str], vetores: np.ndarray, metadados: List[dict]) -> None:
+        """
+        Grava a matriz num arquivo novo e só então troca o JSON (os.replace), que passa a apontar
+        para ela: quem carrega no meio vê a versão anterior inteira ou a nova inteira.
+        """
+        os.makedirs(self.diretorio, exist_ok=True)
+        caminho_meta = self._caminho_meta(namespace)
+        nome_matriz = f"{namespace}.{time.time_ns()}.f32"
+        caminho_matriz = os.path.join(self.diretorio, nome_matriz)
+        anterior = None
+        if os.path.exists(caminho_meta):
+            with open(caminho_meta, "r", encoding="utf-8") as f:
+                anterior = json.load(f).get("matriz", f"{namespace}.f32")
+
+        vetores = np.asarray(vetores, dtype=np.float32).reshape(len(ids), -1) if ids else np.zeros((0, 0), dtype=np.float32)
+        normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+        vetores = vetores / np.where(normas == 0, 1, normas)
+
+        vetores.tofile(f"{caminho_matriz}.tmp")
+        os.replace(f"{caminho_matriz}.tmp", caminho_matriz)
+        with open(f"{caminho_meta}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"matriz": nome_matriz, "n": len(ids), "dim": int(vetores.shape[1]),
+                       "ids": ids, "metadados": metadados}, f, ensure_ascii=False)
+        os.replace(f"{caminho_meta}.tmp", caminho_meta)
+
+        # Mantém a versão anterior (quem leu o JSON antigo ainda pode abri-la) e apaga as mais velhas;
+        # quem já as mapeou segue lendo, o unlink não invalida o memmap
+        versao = re.compile(rf"{re.escape(namespace)}(\.\d+)?\.f32")
+        for arquivo in os.listdir(self.diretorio):
+            if versao.fullmatch(arquivo) and arquivo not in (nome_matriz, anterior):
+                try:
+                    os.remove(os.path.join(self.diretorio, arquivo))
+                except OSError as e:
+                    logger.warning("[LocalVectorStore] Não foi possível remover %s: %s", arquivo, e)
+
+
+local_vector_store = LocalVectorStore()
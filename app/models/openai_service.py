@@ -1,21 +1,23 @@
-import openai
-import json
-import textwrap
 from typing import List, Dict, Union, Optional, Any
-from app.utils.logger import logger
+from app.utils.logger import logger, log_payload
+from app.services.llm_gateway import GatewayLLM, gateway_llm, FalhaLLM, StreamInterrompido
 from dataclasses import dataclass
+from app.config.config import PROMPT_HISTORICO_MAX_TOKENS, PROMPT_CHUNKS_MAX_TOKENS
+from app.models.prompt_context import ContextoHistorico, formatar_historico, dedent_prompt, aparar_chunks
 
 @dataclass
 class ChatInput:
     mensagem: str
     best_chunks: List[str]
-    historico: Union[str, List[Dict]]
+    historico: Union[str, List[Dict], ContextoHistorico]
     prompt_base: str
     prompt_state: str
     user_data: Any
     apresentacao_inicial: Optional[str] = None
 
 class ChatResponder:
+    RESPOSTA_ERRO = "Desculpe, ocorreu um erro ao processar sua pergunta."
+
     def __init__(
         self,
         chat_input: ChatInput,
@@ -24,7 +26,10 @@ class ChatResponder:
         tentativas: int = 3,
         temperature: float = 0.4,
         top_p: float = 0.9,
-        max_tokens: int = 230
+        max_tokens: int = 230,
+        max_tokens_historico: Optional[int] = PROMPT_HISTORICO_MAX_TOKENS,
+        max_tokens_chunks: Optional[int] = PROMPT_CHUNKS_MAX_TOKENS,
+        gateway: GatewayLLM = gateway_llm
     ):
         self.input = chat_input
         self.modelo = modelo
@@ -33,28 +38,15 @@ class ChatResponder:
         self.temperature = temperature
         self.top_p = top_p
         self.max_tokens = max_tokens
+        self.max_tokens_historico = max_tokens_historico
+        self.max_tokens_chunks = max_tokens_chunks
+        self.gateway = gateway
         self.resposta: str = ""
+        # True só quando o modelo terminou a resposta (sem falha total nem stream interrompido)
+        self.completa = False
 
     def formatar_historico(self) -> str:
-        historico = self.input.historico
-        if isinstance(historico, str):
-            try:
-                historico = json.loads(historico)
-            except json.JSONDecodeError:
-                return "(Histórico inválido ou não disponível.)"
-        if not historico:
-            return "(Sem histórico de conversa até o momento.)"
-
-        role_map = {
-            "system": "🧠 Sistema",
-            "assistant": "🤖 Assistente",
-            "user": "🧍 Paciente"
-        }
-
-        return "\n".join(
-            f"{role_map.get(m.get('role'), m.get('role'))}: {m.get('content', '').strip()}"
-            for m in historico
-        )
+        return formatar_historico(self.input.historico, self.max_tokens_historico)
 
     def formatar_userinfo(self) -> str:
         estado = getattr(self.input.user_data, "state", "")
@@ -74,16 +66,16 @@ class ChatResponder:
     def build_system_content(self) -> str:
         return "\n".join([
             "[INSTRUÇÕES DA DIANA]",
-            textwrap.dedent(self.input.prompt_base or "").strip(),
+            dedent_prompt(self.input.prompt_base),
             "",
             "[ESTADO DO FUNIL]",
             # descompacta este trecho só se houver apresentacao_inicial
             *(
-                [textwrap.dedent(self.input.apresentacao_inicial).strip(), ""]
+                [dedent_prompt(self.input.apresentacao_inicial), ""]
                 if self.input.apresentacao_inicial
                 else []
             ),
-            textwrap.dedent(self.input.prompt_state or "").strip(),
+            dedent_prompt(self.input.prompt_state),
             "",
             "[HISTÓRICO DE CONVERSA]",
             self.formatar_historico(),
@@ -92,7 +84,7 @@ class ChatResponder:
             self.formatar_userinfo(),
             "",
             "[CONTEXTO DA CLÍNICA]",
-            "\n".join(self.input.best_chunks) or "Sem informações adicionais da clínica."
+            "\n".join(aparar_chunks(self.input.best_chunks, self.max_tokens_chunks)) or "Sem informações adicionais da clínica."
         ]).strip()
 
     def build_messages(self, system_content: str) -> List[Dict]:
@@ -101,34 +93,58 @@ class ChatResponder:
             {"role": "user", "content": self.input.mensagem.strip()}
         ]
 
+    def _parametros(self) -> dict:
+        return {"temperature": self.temperature, "top_p": self.top_p, "max_tokens": self.max_tokens}
+
     async def generate(self) -> str:
         system_msg = self.build_system_content()
         messages = self.build_messages(system_msg)
-        logger.info("=== CONTEXTO ENVIADO AO GPT ===")
-        logger.info(system_msg.replace("\n", "\\n"))  # Log mais legível
-
-        for i in range(self.tentativas):
-            model = self.modelo if i < self.tentativas - 1 else self.modelo_fallback
-            try:
-                response = await openai.ChatCompletion.acreate(
-                    model=model,
-                    messages=messages,
-                    temperature=self.temperature,
-                    top_p=self.top_p,
-                    max_tokens=self.max_tokens
-                )
-                self.resposta = response.choices[0].message.content.strip()
-                return self.resposta
-            except Exception as e:
-                logger.error(f"[ChatResponder] erro (tentativa {i+1}, modelo {model}): {e}")
-
-        logger.critical("[ChatResponder] falha total ao gerar resposta.")
-        self.resposta = "Desculpe, ocorreu um erro ao processar sua pergunta."
+        log_payload("=== CONTEXTO ENVIADO AO GPT ===", system_msg)
+
+        self.completa = False
+        try:
+            self.resposta = await self.gateway.completar(
+                "chat_completion", messages, self.modelo, self.modelo_fallback, self.tentativas, **self._parametros())
+            self.completa = True
+        except FalhaLLM:
+            logger.critical("[ChatResponder] falha total ao gerar resposta.")
+            self.resposta = self.RESPOSTA_ERRO
+        return self.resposta
+
+    async def generate_stream(self, dispatcher: Any) -> str:
+        """
+        Igual ao generate, mas consome a resposta como stream e repassa cada delta ao dispatcher
+        (MensagemDispatcher.alimentar), que enfileira as frases conforme ficam completas.
+        """
+        system_msg = self.build_system_content()
+        messages = self.build_messages(system_msg)
+        log_payload("=== CONTEXTO ENVIADO AO GPT ===", system_msg)
+
+        def pode_repetir() -> bool:
+            # Parte da resposta já foi entregue ao paciente: recomeçar duplicaria mensagens.
+            dispatcher.descartar_pendente()
+            return not dispatcher.enviados
+
+        self.completa = False
+        try:
+            self.resposta = await self.gateway.completar(
+                "chat_completion", messages, self.modelo, self.modelo_fallback, self.tentativas,
+                ao_delta=dispatcher.alimentar, pode_repetir=pode_repetir, **self._parametros())
+            self.completa = True
+        except StreamInterrompido as e:
+            logger.critical("[ChatResponder] stream interrompido após envio parcial.")
+            self.resposta = e.parcial.strip()
+            return self.resposta
+        except FalhaLLM:
+            logger.critical("[ChatResponder] falha total ao gerar resposta.")
+            self.resposta = self.RESPOSTA_ERRO
+            await dispatcher.alimentar(self.resposta)
+        await dispatcher.finalizar()
         return self.resposta
 
 # Classe responsável por fazer o envio pro chat gpt;
 class FallbackLLM:
-    def __init__(self,  mensagem: str = "", prompt_fallback_llm: str = "", historico: str = "", modelo="gpt-4o-mini", modelo_fallback="gpt-3.5-turbo", tentativas: int = 3, temperature: float = 0, top_p: float = 0.9, max_tokens: int = 10):
+    def __init__(self,  mensagem: str = "", prompt_fallback_llm: str = "", historico: Union[str, List[Dict], ContextoHistorico] = "", modelo="gpt-4o-mini", modelo_fallback="gpt-3.5-turbo", tentativas: int = 3, temperature: float = 0, top_p: float = 0.9, max_tokens: int = 10, response_format: Optional[dict] = None, max_tokens_historico: Optional[int] = PROMPT_HISTORICO_MAX_TOKENS, gateway: GatewayLLM = gateway_llm):
         self.mensagem = mensagem
         self.prompt_fallback_llm = prompt_fallback_llm
         self.historico = historico
@@ -138,7 +154,11 @@ class FallbackLLM:
         self.temperature = temperature
         self.top_p = top_p
         self.max_tokens = max_tokens
+        self.response_format = response_format
+        self.max_tokens_historico = max_tokens_historico
+        self.gateway = gateway
         self.resposta: Any = None
+        self.falhou = False
 
     async def generate_fallback_llm(self) -> str:
         system_msg = self.build_system_content_fallback_llm()
@@ -146,29 +166,27 @@ class FallbackLLM:
         #logger.info("=== CONTEXTO FALLBACK LLM ENVIADO AO GPT ===")
         #logger.info(system_msg.replace("\n", "\\n"))
 
-        for i in range(self.tentativas):
-            model = self.modelo if i < self.tentativas - 1 else self.modelo_fallback
-            try:
-                response = await openai.ChatCompletion.acreate(
-                    model=model,
-                    messages=messages,
-                    temperature=self.temperature,
-                    top_p=self.top_p,
-                    max_tokens=self.max_tokens
-                )
-                resposta_llm = response.choices[0].message.content.strip()
-                if resposta_llm not in {"nao_identificado", "não_identificado"}:
-                    self.resposta = resposta_llm   
-                else:
-                    self.resposta = None
-                return self.resposta
-            except Exception as e:
-                logger.error(f"[ChatResponder] erro (tentativa {i+1}, modelo {model}): {e}")
-    
+        try:
+            resposta_llm = await self.gateway.completar(
+                "fallback_llm", messages, self.modelo, self.modelo_fallback, self.tentativas,
+                temperature=self.temperature, top_p=self.top_p, max_tokens=self.max_tokens,
+                **({"response_format": self.response_format} if self.response_format else {}))
+        except FalhaLLM as e:
+            logger.critical("[FallbackLLM] falha total, seguindo sem resposta do LLM: %s", e)
+            self.falhou = True
+            self.resposta = None
+            return self.resposta
+
+        if resposta_llm not in {"nao_identificado", "não_identificado"}:
+            self.resposta = resposta_llm
+        else:
+            self.resposta = None
+        return self.resposta
+
     def build_system_content_fallback_llm(self) -> str:
         return "\n".join([
             "[INSTRUÇÕES DA DIANA]",
-            textwrap.dedent(self.prompt_fallback_llm or "").strip(),
+            dedent_prompt(self.prompt_fallback_llm),
             "[HISTÓRICO DE CONVERSA]",
             self.formatar_historico()
         ]).strip()
@@ -180,22 +198,4 @@ class FallbackLLM:
         ]
     
     def formatar_historico(self) -> str:
-        historico = self.historico
-        if isinstance(historico, str):
-            try:
-                historico = json.loads(historico)
-            except json.JSONDecodeError:
-                return "(Histórico inválido ou não disponível.)"
-        if not historico:
-            return "(Sem histórico de conversa até o momento.)"
-
-        role_map = {
-            "system": "🧠 Sistema",
-            "assistant": "🤖 Assistente",
-            "user": "🧍 Paciente"
-        }
-
-        return "\n".join(
-            f"{role_map.get(m.get('role'), m.get('role'))}: {m.get('content', '').strip()}"
-            for m in historico
-        )
\ No newline at end of file
+        return formatar_historico(self.historico, self.max_tokens_historico)
\ No newline at end of file
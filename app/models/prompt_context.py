@@ -0,0 +1,84 @@
+import json
+import textwrap
+from functools import lru_cache
+from typing import Dict, List, Optional, Union
+
+from app.config.config import PROMPT_CHUNKS_MAX_TOKENS
+from app.utils.tokens import contar_tokens
+
+ROLE_MAP = {
+    "system": "🧠 Sistema",
+    "assistant": "🤖 Assistente",
+    "user": "🧍 Paciente"
+}
+SEM_HISTORICO = "(Sem histórico de conversa até o momento.)"
+HISTORICO_INVALIDO = "(Histórico inválido ou não disponível.)"
+
+
+@lru_cache(maxsize=256)
+def dedent_prompt(texto: Optional[str]) -> str:
+    # Chave = conteúdo do prompt: uma nova versão do funil gera uma nova entrada.
+    return textwrap.dedent(texto or "").strip()
+
+
+class ContextoHistorico:
+    """
+    Histórico formatado uma única vez por mensagem e compartilhado entre ChatResponder,
+    FallbackLLM e as chamadas de etapa do UserInfoUpdater, com corte por orçamento de tokens.
+    """
+
+    def __init__(self, mensagens: List[Dict]):
+        self.linhas = [
+            f"{ROLE_MAP.get(m.get('role'), m.get('role'))}: {m.get('content', '').strip()}"
+            for m in mensagens
+        ]
+        self._tokens: Optional[List[int]] = None
+        self._textos: Dict[Optional[int], str] = {}
+
+    def texto(self, max_tokens: Optional[int] = None) -> str:
+        if max_tokens in self._textos:
+            return self._textos[max_tokens]
+        if not self.linhas:
+            return SEM_HISTORICO
+
+        linhas = self.linhas
+        if max_tokens is not None:
+            if self._tokens is None:
+                self._tokens = [contar_tokens(linha) + 1 for linha in self.linhas]
+            # Mantém as mensagens mais recentes que cabem no orçamento (ao menos a última)
+            total, inicio = 0, len(self.linhas)
+            while inicio > 0 and (total + self._tokens[inicio - 1] <= max_tokens or inicio == len(self.linhas)):
+                inicio -= 1
+                total += self._tokens[inicio]
+            linhas = self.linhas[inicio:]
+
+        self._textos[max_tokens] = "\n".join(linhas)
+        return self._textos[max_tokens]
+
+
+def formatar_historico(historico: Union[str, List[Dict], ContextoHistorico, None], max_tokens: Optional[int] = None) -> str:
+    if isinstance(historico, ContextoHistorico):
+        return historico.texto(max_tokens)
+    if isinstance(historico, str):
+        try:
+            historico = json.loads(historico)
+        except json.JSONDecodeError:
+            return HISTORICO_INVALIDO
+    if not historico:
+        return SEM_HISTORICO
+    return ContextoHistorico(historico).texto(max_tokens)
+
+
+def aparar_chunks(chunks: List[str], max_tokens: Optional[int] = PROMPT_CHUNKS_MAX_TOKENS) -> List[str]:
+    """Mantém os chunks (já ordenados por score) que cabem no orçamento, preservando sempre o melhor."""
+    if max_tokens is None:
+        return list(chunks)
+    selecionados, total = [], 0
+    for chunk in chunks:
+        tokens = contar_tokens(chunk) + 1
+        if selecionados and total + tokens > max_tokens:
+            break
+        selecionados.append(chunk)
+        total += tokens
+    return selecionados
+
@@ -1,10 +1,8 @@
 from pydantic import BaseModel
-import requests
-import openai
-import asyncio
 from typing import Optional
-from app.config.redis_client import redis_client
-from app.utils.logger import logger
+from app.utils.metrics import cronometrado, metricas
+from app.utils.message_aggregator import RedisDebouncer, debouncer
+from app.services.transcricao_service import TranscricaoService, transcricao_service
 
 class WebhookMessage(BaseModel):
     connectedPhone: str
@@ -13,6 +11,8 @@ class WebhookMessage(BaseModel):
     phone: str
     fromMe: bool
     momment: int
+    # Id da mensagem na Z-API (o mesmo em todas as reentregas do webhook)
+    messageId: Optional[str] = None
     senderName: Optional[str] = None
     text: Optional[dict] = None
     audio: Optional[dict] = None
@@ -29,14 +29,16 @@ class WebhookMessage(BaseModel):
             return self.audio.get("audioUrl")
         return None
 
-debounce_tasks = {}
-debounce_futures = {}
 class WebhookProcessor:
-    def __init__(self, webhook: WebhookMessage, debounce_timeout: int):
+    def __init__(self, webhook: WebhookMessage, debounce_timeout: int, debouncer: RedisDebouncer = debouncer, transcricao: TranscricaoService = transcricao_service):
         self.webhook = webhook
+        self.transcricao = transcricao
         self.debounce_timeout = debounce_timeout
         self.debounce_timeout_assistant: int = 3
+        self.debouncer = debouncer
         self.mensagem_consolidada = ""
+        # True quando outro fragmento (em qualquer worker) assumiu o debounce desta conversa.
+        self.descartada: bool = False
 
     async def processar(self) -> WebhookMessage:
         mensagem = await self.extrair_mensagem()
@@ -47,8 +49,10 @@ class WebhookProcessor:
 
         if not self.webhook.fromMe and self.debounce_timeout > 0:
             mensagem = await self.debounce_and_collect_user(mensagem)
+            self.descartada = mensagem is None
         elif self.webhook.fromMe:
             mensagem = await self.debounce_and_collect_assistant(mensagem)
+            self.descartada = mensagem is None
 
         self.mensagem_consolidada = mensagem
 
@@ -57,81 +61,16 @@ class WebhookProcessor:
             return mensagem.strip()
 
         if audio := self.webhook.url_audio:
-            try:
-                r = requests.get(audio)
-                with open("/tmp/audio.ogg", "wb") as f:
-                    f.write(r.content)
-
-                with open("/tmp/audio.ogg", "rb") as audio_file:
-                    transcription = openai.Audio.transcribe("whisper-1", audio_file)
-                return transcription.get("text", "").strip()
-            except Exception as e:
-                logger.exception(f"[ERRO AO TRANSCREVER ÁUDIO] {e}")
-                return None
+            with metricas.medir("transcricao"):
+                return await self.transcricao.transcrever(audio)
         return None
 
-    async def debounce_and_collect_user(self, mensagem: str) -> str:
-        redis_key = f"debounce:{self.webhook.phone}:{self.webhook.connectedPhone}"
-        task_key = f"{self.webhook.phone}:{self.webhook.connectedPhone}"
-
-        if mensagem:
-            await redis_client.rpush(redis_key, mensagem)
-
-        # Cancela tarefas anteriores
-        if task_key in debounce_tasks:
-            debounce_tasks[task_key].cancel()
-            debounce_tasks.pop(task_key, None)
-
-        if task_key in debounce_futures:
-            debounce_futures.pop(task_key, None)
-
-        future = asyncio.get_event_loop().create_future()
-        debounce_futures[task_key] = future
-
-        debounce_tasks[task_key] = asyncio.create_task(
-            self.espera_e_retorna(redis_key, task_key, future, self.debounce_timeout)
-        )
-
-        return await future
-    
-    async def debounce_and_collect_assistant(self, mensagem: str) -> str:
-        redis_key = f"debounce:{self.webhook.connectedPhone}:{self.webhook.phone}"
-        task_key = f"{self.webhook.connectedPhone}:{self.webhook.phone}"
-
-        if mensagem:
-            await redis_client.rpush(redis_key, mensagem)
-
-        # Cancela tarefas anteriores
-        if task_key in debounce_tasks:
-            debounce_tasks[task_key].cancel()
-            debounce_tasks.pop(task_key, None)
-
-        if task_key in debounce_futures:
-            debounce_futures.pop(task_key, None)
-
-        future = asyncio.get_event_loop().create_future()
-        debounce_futures[task_key] = future
-
-        debounce_tasks[task_key] = asyncio.create_task(
-            self.espera_e_retorna(redis_key, task_key, future, self.debounce_timeout_assistant)
-        )
-
-        return await future
-
-    async def espera_e_retorna(self, redis_key: str, task_key: str, future: asyncio.Future, debounce: int):
-        try:
-            await asyncio.sleep(debounce)
-            mensagens = await redis_client.lrange(redis_key, 0, -1)
-            await redis_client.delete(redis_key)
-
-            resultado = ", ".join(m.decode() if isinstance(m, bytes) else m for m in mensagens)
-
-            if not future.done():
-                future.set_result(resultado)
-            
-            debounce_tasks.pop(task_key, None)
-            debounce_futures.pop(task_key, None)
+    @cronometrado("debounce")
+    async def debounce_and_collect_user(self, mensagem: str) -> Optional[str]:
+        chave = f"{self.webhook.phone}:{self.webhook.connectedPhone}"
+        return await self.debouncer.coletar(chave, mensagem, self.debounce_timeout, self.webhook.messageId)
 
-            #logger.info(f"[✅ Consolidado debounce] {resultado}")
-        except asyncio.CancelledError:
-            logger.info(f"[⛔️ Debounce cancelado] {task_key}")
\ No newline at end of file
+    @cronometrado("debounce")
+    async def debounce_and_collect_assistant(self, mensagem: str) -> Optional[str]:
+        chave = f"{self.webhook.connectedPhone}:{self.webhook.phone}"
+        return await self.debouncer.coletar(chave, mensagem, self.debounce_timeout_assistant, self.webhook.messageId)
@@ -1,25 +1,33 @@
-import openai, pinecone
+import openai
 import asyncio
-from typing import List
+from typing import List, Optional
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-from app.utils.logger import logger
-from app.config.config import API_KEY_PINECONE
-
-pinecone_client = pinecone.Pinecone(api_key=API_KEY_PINECONE)
+from app.utils.logger import logger, log_payload
+from app.utils.metrics import metricas
+from app.config.pinecone_client import PineconeIndexRegistry, pinecone_indices
+from app.utils.embedding_cache import EmbeddingCache, embedding_cache
+from app.models.local_vector_store import LocalVectorStore, local_vector_store
 
 class BuscadorChunks:
-    def __init__(self, index, namespace, pinecone_client: pinecone.Pinecone = pinecone_client, model="text-embedding-ada-002", top_k=3, min_score: float = 0.75, history_window: int = 4):
-        self.client = pinecone_client
-        self.index = self.client.Index(index)
+    def __init__(self, index, namespace, pinecone_indices: PineconeIndexRegistry = pinecone_indices, model="text-embedding-ada-002", top_k=3, min_score: float = 0.75, history_window: int = 4, embedding_cache: EmbeddingCache = embedding_cache, backend: str = "pinecone", local_store: LocalVectorStore = local_vector_store):
+        self.indices = pinecone_indices
+        self.index_name = index
+        self.backend = backend
+        self.local_store = local_store
+        self.index = self.indices.get(index) if backend != "local" else None
         self.namespace = namespace
         self.model = model
         self.top_k = top_k
         self.min_score = min_score
         self.history_window = history_window
+        self.embedding_cache = embedding_cache
         self.best_chunks: List[str] = []
+        # Embedding da última busca, reaproveitado pelo cache semântico de respostas
+        self.embedding: Optional[List[float]] = None
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=5))
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=5),
+           before_sleep=lambda _: metricas.retentativas.incrementar(fase="embedding"))
     def _embed(self, query: str):
         return openai.Embedding.create(
             input=query,
@@ -27,6 +35,15 @@ class BuscadorChunks:
             timeout=10
         )["data"][0]["embedding"]
 
+    async def _embed_cached(self, query: str):
+        with metricas.medir("embedding", origem="cache") as medicao:
+            emb = await self.embedding_cache.get(self.model, query)
+            if emb is None:
+                medicao.origem = "openai"
+                emb = await asyncio.to_thread(self._embed, query)
+                await self.embedding_cache.set(self.model, query, emb)
+        return emb
+
     def _query(self, embedding):
         resp = self.index.query(
             vector=embedding,
@@ -36,6 +53,16 @@ class BuscadorChunks:
         )
         return resp.get("matches", [])
 
+    async def _consultar(self, embedding):
+        with metricas.medir("busca_vetorial", origem="pinecone") as medicao:
+            if self.backend == "local":
+                if self.local_store.disponivel(self.namespace):
+                    medicao.origem = "local"
+                    return self.local_store.query(self.namespace, embedding, self.top_k)
+                logger.warning("Namespace local ausente (%s), usando Pinecone", self.namespace)
+                self.index = self.indices.get(self.index_name)
+            return await self.indices.executar(self._query, embedding)
+
     def formatar_chunks(self, matches) -> List[str]:
         output = []
         for m in sorted(matches, key=lambda x: x["score"], reverse=True):
@@ -74,10 +101,11 @@ class BuscadorChunks:
             full_query = query
 
         # 2) gerar embedding desse full_query
-        emb = await asyncio.to_thread(self._embed, full_query)
+        emb = await self._embed_cached(full_query)
+        self.embedding = emb
 
-        # 3) buscar no Pinecone como antes
-        matches = await asyncio.to_thread(self._query, emb)
+        # 3) buscar no backend vetorial (Pinecone ou local)
+        matches = await self._consultar(emb)
         # 4) Aplica threshold
         matches = [m for m in matches if m["score"] >= self.min_score]
 
@@ -90,5 +118,5 @@ class BuscadorChunks:
         
         #logger.info(f"Match CRU: {matches}")
         self.best_chunks = self.formatar_chunks(matches)
-        logger.info(f"BestChunks: {self.best_chunks}")
+        log_payload("BestChunks:", self.best_chunks)
         return self.best_chunks
@@ -0,0 +1,120 @@
+import time
+import hashlib
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Set
+
+from app.config.config import SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_MAX_POR_NAMESPACE
+from app.utils.local_cache import INVALIDAR_TUDO, ouvintes_invalidacao
+from app.utils.logger import logger
+
+# Prefixo publicado quando a base de conhecimento de um namespace muda (ex.: vector_sync)
+PREFIXO_CONHECIMENTO = "knowledge:"
+
+
+@dataclass
+class RespostaCacheada:
+    vetor: np.ndarray     # embedding normalizado (float32)
+    assinatura: str       # estado do funil + prompt da etapa
+    resposta: str
+    expira_em: float
+    ultimo_uso: float
+
+
+class CacheSemantico:
+    """
+    Cache de respostas por pinecone_namespace: reaproveita o embedding da busca (BuscadorChunks) e
+    devolve uma resposta anterior quando a similaridade de cosseno passa do limiar, dentro da mesma
+    assinatura (estado do funil + prompt). Local ao processo; invalidado pelo canal de invalidação.
+    """
+
+    def __init__(self, ttl: float = SEMANTIC_CACHE_TTL, max_por_namespace: int = SEMANTIC_CACHE_MAX_POR_NAMESPACE):
+        self.ttl = ttl
+        self.max_por_namespace = max_por_namespace
+        self._entradas: Dict[str, List[RespostaCacheada]] = {}
+        self._namespaces_por_cliente: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def assinatura(estado: Optional[str], *prompts: Optional[str]) -> str:
+        h = hashlib.sha1((estado or "").encode("utf-8"))
+        for prompt in prompts:
+            h.update(b"\0" + (prompt or "").encode("utf-8"))
+        return h.hexdigest()
+
+    @staticmethod
+    def _normalizar(embedding: Sequence[float]) -> np.ndarray:
+        vetor = np.asarray(embedding, dtype=np.float32)
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma else vetor
+
+    def buscar(self, namespace: str, assinatura: str, embedding: Optional[Sequence[float]], limiar: float) -> Optional[str]:
+        if embedding is None:
+            return None
+        agora = time.monotonic()
+        entradas = [e for e in self._entradas.get(namespace, []) if e.expira_em > agora]
+        self._entradas[namespace] = entradas
+
+        candidatas = [e for e in entradas if e.assinatura == assinatura]
+        if not candidatas:
+            self.misses += 1
+            return None
+
+        scores = np.stack([e.vetor for e in candidatas]) @ self._normalizar(embedding)
+        melhor = int(np.argmax(scores))
+        if scores[melhor] < limiar:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        candidatas[melhor].ultimo_uso = agora
+        logger.info("[CacheSemantico] Hit em %s (score %.3f)", namespace, scores[melhor])
+        return candidatas[melhor].resposta
+
+    def guardar(self, telefone_cliente: str, namespace: str, assinatura: str,
+                embedding: Optional[Sequence[float]], resposta: str, dados_usuario: Optional[dict] = None) -> bool:
+        if embedding is None or not resposta:
+            return False
+        # Só respostas "sem estado": nada dos dados do paciente pode aparecer no texto
+        resposta_lower = resposta.lower()
+        for valor in (dados_usuario or {}).values():
+            if isinstance(valor, str) and len(valor) >= 3 and valor.lower() in resposta_lower:
+                return False
+
+        agora = time.monotonic()
+        entradas = self._entradas.setdefault(namespace, [])
+        entradas.append(RespostaCacheada(
+            vetor=self._normalizar(embedding), assinatura=assinatura, resposta=resposta,
+            expira_em=agora + self.ttl, ultimo_uso=agora
+        ))
+        if len(entradas) > self.max_por_namespace:
+            entradas.sort(key=lambda e: e.ultimo_uso)
+            del entradas[:len(entradas) - self.max_por_namespace]
+
+        self._namespaces_por_cliente.setdefault(telefone_cliente, set()).add(namespace)
+        return True
+
+    def invalidar(self, key: str) -> None:
+        if key == INVALIDAR_TUDO:
+            self._entradas.clear()
+            self._namespaces_por_cliente.clear()
+        elif key.startswith(PREFIXO_CONHECIMENTO):
+            self._entradas.pop(key[len(PREFIXO_CONHECIMENTO):], None)
+        elif key.startswith(("config_info:", "funnel_info:")):
+            telefone_cliente = key.split(":", 1)[1]
+            for namespace in self._namespaces_por_cliente.pop(telefone_cliente, set()):
+                self._entradas.pop(namespace, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "entradas": sum(len(v) for v in self._entradas.values()),
+        }
+
+
+cache_semantico = CacheSemantico()
+ouvintes_invalidacao.append(cache_semantico.invalidar)
@@ -1,84 +1,117 @@
 import re
-import httpx
-import asyncio
-from typing import List
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
 
-from app.config.config import ZAPI_PHONE_HEADER
-from app.utils.logger import logger
+from app.services.fila_envio import FilaEnvio, fila_envio
+
+
+@lru_cache(maxsize=64)
+def _compilar_segmentador(abreviacoes: Tuple[str, ...]) -> "re.Pattern":
+    # Uma única alternação, varrida da esquerda para a direita:
+    # abreviação e enumeração ("1. ") apenas consomem o ponto; "corte" separa as frases.
+    # Abreviações mais longas primeiro, para "p.ex" vencer "p.e".
+    abbrs = "|".join(re.escape(a) for a in sorted(abreviacoes, key=len, reverse=True))
+    partes = [r"(?P<enum>\b\d+\.(?=\s))", r"(?P<corte>\.\s+)"]
+    if abbrs:
+        partes.insert(0, rf"(?P<abbr>\b(?:{abbrs})\.)")
+    return re.compile("|".join(partes))
 
 
 class RespostaSegmentada:
-    ABBREVIATIONS = [r'Sr', r'Sra', r'Dr', r'Dra', r'Av', r'Ed', r'Prof', r'Profa', r'Profª', r'Ex', r'Exa', r'Adm', r'Assoc', r'etc', r'p\.e', r'p\.ex']
-    PLACEHOLDER = '<DOT>'
-    # Regex para detectar enumerações numéricas (topicos) como '1. ', '2. ' etc.
-    ENUM_PATTERN = re.compile(r'(?m)(?P<number>\b\d+)\.(?=\s)')
+    ABBREVIATIONS = ('Sr', 'Sra', 'Dr', 'Dra', 'Av', 'Ed', 'Prof', 'Profa', 'Profª', 'Ex', 'Exa', 'Adm', 'Assoc', 'etc', 'p.e', 'p.ex')
 
-    def __init__(self, resposta_ia: str):
+    def __init__(self, resposta_ia: str, abreviacoes: Optional[Iterable[str]] = None):
         self.resposta_ia = resposta_ia
+        self.padrao = _compilar_segmentador(tuple(abreviacoes) if abreviacoes is not None else self.ABBREVIATIONS)
         self.resposta_segmentada = self._segmentar()
 
     def _segmentar(self) -> List[str]:
         texto = self.resposta_ia
-        #logger.info(f"Texto que vai ser segmentado: {texto}")
-        for abbr in self.ABBREVIATIONS:
-            texto = re.sub(rf"\b{abbr}\.", f"{abbr}{self.PLACEHOLDER}", texto)
-        texto = self.ENUM_PATTERN.sub(lambda m: f"{m.group('number')}{self.PLACEHOLDER}", texto)
-        partes = re.split(r'\.\s+', texto)
         frases = []
-        for parte in partes:
-            seg = parte.strip()
-            if not seg:
-                continue
-            seg = seg.replace(self.PLACEHOLDER, '.')
-            if not seg.endswith(('.', '?', '!')):
-                seg += '.'
-            frases.append(seg)
+        inicio = 0
+        for m in self.padrao.finditer(texto):
+            if m.lastgroup == "corte":
+                self._adicionar_frase(frases, texto[inicio:m.start()])
+                inicio = m.end()
+        self._adicionar_frase(frases, texto[inicio:])
         return frases
 
+    @staticmethod
+    def _adicionar_frase(frases: List[str], parte: str) -> None:
+        seg = parte.strip()
+        if not seg:
+            return
+        if not seg.endswith(('.', '?', '!')):
+            seg += '.'
+        frases.append(seg)
+
     def __iter__(self):
         return iter(self.resposta_segmentada)
 
+
+class SegmentadorIncremental:
+    """
+    Versão incremental do RespostaSegmentada, para respostas em streaming: recebe os deltas do LLM
+    e devolve cada frase assim que ela está fechada. A soma das frases é idêntica à segmentação do texto completo.
+    """
+
+    def __init__(self, abreviacoes: Optional[Iterable[str]] = None):
+        self.padrao = _compilar_segmentador(tuple(abreviacoes) if abreviacoes is not None else RespostaSegmentada.ABBREVIATIONS)
+        self.texto = ""
+        self.inicio = 0
+
+    def alimentar(self, delta: str) -> List[str]:
+        self.texto += delta
+        frases = []
+        for m in self.padrao.finditer(self.texto, self.inicio):
+            if m.lastgroup != "corte":
+                continue
+            if m.end() >= len(self.texto):
+                break  # o espaço pode continuar no próximo delta
+            RespostaSegmentada._adicionar_frase(frases, self.texto[self.inicio:m.start()])
+            self.inicio = m.end()
+        return frases
+
+    def finalizar(self) -> List[str]:
+        frases = []
+        RespostaSegmentada._adicionar_frase(frases, self.texto[self.inicio:])
+        self.inicio = len(self.texto)
+        return frases
+
+
 class MensagemDispatcher:
-    def __init__(self, numero_destino: str, resposta: str, zapi_instance_id: str, zapi_token: str, zapi_phone_header: str = ZAPI_PHONE_HEADER, retries: int = 3, delay_typing: int = 1, delay_between: float = 0, timeout: int = 10):
+    def __init__(self, numero_destino: str, resposta: str, zapi_instance_id: str, zapi_token: str, delay_typing: int = 1, delay_between: float = 0, fila: FilaEnvio = fila_envio, abreviacoes: Optional[Iterable[str]] = None):
         self.numero = numero_destino
-        self.segmentos = RespostaSegmentada(resposta)
-        self.url = f"https://api.z-api.io/instances/{zapi_instance_id}/token/{zapi_token}/send-text"
-        self.headers = {
-            'client-token': zapi_phone_header,
-            'Content-Type': "application/json"
-        }
-        self.retries = retries
+        self.abreviacoes = abreviacoes
+        self.segmentos = RespostaSegmentada(resposta, abreviacoes)
+        self.incremental = SegmentadorIncremental(abreviacoes)
+        self.enviados = 0
+        self.zapi_instance_id = zapi_instance_id
+        self.zapi_token = zapi_token
         self.delay_typing = delay_typing
         self.delay_between = delay_between
-        self.timeout = timeout
-        self.client = httpx.AsyncClient(timeout=self.timeout)
-
-    async def enviar_segmento(self, segmento: str) -> dict:
-        payload = {
-            "phone": self.numero,
-            "message": segmento,
-            "delayMessage": 0,
-            "delayTyping": self.delay_typing
-        }
-        for attempt in range(1, self.retries + 1):
-            try:
-                #logger.info(f"Enviando segmento {attempt}/{self.retries}: {segmento}")
-                resp = await self.client.post(self.url, json=payload, headers=self.headers)
-                if resp.status_code == 200:
-                    return {"segmento": segmento, "status": resp.status_code}
-                else:
-                    raise Exception(f"Status {resp.status_code}")
-            except Exception as e:
-                logger.error(f"Erro no envio (tentativa {attempt}): {e}")
-                await asyncio.sleep(1)
-        logger.critical(f"Falha total no segmento — enfileirando: {segmento}")
-        return {"segmento": segmento, "status": None}
+        self.fila = fila
+
+    async def enviar_segmentos(self, segmentos: List[str]) -> List[dict]:
+        # Só enfileira: o envio, retries, backoff e rate limit ficam com os workers da FilaEnvio
+        resultado = await self.fila.enfileirar(
+            self.numero, segmentos, self.zapi_instance_id, self.zapi_token,
+            delay_typing=self.delay_typing, delay_between=self.delay_between
+        )
+        self.enviados += len(segmentos)
+        return resultado
 
     async def enviar_resposta(self) -> List[dict]:
-        results = []
-        for segment in self.segmentos:
-            res = await self.enviar_segmento(segment)
-            results.append(res)
-            await asyncio.sleep(self.delay_between)
-        await self.client.aclose()
-        return results
\ No newline at end of file
+        return await self.enviar_segmentos(list(self.segmentos))
+
+    # Modo streaming: frases são enfileiradas assim que fecham
+    async def alimentar(self, delta: str) -> None:
+        if frases := self.incremental.alimentar(delta):
+            await self.enviar_segmentos(frases)
+
+    async def finalizar(self) -> None:
+        if frases := self.incremental.finalizar():
+            await self.enviar_segmentos(frases)
+
+    def descartar_pendente(self) -> None:
+        self.incremental = SegmentadorIncremental(self.abreviacoes)
@@ -4,6 +4,8 @@ from dataclasses import dataclass, field
 from app.config.redis_client import redis_client
 from app.config.supabase_client import supabase
 from app.utils.logger import logger
+from app.utils.codec import codificar, decodificar
+from app.utils.metrics import cronometrado
 
 @dataclass
 class UserInfo:
@@ -35,53 +37,55 @@ class UserInfoService:
         self.redis_client = redis_client
         self.supabase_client = supabase_client
         self.user_info: Optional[UserInfo] = None
+        self.origem = ""
 
+    @cronometrado("carga_user_info", origem="origem")
     async def get(self) -> UserInfo:
         key = f"{self.FIELD}:{self.telefone_cliente}:{self.telefone_usuario}"
 
+        self.origem = "redis"
         raw = await self.redis_client.get(key)
         if raw:
             try:
-                self.user_info = UserInfo.from_dict(json.loads(raw))
+                self.user_info = UserInfo.from_dict(decodificar(raw))
                 return self.user_info
             except json.JSONDecodeError:
-                logger.warning(f"[UserInfoService] JSON inválido no cache Redis: {key}")
+                logger.warning("[UserInfoService] JSON inválido no cache Redis: %s", key)
                 await self.redis_client.delete(key)
 
+        self.origem = "supabase"
         self.user_info = await self.get_from_supabase(key)
         return self.user_info
 
     async def get_from_supabase(self, redis_key: str) -> UserInfo:
         try:
             id_cliente_usuario = f"{self.telefone_cliente}:{self.telefone_usuario}"
-            res = self.supabase_client.table(self.TABLE)\
-                .select(self.FIELD)\
-                .eq("id_cliente_usuario", id_cliente_usuario)\
-                .limit(1)\
-                .execute()
+            res = await self.supabase_client.select_one(
+                self.TABLE, self.FIELD, {"id_cliente_usuario": id_cliente_usuario})
 
-            if res.data:
-                raw = res.data[0].get(self.FIELD)
+            if res:
+                raw = res.get(self.FIELD)
                 if raw:
                     user_info = UserInfo.from_dict(json.loads(raw))
                     user_info = self.sync_with_funnel(user_info)
-                    await self.redis_client.set(redis_key, json.dumps(user_info.to_dict()), ex=self.cache_ttl)
+                    await self.redis_client.set(redis_key, codificar(user_info.to_dict()), ex=self.cache_ttl)
                     return user_info
 
         except Exception as e:
-            logger.exception(f"[UserInfoService] Erro ao consultar Supabase: {e}")
+            logger.exception("[UserInfoService] Erro ao consultar Supabase: %s", e)
 
-        logger.info(f"[UserInfoService] Criando novo user_info para {self.telefone_usuario}")
+        logger.info("[UserInfoService] Criando novo user_info para %s", self.telefone_usuario)
+        self.origem = "novo"
         return await self.create_initial_user_info(redis_key)
 
     async def create_initial_user_info(self, redis_key: str) -> UserInfo:
         tracking_dict = self.funnel_info.to_tracking_dict(estado_atual=None)
         initial_info = UserInfo(**tracking_dict)
         try:
-            await self.redis_client.set(redis_key, json.dumps(initial_info.to_dict()), ex=self.cache_ttl)
-            logger.info(f"[UserInfoService] Registro criado ou atualizado para {self.telefone_usuario}")
+            await self.redis_client.set(redis_key, codificar(initial_info.to_dict()), ex=self.cache_ttl)
+            logger.info("[UserInfoService] Registro criado ou atualizado para %s", self.telefone_usuario)
         except Exception as e:
-            logger.exception(f"[UserInfoService] Erro ao criar user_info: {e}")
+            logger.exception("[UserInfoService] Erro ao criar user_info: %s", e)
             raise RuntimeError("Erro ao criar user_info")
 
         return initial_info
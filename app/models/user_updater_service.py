@@ -1,20 +1,25 @@
 import json
 import re
 import copy
-import openai
+import asyncio
 from datetime import datetime
-from typing import Any, Tuple, Optional, Any
+from typing import Any, Dict, List, Tuple, Optional, Any
 from app.config.redis_client import redis_client
-from app.config.supabase_client import supabase
+from app.utils.write_behind import persistencia
 from app.utils.logger import logger
+from app.utils.codec import codificar
+from app.utils.metrics import metricas
 from app.models.user_info import UserInfo
 from app.models.funnel_service import FunnelInfo
 from app.models.openai_service import FallbackLLM
+from app.services.llm_gateway import gateway_llm, FalhaLLM
+from app.models.prompt_context import dedent_prompt
 
 
 RETRY_ATTEMPTS = 2
 CHAT_MODEL = "gpt-4"
 FALLBACK_MODEL = "gpt-3.5-turbo"
+NAO_IDENTIFICADO = {"nao_identificado", "não_identificado"}
 
 class UserInfoUpdater:                                                                                                                          #14400
     def __init__(self, mensagem: str, user_info: UserInfo, funnel_info: FunnelInfo, telefone_cliente: str, telefone_usuario: str, historico: Any, cache_ttl: Optional[int] = 14400):
@@ -40,22 +45,80 @@ class UserInfoUpdater:
         await self._salvar_se_necessario()
 
     async def _processar_funil(self) -> None:
-        for etapa in self.funnel_info.funil:
-            await self._processar_etapa(etapa)
+        elegiveis = [etapa for etapa in self.funnel_info.funil if self._pode_validar(etapa)]
 
-    async def _processar_etapa(self, etapa: Any) -> None:
-        estado_id = etapa.id
-        valor_atual = self.user_info.data.get(estado_id)
-        pode_validar = (valor_atual is None) or etapa.permite_nova_entrada
+        # As extrações são independentes entre si; só a aplicação precisa seguir a ordem do funil.
+        modo = getattr(self.funnel_info, "modo_extracao", "por_etapa")
+        with metricas.medir("extracao_funil", origem=modo):
+            if modo == "unica":
+                extraidos = await self._extrair_valores_unica(elegiveis)
+            else:
+                extraidos = await self._extrair_valores_paralelo(elegiveis)
 
-        if not pode_validar:
-            return
-        valor_extraido = await self._extrair_valor(etapa)
+        for etapa in elegiveis:
+            self._aplicar_etapa(etapa, extraidos.get(etapa.id))
+
+    def _pode_validar(self, etapa: Any) -> bool:
+        valor_atual = self.user_info.data.get(etapa.id)
+        return (valor_atual is None) or etapa.permite_nova_entrada
+
+    def _aplicar_etapa(self, etapa: Any, valor_extraido: Optional[str]) -> None:
+        valor_atual = self.user_info.data.get(etapa.id)
         if valor_extraido is not None:
-            self.user_info.data[estado_id] = valor_extraido
+            self.user_info.data[etapa.id] = valor_extraido
         else:
             self._definir_prompt_para_etapa(etapa, valor_atual)
 
+    async def _extrair_valores_paralelo(self, etapas: List[Any]) -> Dict[str, Optional[str]]:
+        valores = await asyncio.gather(*(self._extrair_valor(etapa) for etapa in etapas))
+        return {etapa.id: valor for etapa, valor in zip(etapas, valores)}
+
+    async def _extrair_valores_unica(self, etapas: List[Any]) -> Dict[str, Optional[str]]:
+        com_prompt = [etapa for etapa in etapas if getattr(etapa, "fallback_llm", None)]
+        if not com_prompt:
+            return {}
+
+        objeto_fallback = FallbackLLM(self.mensagem, self._prompt_extracao_unica(com_prompt), self.historico,
+                                      max_tokens=30 * len(com_prompt) + 20, response_format={"type": "json_object"})
+        resposta_llm = await objeto_fallback.generate_fallback_llm()
+        if objeto_fallback.falhou:
+            # LLM fora: repetir por etapa só multiplicaria chamadas que vão falhar
+            return {}
+
+        try:
+            dados = json.loads(resposta_llm or "")
+            if not isinstance(dados, dict):
+                raise ValueError("resposta não é um objeto JSON")
+        except (ValueError, TypeError) as e:
+            logger.warning("[UserInfoUpdater] Extração única inválida, usando chamadas por etapa: %s", e)
+            return await self._extrair_valores_paralelo(com_prompt)
+
+        extraidos: Dict[str, Optional[str]] = {}
+        faltantes = []
+        for etapa in com_prompt:
+            if etapa.id not in dados:
+                faltantes.append(etapa)
+                continue
+            valor = dados[etapa.id]
+            valor = str(valor).strip().lower() if valor is not None else ""
+            extraidos[etapa.id] = valor if valor and valor not in NAO_IDENTIFICADO else None
+
+        if faltantes:
+            extraidos.update(await self._extrair_valores_paralelo(faltantes))
+        return extraidos
+
+    @staticmethod
+    def _prompt_extracao_unica(etapas: List[Any]) -> str:
+        ids = ", ".join(f'"{etapa.id}"' for etapa in etapas)
+        blocos = [
+            "Extraia da conversa o dado pedido em cada etapa abaixo.",
+            f"Responda APENAS com um objeto JSON com exatamente as chaves {ids}.",
+            'Cada valor deve ser a resposta curta pedida pela etapa ou "nao_identificado".',
+        ]
+        for etapa in etapas:
+            blocos += ["", f"[ETAPA {etapa.id}]", dedent_prompt(etapa.fallback_llm)]
+        return "\n".join(blocos)
+
     async def _extrair_valor(self, etapa: Any) -> Optional[str]:
         fallback_prompt = getattr(etapa, "fallback_llm", None)
         if fallback_prompt:
@@ -93,26 +156,21 @@ class UserInfoUpdater:
         current = self.user_info.to_dict()
         if current != self.original_snapshot:
             key = f"user_info:{self.telefone_cliente}:{self.telefone_usuario}"
-            await redis_client.set(key, json.dumps(current), ex=self.cache_ttl)
+            await redis_client.set(key, codificar(current), ex=self.cache_ttl)
             #logger.info(f"[UserInfoUpdater] Redis atualizado para {self.telefone_usuario}")
 
-            # Supabase
-            try:
-                id_cliente_usuario = f"{self.telefone_cliente}:{self.telefone_usuario}"
-                # Gerar updated_at no fuso de São Paulo, sem offset
-                updated_at = datetime.now().astimezone().isoformat()
-
-                supabase.table("user_data").upsert({
-                    "id_cliente_usuario": id_cliente_usuario,
-                    "telefone_cliente": self.telefone_cliente,
-                    "telefone_usuario": self.telefone_usuario,
-                    "user_info": json.dumps(current),
-                    "updated_at": updated_at
-                },
-                on_conflict=["id_cliente_usuario"]
-                ).execute()
-            except Exception as e:
-                logger.error(f"[update_user_funnel] Supabase error: {e}")
+            # Supabase via write-behind
+            id_cliente_usuario = f"{self.telefone_cliente}:{self.telefone_usuario}"
+            # Gerar updated_at no fuso de São Paulo, sem offset
+            updated_at = datetime.now().astimezone().isoformat()
+
+            persistencia.marcar({
+                "id_cliente_usuario": id_cliente_usuario,
+                "telefone_cliente": self.telefone_cliente,
+                "telefone_usuario": self.telefone_usuario,
+                "user_info": json.dumps(current),
+                "updated_at": updated_at
+            })
 
     def _get_response_prompt(self) -> str:
         if self.first_prompt:
@@ -123,19 +181,15 @@ class UserInfoUpdater:
     
     @staticmethod
     async def chamar_llm(prompt: str, mensagem: str) -> str:
-        for attempt in range(RETRY_ATTEMPTS):
-            try:
-                response = await openai.ChatCompletion.acreate(
-                    model = CHAT_MODEL if attempt < RETRY_ATTEMPTS - 1 else FALLBACK_MODEL,
-                    messages=[
-                        {"role": "system", "content": prompt},
-                        {"role": "user", "content": mensagem}
-                    ],
-                    temperature=0,
-                    max_tokens=10,
-                )
-                return response.choices[0].message['content'].strip()
-            except Exception as e:
-                logger.info(f"Erro na chamada LLM da intencao: {e}")
-        return "erro_llm"
+        try:
+            return await gateway_llm.completar(
+                "intencao_llm",
+                [
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": mensagem}
+                ],
+                CHAT_MODEL, FALLBACK_MODEL, RETRY_ATTEMPTS, temperature=0, max_tokens=10)
+        except FalhaLLM as e:
+            logger.info("Erro na chamada LLM da intencao: %s", e)
+            return "erro_llm"
 
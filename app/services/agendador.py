@@ -0,0 +1,137 @@
+"""
+Agendador por clínica (connectedPhone) da metade LLM/resposta do process_message.
+
+A vaga só é pedida depois do debounce devolver a mensagem consolidada: a espera do debounce e os
+ecos do próprio bot (fromMe) não ocupam vagas. Cada clínica tem um teto de respostas simultâneas
+e as clínicas com mensagens esperando dividem as vagas do processo por fila justa ponderada (start-time fair queueing): cada mensagem recebe
+uma etiqueta de início max(V, fim da anterior da clínica) e avança 1/peso; sai primeiro a menor
+etiqueta entre as clínicas abaixo do teto. Uma rajada de uma clínica só atrasa a própria clínica.
+"""
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional
+
+from app.config.config import (
+    AGENDADOR_MAX_CONCORRENCIA, TENANT_MAX_CONCORRENCIA, TENANT_LIMITES, TENANT_PESOS
+)
+from app.utils.metrics import metricas
+
+
+def _parse_mapa(config: str, tipo: Callable[[str], Any]) -> Dict[str, Any]:
+    mapa = {}
+    for item in filter(None, (p.strip() for p in config.split(","))):
+        chave, _, valor = item.partition("=")
+        mapa[chave.strip()] = tipo(valor.strip())
+    return mapa
+
+
+@dataclass
+class _Pedido:
+    inicio: float
+    futuro: asyncio.Future
+
+
+class AgendadorTenants:
+    def __init__(self, max_concorrencia: int = AGENDADOR_MAX_CONCORRENCIA,
+                 max_por_tenant: int = TENANT_MAX_CONCORRENCIA, limites: Optional[Dict[str, int]] = None,
+                 pesos: Optional[Dict[str, float]] = None):
+        self.max_concorrencia = max_concorrencia
+        self.max_por_tenant = max_por_tenant
+        self.limites = limites if limites is not None else _parse_mapa(TENANT_LIMITES, int)
+        self.pesos = pesos if pesos is not None else _parse_mapa(TENANT_PESOS, float)
+        self._filas: Dict[str, Deque[_Pedido]] = {}
+        self._ativos: Dict[str, int] = {}
+        self._ultimo_fim: Dict[str, float] = {}
+        self._tempo_virtual = 0.0
+        self._em_execucao = 0
+        self._aguardando = 0
+
+    def _limite(self, cliente: str) -> int:
+        return self.limites.get(cliente, self.max_por_tenant)
+
+    def _despachar(self) -> None:
+        while self._em_execucao < self.max_concorrencia:
+            escolhido = None
+            for cliente, fila in self._filas.items():
+                if self._ativos.get(cliente, 0) >= self._limite(cliente):
+                    continue
+                if escolhido is None or fila[0].inicio < self._filas[escolhido][0].inicio:
+                    escolhido = cliente
+            if escolhido is None:
+                return
+
+            fila = self._filas[escolhido]
+            pedido = fila.popleft()
+            if not fila:
+                del self._filas[escolhido]
+            self._aguardando -= 1
+
+            self._tempo_virtual = pedido.inicio
+            self._ativos[escolhido] = self._ativos.get(escolhido, 0) + 1
+            self._em_execucao += 1
+            pedido.futuro.set_result(None)
+
+    async def _adquirir(self, cliente: str) -> None:
+        inicio = max(self._tempo_virtual, self._ultimo_fim.get(cliente, 0.0))
+        self._ultimo_fim[cliente] = inicio + 1 / self.pesos.get(cliente, 1.0)
+        pedido = _Pedido(inicio, asyncio.get_running_loop().create_future())
+        self._filas.setdefault(cliente, deque()).append(pedido)
+        self._aguardando += 1
+        self._despachar()
+
+        try:
+            await pedido.futuro
+        except asyncio.CancelledError:
+            if pedido.futuro.done() and not pedido.futuro.cancelled():
+                # Cancelado depois de receber a vaga: devolve
+                self._liberar(cliente)
+            else:
+                self._desistir(cliente, pedido)
+            raise
+
+    def _desistir(self, cliente: str, pedido: _Pedido) -> None:
+        """Tira da fila quem foi cancelado antes de receber a vaga."""
+        fila = self._filas.get(cliente)
+        if fila is None or not any(p is pedido for p in fila):
+            return
+        ultimo = fila[-1] is pedido
+        fila.remove(pedido)
+        self._aguardando -= 1
+        if ultimo:
+            # A próxima mensagem da clínica começa onde esta começaria
+            self._ultimo_fim[cliente] = pedido.inicio
+        if not fila:
+            del self._filas[cliente]
+            if cliente not in self._ativos:
+                self._ultimo_fim.pop(cliente, None)
+
+    def _liberar(self, cliente: str) -> None:
+        self._ativos[cliente] -= 1
+        if not self._ativos[cliente]:
+            del self._ativos[cliente]
+            if cliente not in self._filas:
+                self._ultimo_fim.pop(cliente, None)
+        self._em_execucao -= 1
+        self._despachar()
+
+    @asynccontextmanager
+    async def vaga(self, cliente: str) -> AsyncIterator[None]:
+        with metricas.medir("espera_agendador", cliente=cliente):
+            await self._adquirir(cliente)
+        try:
+            yield
+        finally:
+            self._liberar(cliente)
+
+    def stats(self) -> dict:
+        return {
+            "em_execucao": self._em_execucao,
+            "aguardando": self._aguardando,
+            "tenants_ativos": len(self._ativos),
+            "tenants_aguardando": len(self._filas),
+        }
+
+
+agendador = AgendadorTenants()
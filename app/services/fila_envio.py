@@ -0,0 +1,299 @@
+"""
+Fila durável de envio para a Z-API.
+
+Cada conversa (instância + destinatário) tem uma lista Redis com os segmentos em ordem; um
+Redis Stream com consumer group avisa os workers de envio que há conversa a drenar. Só quem
+detém o lock da conversa envia, o que garante a ordem por destinatário.
+
+Conversa sem token no rate limit da instância, ou com erro no envio, não dorme no worker: vai
+para um ZSET com o horário da próxima tentativa e volta ao stream quando ele chega, deixando o
+worker livre para as outras conversas.
+
+Para rodar só os workers de envio (sem a API), com N workers:
+    python -m app.services.fila_envio [N]
+"""
+import os
+import sys
+import json
+import uuid
+import socket
+import asyncio
+from contextvars import ContextVar
+from typing import Any, List, Optional
+
+from app.config.config import (
+    ZAPI_PHONE_HEADER, ZAPI_SENDER_WORKERS, ZAPI_RATE_POR_SEGUNDO, ZAPI_RATE_BURST,
+    ZAPI_MAX_TENTATIVAS, ZAPI_BACKOFF_BASE, ZAPI_BACKOFF_MAX
+)
+from app.config.redis_client import redis_client
+from app.config.http_client import HttpClientPool, http_pool
+from app.utils.logger import logger
+from app.utils.metrics import cliente_atual, metricas
+
+STREAM = "zapi:outbound"
+GRUPO = "zapi-senders"
+DEAD_LETTER = "zapi:dead_letter"
+ADIADAS = "zapi:adiadas"
+
+# Chave Redis marcada junto com o enfileiramento da resposta (na mesma transação). A fila de
+# webhooks usa para não responder de novo quando uma entrada sem ACK é reprocessada.
+marcador_envio: ContextVar[Optional[str]] = ContextVar("marcador_envio", default=None)
+
+# Token bucket por instância Z-API; usa o relógio do Redis para ser consistente entre workers.
+# Retorna 0 se consumiu um token, ou quantos ms esperar até haver um.
+_LUA_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local agora = t[1] * 1000 + math.floor(t[2] / 1000)
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or agora
+tokens = math.min(burst, tokens + (agora - ts) * rate / 1000)
+local espera = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    espera = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', agora)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return espera
+"""
+
+# Agenda a conversa para daqui a ARGV[2] ms, no relógio do Redis
+_LUA_ADIAR = """
+local t = redis.call('TIME')
+local agora = t[1] * 1000 + math.floor(t[2] / 1000)
+return redis.call('ZADD', KEYS[1], agora + tonumber(ARGV[2]), ARGV[1])
+"""
+
+# Devolve ao stream as conversas cujo horário chegou; atômico entre processos
+_LUA_PROMOVER = """
+local t = redis.call('TIME')
+local agora = t[1] * 1000 + math.floor(t[2] / 1000)
+local vencidas = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', agora, 'LIMIT', 0, tonumber(ARGV[1]))
+for _, conversa in ipairs(vencidas) do
+    redis.call('ZREM', KEYS[1], conversa)
+    redis.call('XADD', KEYS[2], 'MAXLEN', '~', 100000, '*', 'conversa', conversa)
+end
+return #vencidas
+"""
+
+_LUA_LIBERAR_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class FilaEnvio:
+    def __init__(self, redis_client: Any = redis_client, http_pool: HttpClientPool = http_pool,
+                 workers: int = ZAPI_SENDER_WORKERS, rate: float = ZAPI_RATE_POR_SEGUNDO, burst: int = ZAPI_RATE_BURST,
+                 max_tentativas: int = ZAPI_MAX_TENTATIVAS, backoff_base: float = ZAPI_BACKOFF_BASE,
+                 backoff_max: float = ZAPI_BACKOFF_MAX, lock_ttl_ms: int = 60000, reclaim_idle_ms: int = 60000,
+                 zapi_phone_header: str = ZAPI_PHONE_HEADER, ttl_marcador: int = 86400):
+        self.redis = redis_client
+        self.http_pool = http_pool
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lock_ttl_ms = lock_ttl_ms
+        self.reclaim_idle_ms = reclaim_idle_ms
+        self.ttl_marcador = ttl_marcador
+        self.headers = {
+            'client-token': zapi_phone_header,
+            'Content-Type': "application/json"
+        }
+        self._token_bucket = self.redis.register_script(_LUA_TOKEN_BUCKET)
+        self._liberar_lock = self.redis.register_script(_LUA_LIBERAR_LOCK)
+        self._adiar = self.redis.register_script(_LUA_ADIAR)
+        self._promover = self.redis.register_script(_LUA_PROMOVER)
+        self._tasks: List[asyncio.Task] = []
+        self._prefixo_consumidor = f"{socket.gethostname()}-{os.getpid()}"
+
+    @staticmethod
+    def _chave_conversa(zapi_instance_id: str, numero: str) -> str:
+        return f"zapi:fila:{zapi_instance_id}:{numero}"
+
+    async def enfileirar(self, numero: str, segmentos: List[str], zapi_instance_id: str, zapi_token: str,
+                         delay_typing: int = 1, delay_between: float = 0) -> List[dict]:
+        if not segmentos:
+            return []
+        chave = self._chave_conversa(zapi_instance_id, numero)
+        itens = [json.dumps({
+            "numero": numero,
+            "segmento": segmento,
+            "instancia": zapi_instance_id,
+            "token": zapi_token,
+            "delay_typing": delay_typing,
+            "delay_between": delay_between,
+            "tentativas": 0,
+            # Tenant (connectedPhone) para as métricas do envio, que roda fora do contexto da mensagem
+            "cliente": cliente_atual.get()
+        }) for segmento in segmentos]
+
+        # Os segmentos entram na lista antes do aviso no stream (ver _drenar_conversa)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(chave, *itens)
+            pipe.xadd(STREAM, {"conversa": chave}, maxlen=100000, approximate=True)
+            if marcador := marcador_envio.get():
+                pipe.set(marcador, 1, ex=self.ttl_marcador)
+            await pipe.execute()
+        return [{"segmento": segmento, "status": "enfileirado"} for segmento in segmentos]
+
+    async def _reservar_token(self, zapi_instance_id: str) -> int:
+        """0 se consumiu um token da instância, ou quantos ms faltam para haver um."""
+        return int(await self._token_bucket(keys=[f"zapi:bucket:{zapi_instance_id}"], args=[self.rate, self.burst]))
+
+    async def _adiar_conversa(self, chave: str, espera_ms: int) -> None:
+        await self._adiar(keys=[ADIADAS], args=[chave, max(1, int(espera_ms))])
+
+    async def _enviar(self, item: dict) -> Optional[str]:
+        """Faz o POST na Z-API. Retorna None em caso de sucesso ou a descrição do erro."""
+        url = f"/instances/{item['instancia']}/token/{item['token']}/send-text"
+        payload = {
+            "phone": item["numero"],
+            "message": item["segmento"],
+            "delayMessage": 0,
+            "delayTyping": item.get("delay_typing", 1)
+        }
+        try:
+            async with self.http_pool.limitador(f"zapi:{item['instancia']}"):
+                with metricas.medir("zapi_envio", cliente=item.get("cliente", "")) as medicao:
+                    resp = await self.http_pool.get("zapi").post(url, json=payload, headers=self.headers)
+                    medicao.origem = str(resp.status_code)
+            if resp.status_code == 200:
+                return None
+            return f"Status {resp.status_code}"
+        except Exception as e:
+            return str(e) or type(e).__name__
+
+    def _backoff(self, tentativas: int) -> float:
+        return min(self.backoff_max, self.backoff_base * (2 ** (tentativas - 1)))
+
+    async def _drenar_conversa(self, chave: str) -> None:
+        if await self.redis.zscore(ADIADAS, chave) is not None:
+            return  # aguardando a próxima tentativa; o promotor devolve ao stream
+        lock = f"{chave}:lock"
+        token = uuid.uuid4().hex
+        if not await self.redis.set(lock, token, nx=True, px=self.lock_ttl_ms):
+            return  # outro worker está drenando esta conversa
+
+        adiada = False
+        try:
+            while (raw := await self.redis.lindex(chave, 0)) is not None:
+                item = json.loads(raw)
+                if espera_ms := await self._reservar_token(item["instancia"]):
+                    await self._adiar_conversa(chave, espera_ms)
+                    adiada = True
+                    return
+                erro = await self._enviar(item)
+
+                if erro is None:
+                    await self.redis.lpop(chave)
+                    if item.get("delay_between"):
+                        await asyncio.sleep(item["delay_between"])
+                else:
+                    item["tentativas"] += 1
+                    logger.error("Erro no envio (tentativa %s): %s", item['tentativas'], erro)
+                    if item["tentativas"] >= self.max_tentativas:
+                        logger.critical("Falha total no segmento — dead-letter: %s", item['segmento'])
+                        item.pop("token", None)
+                        async with self.redis.pipeline(transaction=True) as pipe:
+                            pipe.lpush(DEAD_LETTER, json.dumps({**item, "erro": erro}))
+                            pipe.lpop(chave)
+                            await pipe.execute()
+                    else:
+                        metricas.retentativas.incrementar(fase="zapi_envio", cliente=item.get("cliente", ""))
+                        await self.redis.lset(chave, 0, json.dumps(item))
+                        await self._adiar_conversa(chave, self._backoff(item["tentativas"]) * 1000)
+                        adiada = True
+                        return
+
+                await self.redis.pexpire(lock, self.lock_ttl_ms)
+        finally:
+            await self._liberar_lock(keys=[lock], args=[token])
+            # Segmento que chegou entre o último LINDEX e a liberação do lock
+            if not adiada and await self.redis.llen(chave):
+                await self.redis.xadd(STREAM, {"conversa": chave}, maxlen=100000, approximate=True)
+
+    async def _promotor(self, intervalo: float = 0.25) -> None:
+        while True:
+            try:
+                await self._promover(keys=[ADIADAS, STREAM], args=[100])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("[FilaEnvio] Erro ao promover conversas adiadas: %s", e)
+            await asyncio.sleep(intervalo)
+
+    async def _garantir_grupo(self) -> None:
+        try:
+            await self.redis.xgroup_create(STREAM, GRUPO, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _worker(self, consumidor: str) -> None:
+        while True:
+            try:
+                # Entradas de workers que caíram sem dar ACK
+                _, entradas, *_ = await self.redis.xautoclaim(
+                    STREAM, GRUPO, consumidor, min_idle_time=self.reclaim_idle_ms, start_id="0-0", count=10)
+                if not entradas:
+                    resp = await self.redis.xreadgroup(GRUPO, consumidor, {STREAM: ">"}, count=10, block=5000)
+                    entradas = resp[0][1] if resp else []
+
+                for entrada_id, campos in entradas:
+                    if campos:
+                        await self._drenar_conversa(campos["conversa"])
+                    await self.redis.xack(STREAM, GRUPO, entrada_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("[FilaEnvio] Erro no worker %s: %s", consumidor, e)
+                await asyncio.sleep(1)
+
+    async def start(self) -> None:
+        if not self.workers:
+            return
+        await self._garantir_grupo()
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(f"{self._prefixo_consumidor}-{i}")))
+        self._tasks.append(asyncio.create_task(self._promotor()))
+        logger.info("[FilaEnvio] %s worker(s) de envio iniciados", self.workers)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def profundidade(self) -> dict:
+        return {
+            "stream": await self.redis.xlen(STREAM),
+            "adiadas": await self.redis.zcard(ADIADAS),
+            "dead_letter": await self.redis.llen(DEAD_LETTER),
+        }
+
+
+fila_envio = FilaEnvio()
+
+
+async def _main(workers: int) -> None:
+    http_pool.abrir()
+    fila_envio.workers = workers
+    await fila_envio.start()
+    try:
+        await asyncio.gather(*fila_envio._tasks)
+    finally:
+        await http_pool.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(int(sys.argv[1]) if len(sys.argv) > 1 else max(ZAPI_SENDER_WORKERS, 1)))
@@ -0,0 +1,235 @@
+"""
+Fila durável de entrada dos webhooks da Z-API.
+
+O /webhook só grava o body num Redis Stream e responde; cada processo consumidor lê o stream
+(consumer group) e roda o process_message de cada entrada, com até `workers` entradas em andamento
+por processo; a metade LLM/resposta passa pelo agendador por clínica. Enquanto estão em andamento,
+as entradas têm a posse renovada; entradas sem ACK de um processo que caiu são reivindicadas por outro
+depois de WEBHOOK_RECLAIM_IDLE_MS. As que falham vão para o dead-letter.
+
+No desligamento o processo para de ler e espera até WEBHOOK_DRENAGEM_S pelas entradas em
+andamento. Uma entrada reprocessada cuja resposta já tinha sido enfileirada (marcador gravado
+junto com o enfileiramento na FilaEnvio) só recebe o ACK, sem responder de novo; e o fragmento
+dela não entra duas vezes no debounce (deduplicado pelo messageId).
+
+WEBHOOK_WORKERS limita as entradas em andamento (incluindo as que dormem no debounce) e
+AGENDADOR_MAX_CONCORRENCIA, as respostas (LLM) simultâneas.
+
+Para rodar só os workers do pipeline (sem a API), com até N entradas em andamento:
+    python -m app.services.fila_webhook [N]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from app.config.config import WEBHOOK_WORKERS, WEBHOOK_RECLAIM_IDLE_MS, WEBHOOK_DRENAGEM_S
+from app.config.redis_client import redis_client
+from app.services.agendador import AgendadorTenants, agendador
+from app.services.fila_envio import marcador_envio
+from app.utils.logger import logger
+
+STREAM = "webhook:inbound"
+GRUPO = "webhook-workers"
+DEAD_LETTER = "webhook:dead_letter"
+RESPONDIDA = "webhook:respondida"
+
+
+class FilaWebhook:
+    def __init__(self, redis_client: Any = redis_client, workers: int = WEBHOOK_WORKERS,
+                 reclaim_idle_ms: int = WEBHOOK_RECLAIM_IDLE_MS, maxlen: int = 100000,
+                 drenagem_s: float = WEBHOOK_DRENAGEM_S, agendador: AgendadorTenants = agendador):
+        self.redis = redis_client
+        # Entradas em andamento (lidas e sem ACK) neste processo; 0 = não consome a fila
+        self.workers = workers
+        self.reclaim_idle_ms = reclaim_idle_ms
+        self.maxlen = maxlen
+        self.drenagem_s = drenagem_s
+        self.agendador = agendador
+        self._tasks: List[asyncio.Task] = []
+        # Entradas lidas e ainda sem ACK (no debounce, esperando no agendador ou rodando) -> task
+        self._em_posse: Dict[str, asyncio.Task] = {}
+        self._espaco: Optional[asyncio.Event] = None
+        self.consumidor = f"{socket.gethostname()}-{os.getpid()}"
+
+    async def enfileirar(self, body: dict) -> str:
+        return await self.redis.xadd(STREAM, {"body": json.dumps(body)}, maxlen=self.maxlen, approximate=True)
+
+    async def _processar(self, entrada_id: str, campos: dict, reprocessada: bool = False) -> None:
+        # Import tardio: o message_handler importa quase todo o app
+        from app.services.message_handler import process_message
+
+        marcador = f"{RESPONDIDA}:{entrada_id}"
+        try:
+            if reprocessada and await self.redis.exists(marcador):
+                logger.warning("[FilaWebhook] Entrada %s já teve a resposta enfileirada; só confirmando", entrada_id)
+            elif campos:
+                body = json.loads(campos["body"])
+                marcador_envio.set(marcador)
+                await process_message(body)
+            await self.redis.xack(STREAM, GRUPO, entrada_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("[FilaWebhook] Erro no pipeline da entrada %s — dead-letter: %s", entrada_id, e)
+            try:
+                await self.redis.lpush(DEAD_LETTER, json.dumps({"id": entrada_id, "body": campos.get("body"), "erro": str(e)}))
+                await self.redis.xack(STREAM, GRUPO, entrada_id)
+            except Exception as erro_dlq:
+                logger.error("[FilaWebhook] Falha ao mover %s para o dead-letter: %s", entrada_id, erro_dlq)
+        finally:
+            self._em_posse.pop(entrada_id, None)
+            self._atualizar_espaco()
+
+    def _atualizar_espaco(self) -> None:
+        if self._espaco is None:
+            return
+        if len(self._em_posse) < self.workers:
+            self._espaco.set()
+        else:
+            self._espaco.clear()
+
+    def _aceitar(self, entradas: list, reprocessadas: bool = False) -> None:
+        for entrada_id, campos in entradas:
+            if entrada_id not in self._em_posse:
+                self._em_posse[entrada_id] = asyncio.create_task(self._processar(entrada_id, campos, reprocessadas))
+        self._atualizar_espaco()
+
+    async def _garantir_grupo(self) -> None:
+        try:
+            await self.redis.xgroup_create(STREAM, GRUPO, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _leitor(self) -> None:
+        # Lê só enquanto há espaço para mais entradas em andamento: o excesso fica no stream, visível como lag
+        while True:
+            try:
+                await self._espaco.wait()
+                livres = max(1, min(self.workers - len(self._em_posse), 50))
+
+                # Entradas de processos que caíram sem dar ACK
+                _, entradas, *_ = await self.redis.xautoclaim(
+                    STREAM, GRUPO, self.consumidor, min_idle_time=self.reclaim_idle_ms, start_id="0-0", count=livres)
+                entradas = [(i, c) for i, c in entradas if i not in self._em_posse]
+                if entradas:
+                    logger.warning("[FilaWebhook] Reprocessando %s entrada(s) sem ACK", len(entradas))
+                    self._aceitar(entradas, reprocessadas=True)
+                    continue
+                resp = await self.redis.xreadgroup(GRUPO, self.consumidor, {STREAM: ">"}, count=livres, block=5000)
+                self._aceitar(resp[0][1] if resp else [])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("[FilaWebhook] Erro no leitor %s: %s", self.consumidor, e)
+                await asyncio.sleep(1)
+
+    async def _renovar_posse(self) -> None:
+        # Entradas em andamento (debounce + agendador + LLM) podem passar do reclaim_idle_ms: zera o idle delas
+        while True:
+            await asyncio.sleep(self.reclaim_idle_ms / 3000)
+            ids = list(self._em_posse)
+            try:
+                for i in range(0, len(ids), 100):
+                    await self.redis.xclaim(STREAM, GRUPO, self.consumidor, min_idle_time=0,
+                                            message_ids=ids[i:i + 100], justid=True)
+            except Exception as e:
+                logger.warning("[FilaWebhook] Falha ao renovar posse de %s entrada(s): %s", len(ids), e)
+
+    async def start(self) -> None:
+        if not self.workers:
+            return
+        await self._garantir_grupo()
+        self._espaco = asyncio.Event()
+        self._atualizar_espaco()
+        self._tasks.append(asyncio.create_task(self._leitor()))
+        self._tasks.append(asyncio.create_task(self._renovar_posse()))
+        logger.info("[FilaWebhook] Consumidor %s iniciado (até %s entrada(s) em andamento, %s resposta(s) simultânea(s))",
+                    self.consumidor, self.workers, self.agendador.max_concorrencia)
+
+    async def stop(self) -> None:
+        # Para de ler, espera as entradas em andamento terminarem (até drenagem_s) e só então
+        # cancela o resto, que fica sem ACK e é reivindicado por outro processo
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+        em_andamento = list(self._em_posse.values())
+        if em_andamento:
+            logger.info("[FilaWebhook] Aguardando %s entrada(s) em andamento (até %ss)", len(em_andamento), self.drenagem_s)
+            _, pendentes = await asyncio.wait(em_andamento, timeout=self.drenagem_s)
+            if pendentes:
+                logger.warning("[FilaWebhook] Cancelando %s entrada(s) que não terminaram a tempo", len(pendentes))
+                for task in pendentes:
+                    task.cancel()
+                await asyncio.gather(*pendentes, return_exceptions=True)
+        self._em_posse.clear()
+
+    async def profundidade(self) -> dict:
+        """
+        stream: entradas no stream (inclui já processadas até o trim); lag: ainda não entregues a
+        nenhum worker; pendentes: entregues sem ACK; atraso_s: idade da entrada pendente mais antiga.
+        """
+        pendentes, lag, atraso = 0, 0, 0.0
+        try:
+            grupo = next((g for g in await self.redis.xinfo_groups(STREAM) if g.get("name") == GRUPO), None)
+            if grupo:
+                pendentes = grupo.get("pending") or 0
+                lag = grupo.get("lag") or 0
+            mais_antiga = await self.redis.xpending_range(STREAM, GRUPO, min="-", max="+", count=1)
+            if mais_antiga:
+                criada_ms = int(str(mais_antiga[0]["message_id"]).split("-")[0])
+                atraso = max(0.0, time.time() - criada_ms / 1000)
+        except Exception as e:
+            if "no such key" not in str(e).lower():
+                raise
+        return {
+            "stream": await self.redis.xlen(STREAM),
+            "lag": lag,
+            "pendentes": pendentes,
+            "atraso_s": round(atraso, 3),
+            "dead_letter": await self.redis.llen(DEAD_LETTER),
+        }
+
+
+fila_webhook = FilaWebhook()
+
+
+async def _main(workers: int) -> None:
+    from app.config.http_client import http_pool
+    from app.services.llm_gateway import gateway_llm
+    from app.utils.local_cache import escutar_invalidacoes
+    from app.utils.write_behind import persistencia
+    from app.utils.tokens import aquecer_tokens
+
+    http_pool.abrir()
+    aquecimento_tokens = asyncio.create_task(asyncio.to_thread(aquecer_tokens))
+    invalidacoes = asyncio.create_task(escutar_invalidacoes())
+    persistencia.start()
+    fila_webhook.workers = workers
+    await fila_webhook.start()
+
+    # SIGTERM (deploy) e Ctrl+C: desligamento com drenagem das entradas em andamento
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sinal, parar.set)
+    try:
+        await parar.wait()
+    finally:
+        await fila_webhook.stop()
+        aquecimento_tokens.cancel()
+        invalidacoes.cancel()
+        await persistencia.stop()
+        await gateway_llm.aclose()
+        await http_pool.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(int(sys.argv[1]) if len(sys.argv) > 1 else max(WEBHOOK_WORKERS, 1)))
@@ -0,0 +1,149 @@
+"""
+Orçamento de chamadas à OpenAI por modelo, para ficar abaixo dos limites de RPM/TPM da conta
+em vez de estourar e gastar retentativas.
+
+Cada modelo em LLM_LIMITES tem dois baldes (requisições e tokens por minuto). A chamada reserva
+1 requisição e os tokens estimados (prompt + max_tokens) antes de sair e devolve a sobra quando
+o uso real chega. Quem espera é atendido por prioridade: respostas ao paciente primeiro, e as
+chamadas de extração/intenção não usam a fração LLM_RESERVA_RESPOSTAS do balde.
+"""
+import time
+import heapq
+import asyncio
+from itertools import count
+from typing import Dict, List, Optional, Tuple
+
+from app.config.config import LLM_LIMITES, LLM_RESERVA_RESPOSTAS, LLM_ESPERA_MAX_S
+
+# Menor = mais urgente; fases fora do mapa entram como extração
+PRIORIDADES = {"chat_completion": 0}
+PRIORIDADE_EXTRACAO = 1
+
+
+class OrcamentoEsgotado(Exception):
+    """O modelo não teve orçamento dentro de LLM_ESPERA_MAX_S."""
+
+
+def _parse_limites(config: str) -> Dict[str, Tuple[int, int]]:
+    limites = {}
+    for item in filter(None, (p.strip() for p in config.split(","))):
+        modelo, _, valores = item.partition("=")
+        rpm, _, tpm = valores.partition(":")
+        limites[modelo.strip()] = (int(rpm), int(tpm))
+    return limites
+
+
+class Balde:
+    def __init__(self, por_minuto: int):
+        self.capacidade = float(por_minuto)
+        self.taxa = por_minuto / 60
+        self.nivel = self.capacidade
+        self.atualizado = time.monotonic()
+
+    def _repor(self) -> None:
+        agora = time.monotonic()
+        self.nivel = min(self.capacidade, self.nivel + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+
+    def espera(self, custo: float, reserva: float = 0.0) -> float:
+        """Segundos até caber `custo` deixando `reserva` (fração da capacidade) no balde."""
+        self._repor()
+        necessario = min(custo, self.capacidade) + reserva * self.capacidade
+        return max(0.0, (necessario - self.nivel) / self.taxa)
+
+    def consumir(self, custo: float) -> None:
+        self._repor()
+        self.nivel -= min(custo, self.capacidade)
+
+    def devolver(self, custo: float) -> None:
+        self._repor()
+        self.nivel = min(self.capacidade, self.nivel + custo)
+
+
+class _LimiteModelo:
+    def __init__(self, rpm: int, tpm: int):
+        self.requisicoes = Balde(rpm)
+        self.tokens = Balde(tpm)
+        self.fila: List[Tuple[int, int]] = []
+        self.condicao = asyncio.Condition()
+
+    def espera(self, custo: int, reserva: float) -> float:
+        return max(self.requisicoes.espera(1, reserva), self.tokens.espera(custo, reserva))
+
+    def consumir(self, custo: int) -> None:
+        self.requisicoes.consumir(1)
+        self.tokens.consumir(custo)
+
+
+class GovernadorLLM:
+    def __init__(self, limites: Optional[Dict[str, Tuple[int, int]]] = None,
+                 reserva_respostas: float = LLM_RESERVA_RESPOSTAS, espera_max: float = LLM_ESPERA_MAX_S):
+        self.limites = limites if limites is not None else _parse_limites(LLM_LIMITES)
+        self.reserva_respostas = reserva_respostas
+        self.espera_max = espera_max
+        self._modelos: Dict[str, _LimiteModelo] = {}
+        self._seq = count()
+
+    def _limite(self, modelo: str) -> Optional[_LimiteModelo]:
+        limite = self._modelos.get(modelo)
+        if limite is None and modelo in self.limites:
+            limite = self._modelos[modelo] = _LimiteModelo(*self.limites[modelo])
+        return limite
+
+    def _reserva(self, prioridade: int) -> float:
+        return self.reserva_respostas if prioridade else 0.0
+
+    async def reservar(self, modelo: str, fase: str, tokens: int) -> None:
+        limite = self._limite(modelo)
+        if limite is None:
+            return
+        prioridade = PRIORIDADES.get(fase, PRIORIDADE_EXTRACAO)
+        entrada = (prioridade, next(self._seq))
+        prazo = time.monotonic() + self.espera_max
+
+        async with limite.condicao:
+            heapq.heappush(limite.fila, entrada)
+            try:
+                while True:
+                    espera = None
+                    if limite.fila[0] == entrada:
+                        espera = limite.espera(tokens, self._reserva(prioridade))
+                        if not espera:
+                            heapq.heappop(limite.fila)
+                            limite.consumir(tokens)
+                            limite.condicao.notify_all()
+                            return
+                    restante = prazo - time.monotonic()
+                    if restante <= 0 or (espera is not None and espera > restante):
+                        raise OrcamentoEsgotado(f"{modelo}: sem orçamento para {tokens} tokens em {self.espera_max}s")
+                    try:
+                        await asyncio.wait_for(limite.condicao.wait(), min(espera or restante, restante))
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                limite.fila.remove(entrada)
+                heapq.heapify(limite.fila)
+                limite.condicao.notify_all()
+                raise
+
+    def tentar_reservar(self, modelo: str, tokens: int) -> bool:
+        """Reserva sem esperar (usada pelo hedge, que só sai se houver folga)."""
+        limite = self._limite(modelo)
+        if limite is None:
+            return True
+        if limite.fila or limite.espera(tokens, self.reserva_respostas):
+            return False
+        limite.consumir(tokens)
+        return True
+
+    def ajustar(self, modelo: str, reservados: int, usados: int) -> None:
+        """Devolve ao balde a diferença entre a estimativa reservada e o uso real."""
+        limite = self._limite(modelo)
+        if limite is not None and reservados > usados:
+            limite.tokens.devolver(reservados - usados)
+
+    def stats(self) -> dict:
+        return {"aguardando": sum(len(limite.fila) for limite in self._modelos.values())}
+
+
+governador_llm = GovernadorLLM()
@@ -0,0 +1,340 @@
+"""
+Gateway único das chamadas de chat à OpenAI (resposta ao paciente, extração do funil, intenção).
+
+- Sessão aiohttp compartilhada pelo processo: sem openai.aiosession, o openai 0.28 abre uma
+  sessão (e uma conexão TLS) nova a cada chamada.
+- Retentativa com backoff exponencial e jitter; quando a API manda Retry-After, ele é respeitado.
+- Circuit breaker por modelo: depois de LLM_CIRCUITO_FALHAS falhas seguidas o modelo é pulado
+  por LLM_CIRCUITO_ABERTO_S e as chamadas vão direto para o fallback.
+- Hedge opcional: se a chamada não responde em LLM_HEDGE_APOS_S, dispara outra igual e fica com
+  a que chegar primeiro (no stream, conta até a abertura da resposta).
+- Orçamento de RPM/TPM por modelo (governador_llm) reservado antes de cada chamada; o consumo de
+  tokens por cliente vai para /metrics.
+"""
+import time
+import random
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import aiohttp
+import openai
+
+from app.config.config import (
+    LLM_REQUEST_TIMEOUT, LLM_MAX_CONEXOES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+    LLM_CIRCUITO_FALHAS, LLM_CIRCUITO_ABERTO_S, LLM_HEDGE_APOS_S
+)
+from app.services.governador_llm import GovernadorLLM, governador_llm, OrcamentoEsgotado
+from app.utils.logger import logger
+from app.utils.metrics import metricas
+from app.utils.tokens import contar_tokens
+
+# Erros do pedido em si: repetir com o mesmo modelo não adianta
+ERROS_DEFINITIVOS = (
+    openai.error.InvalidRequestError, openai.error.AuthenticationError, openai.error.PermissionError
+)
+# Vão direto para o modelo de fallback, sem backoff
+ERROS_SEM_RETENTATIVA = ERROS_DEFINITIVOS + (OrcamentoEsgotado,)
+
+
+class FalhaLLM(Exception):
+    """Todas as tentativas, inclusive a do modelo de fallback, falharam."""
+
+
+class StreamInterrompido(Exception):
+    """O stream caiu depois de parte da resposta já ter sido entregue; repetir duplicaria mensagens."""
+
+    def __init__(self, parcial: str):
+        super().__init__("stream interrompido após envio parcial")
+        self.parcial = parcial
+
+
+class FalhaEntrega(Exception):
+    """O ao_delta (quem recebe os pedaços do stream) falhou; não é erro do modelo, não se repete a chamada."""
+
+
+class Circuito:
+    def __init__(self, falhas_max: int = LLM_CIRCUITO_FALHAS, aberto_s: float = LLM_CIRCUITO_ABERTO_S):
+        self.falhas_max = falhas_max
+        self.aberto_s = aberto_s
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self.testando = False
+
+    @property
+    def aberto(self) -> bool:
+        return self.falhas >= self.falhas_max
+
+    def disponivel(self) -> bool:
+        if not self.aberto:
+            return True
+        if self.testando or time.monotonic() < self.aberto_ate:
+            return False
+        # Meio-aberto: deixa passar uma chamada de teste
+        self.testando = True
+        return True
+
+    def sucesso(self) -> None:
+        self.falhas = 0
+        self.testando = False
+
+    def falha(self) -> None:
+        self.falhas += 1
+        self.testando = False
+        if self.aberto:
+            self.aberto_ate = time.monotonic() + self.aberto_s
+
+    def liberar(self) -> None:
+        self.testando = False
+
+
+class GatewayLLM:
+    def __init__(self, timeout: float = LLM_REQUEST_TIMEOUT, max_conexoes: int = LLM_MAX_CONEXOES,
+                 backoff_base: float = LLM_BACKOFF_BASE, backoff_max: float = LLM_BACKOFF_MAX,
+                 hedge_apos_s: float = LLM_HEDGE_APOS_S, governador: GovernadorLLM = governador_llm):
+        self.timeout = timeout
+        self.max_conexoes = max_conexoes
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_apos_s = hedge_apos_s
+        self.governador = governador
+        self._circuitos: Dict[str, Circuito] = {}
+        self._sessao: Optional[aiohttp.ClientSession] = None
+        # Streams das chamadas descartadas pelo hedge sendo lidos até o fim
+        self._descartes: Set[asyncio.Future] = set()
+
+    def sessao(self) -> aiohttp.ClientSession:
+        if self._sessao is None or self._sessao.closed:
+            self._sessao = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_conexoes))
+        return self._sessao
+
+    async def aclose(self) -> None:
+        for descarte in list(self._descartes):
+            descarte.cancel()
+        if self._sessao is not None and not self._sessao.closed:
+            await self._sessao.close()
+        self._sessao = None
+
+    def circuito(self, modelo: str) -> Circuito:
+        circuito = self._circuitos.get(modelo)
+        if circuito is None:
+            circuito = self._circuitos[modelo] = Circuito()
+        return circuito
+
+    @staticmethod
+    def _retry_after(erro: Exception) -> Optional[float]:
+        headers = {str(k).lower(): v for k, v in (getattr(erro, "headers", None) or {}).items()}
+        try:
+            if "retry-after-ms" in headers:
+                return float(headers["retry-after-ms"]) / 1000
+            if "retry-after" in headers:
+                return float(headers["retry-after"])
+        except (TypeError, ValueError):
+            pass
+        return None
+
+    def _espera(self, tentativa: int, erro: Exception) -> Optional[float]:
+        """Segundos até a próxima tentativa com o mesmo modelo; None = não vale esperar, ir ao fallback."""
+        retry_after = self._retry_after(erro)
+        if retry_after is not None:
+            return retry_after if retry_after <= self.backoff_max else None
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** tentativa))
+
+    @staticmethod
+    def _estimar_tokens(mensagens: List[Dict], modelo: str) -> int:
+        # ~4 tokens de formatação por mensagem e 3 de abertura da resposta
+        return sum(contar_tokens(m.get("content") or "", modelo) + 4 for m in mensagens) + 3
+
+    async def _com_hedge(self, fase: str, chamada: Callable[[], Awaitable[Any]],
+                         pode_duplicar: Callable[[], bool], devolver_duplicata: Callable[[], None]) -> Any:
+        """
+        `pode_duplicar` reserva o orçamento da chamada extra; `devolver_duplicata` devolve o que
+        sobra dessa reserva quando a chamada extra saiu (uma das duas sempre é descartada).
+        """
+        if not self.hedge_apos_s:
+            return await chamada()
+
+        tarefas = [asyncio.ensure_future(chamada())]
+        vencedora: Optional[asyncio.Future] = None
+        duplicou = False
+        try:
+            feitas, pendentes = await asyncio.wait(tarefas, timeout=self.hedge_apos_s)
+            if not feitas and pode_duplicar():
+                duplicou = True
+                metricas.hedges.incrementar(fase=fase)
+                tarefas.append(asyncio.ensure_future(chamada()))
+                pendentes.add(tarefas[-1])
+            while pendentes:
+                feitas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+                vencedora = next((tarefa for tarefa in feitas if tarefa.exception() is None), None)
+                if vencedora is not None:
+                    return vencedora.result()
+            # Sem hedge, ou as duas falharam: resultado (ou erro) da primeira
+            vencedora = tarefas[0]
+            return vencedora.result()
+        finally:
+            for tarefa in tarefas:
+                if tarefa is not vencedora:
+                    tarefa.cancel()
+                    tarefa.add_done_callback(self._descartar_resposta)
+            if duplicou:
+                devolver_duplicata()
+
+    def _descartar_resposta(self, tarefa: asyncio.Future) -> None:
+        """A chamada perdedora do hedge que chegou a responder: no stream, a conexão ainda está aberta."""
+        if tarefa.cancelled() or tarefa.exception() is not None:
+            return
+        resposta = tarefa.result()
+        if hasattr(resposta, "__aiter__"):
+            descarte = asyncio.ensure_future(self._drenar(resposta))
+            self._descartes.add(descarte)
+            descarte.add_done_callback(self._descartes.discard)
+
+    async def _drenar(self, resposta: Any) -> None:
+        # O openai 0.28 não expõe o close da resposta: lê até o fim para a conexão voltar ao pool
+        async def ler() -> None:
+            async for _ in resposta:
+                pass
+
+        try:
+            await asyncio.wait_for(ler(), self.timeout)
+        except Exception:
+            await resposta.aclose()
+
+    @staticmethod
+    async def _consumir(resposta: Any, ao_delta: Callable[[str], Awaitable[Any]],
+                        pode_repetir: Optional[Callable[[], bool]]) -> str:
+        partes: List[str] = []
+        iterador = resposta.__aiter__()
+        while True:
+            # Só a leitura do stream conta como falha do modelo
+            try:
+                chunk = await iterador.__anext__()
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                if pode_repetir is not None and not pode_repetir():
+                    raise StreamInterrompido("".join(partes)) from e
+                raise
+            delta = chunk.choices[0].delta.get("content") if chunk.choices else None
+            if delta:
+                partes.append(delta)
+                try:
+                    await ao_delta(delta)
+                except Exception as e:
+                    await iterador.aclose()
+                    raise FalhaEntrega(f"falha ao entregar a resposta em stream: {e}") from e
+        return "".join(partes)
+
+    def _contabilizar(self, fase: str, modelo: str, resposta: Any, texto: str, tokens_prompt: int,
+                      reservados: int) -> None:
+        uso = resposta.get("usage") if hasattr(resposta, "get") else None
+        if uso:
+            tokens_prompt, tokens_resposta = uso.get("prompt_tokens", tokens_prompt), uso.get("completion_tokens", 0)
+        else:
+            # Stream não traz usage: estimativa local
+            tokens_resposta = contar_tokens(texto, modelo)
+        metricas.tokens.incrementar(tokens_prompt, fase=fase, modelo=modelo, tipo="prompt")
+        metricas.tokens.incrementar(tokens_resposta, fase=fase, modelo=modelo, tipo="resposta")
+        self.governador.ajustar(modelo, reservados, tokens_prompt + tokens_resposta)
+
+    async def _chamar(self, fase: str, modelo: str, mensagens: List[Dict], params: dict, tokens_prompt: int,
+                      ao_delta: Optional[Callable[[str], Awaitable[Any]]],
+                      pode_repetir: Optional[Callable[[], bool]]) -> str:
+        circuito = self.circuito(modelo)
+        stream = ao_delta is not None
+        reservados = tokens_prompt + (params.get("max_tokens") or 0)
+        reservado = False
+        # A reserva fica dentro do try: se ela falhar, a vaga de teste do circuito meio-aberto é liberada
+        try:
+            with metricas.medir("orcamento_llm", origem=modelo):
+                await self.governador.reservar(modelo, fase, reservados)
+            reservado = True
+            openai.aiosession.set(self.sessao())
+            with metricas.medir(fase, origem=f"{modelo}:stream" if stream else modelo):
+                resposta = await self._com_hedge(
+                    fase,
+                    lambda: openai.ChatCompletion.acreate(
+                        model=modelo, messages=mensagens, request_timeout=self.timeout, stream=stream, **params),
+                    lambda: self.governador.tentar_reservar(modelo, reservados),
+                    # O prompt da chamada descartada já foi enviado e conta no TPM da conta
+                    lambda: self.governador.ajustar(modelo, reservados, tokens_prompt))
+                if stream:
+                    texto = await self._consumir(resposta, ao_delta, pode_repetir)
+                else:
+                    texto = resposta.choices[0].message.content
+        except ERROS_DEFINITIVOS:
+            # O modelo respondeu; o problema é o pedido
+            circuito.sucesso()
+            self.governador.ajustar(modelo, reservados, tokens_prompt)
+            raise
+        except OrcamentoEsgotado:
+            # A chamada nem saiu: não conta como falha do modelo
+            circuito.liberar()
+            raise
+        except FalhaEntrega:
+            # O modelo respondeu; falhou quem recebia o stream (ex.: Redis do envio)
+            circuito.sucesso()
+            self.governador.ajustar(modelo, reservados, tokens_prompt)
+            raise
+        except asyncio.CancelledError:
+            circuito.liberar()
+            if reservado:
+                self.governador.ajustar(modelo, reservados, tokens_prompt)
+            raise
+        except Exception:
+            circuito.falha()
+            self.governador.ajustar(modelo, reservados, tokens_prompt)
+            if circuito.aberto:
+                logger.warning("[GatewayLLM] Circuito de %s aberto por %ss", modelo, circuito.aberto_s)
+            raise
+        circuito.sucesso()
+        texto = (texto or "").strip()
+        self._contabilizar(fase, modelo, resposta, texto, tokens_prompt, reservados)
+        return texto
+
+    async def completar(self, fase: str, mensagens: List[Dict], modelo: str, modelo_fallback: str,
+                        tentativas: int = 3, ao_delta: Optional[Callable[[str], Awaitable[Any]]] = None,
+                        pode_repetir: Optional[Callable[[], bool]] = None, **params) -> str:
+        """
+        As primeiras `tentativas - 1` chamadas usam `modelo` e a última, `modelo_fallback` (antes, se o
+        circuito do principal estiver aberto ou o erro for do pedido). Com `ao_delta` a resposta vem
+        em stream e cada pedaço é repassado a ele; `pode_repetir` é chamado quando o stream cai e
+        diz se ainda dá para recomeçar. Levanta FalhaLLM se nada der certo.
+        """
+        principal = tentativas - 1
+        tokens_prompt = self._estimar_tokens(mensagens, modelo)
+        erro: Optional[Exception] = None
+        i = 0
+        while True:
+            usar_principal = i < principal and self.circuito(modelo).disponivel()
+            modelo_tentativa = modelo if usar_principal else modelo_fallback
+            if not usar_principal and principal:
+                metricas.fallbacks.incrementar(fase=fase, modelo=modelo_fallback)
+            try:
+                return await self._chamar(fase, modelo_tentativa, mensagens, params, tokens_prompt, ao_delta, pode_repetir)
+            except (StreamInterrompido, FalhaEntrega):
+                raise
+            except Exception as e:
+                erro = e
+                logger.error("[GatewayLLM] %s: erro (tentativa %s, modelo %s): %s", fase, i + 1, modelo_tentativa, e)
+                if not usar_principal:
+                    break
+
+            metricas.retentativas.incrementar(fase=fase)
+            espera = None if isinstance(erro, ERROS_SEM_RETENTATIVA) else self._espera(i, erro)
+            if espera is None:
+                i = principal
+                continue
+            await asyncio.sleep(espera)
+            i += 1
+
+        raise FalhaLLM(f"{fase}: sem resposta de {modelo} nem de {modelo_fallback}") from erro
+
+    def stats(self) -> dict:
+        return {
+            "circuitos_abertos": sum(1 for c in self._circuitos.values() if c.aberto),
+            "aguardando_orcamento": self.governador.stats()["aguardando"],
+        }
+
+
+gateway_llm = GatewayLLM()
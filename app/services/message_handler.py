@@ -1,4 +1,5 @@
 import time
+import asyncio
 import openai
 
 from app.config.config import API_KEY_OPENAI
@@ -12,7 +13,11 @@ from app.models.funnel_service import FunnelService
 from app.models.user_info import UserInfoService
 from app.models.user_updater_service import UserInfoUpdater, FallbackLLM
 from app.models.developer_mode import DeveloperMode
+from app.models.prompt_context import ContextoHistorico
+from app.models.semantic_cache import cache_semantico
+from app.services.agendador import agendador
 from app.utils.logger import logger
+from app.utils.metrics import metricas, definir_cliente
 
 openai.api_key = API_KEY_OPENAI
 
@@ -21,21 +26,25 @@ async def process_message(body: dict) -> dict:
     start_time = time.monotonic()
 
     # Recebe a cria objeto com informações do webhook.
-    webhook = WebhookMessage(**body)
+    with metricas.medir("webhook_parse") as medicao:
+        webhook = WebhookMessage(**body)
+        medicao.cliente = webhook.connectedPhone
+    # Rótulo de cliente das métricas de todas as fases desta mensagem
+    definir_cliente(webhook.connectedPhone)
 
     if webhook.isGroup or webhook.isEdit:
-        logger.info(f"[🔕 Ignorado] Mensagem recebida de {webhook.phone}")
+        logger.info("[🔕 Ignorado] Mensagem recebida de %s", webhook.phone)
         elapsed = time.monotonic() - start_time
         logger.info(
-            f"[⏱️ Tempo de execução total, BOT*{webhook.fromMe}* - {webhook.connectedPhone}]: {elapsed:.3f} segundos")
+            "[⏱️ Tempo de execução total, BOT*%s* - %s]: %.3f segundos", webhook.fromMe, webhook.connectedPhone, elapsed)
         return
 
     # Objeto com métodos e atributos das configurações dos nossos cliente.
     config_info = ConfigService(webhook.connectedPhone)
-    await config_info.get()
 
-    # DEV MODE
+    # DEV MODE (antes de qualquer carga do usuário, para não repopular o que será apagado)
     if webhook.mensagem_texto in ("/adminresetuser", "/adminresetclient"):
+        await config_info.get()
         dev = DeveloperMode(webhook.connectedPhone, webhook.phone)
         try:
             reset_info = await dev.developer_mode(webhook.mensagem_texto)
@@ -49,68 +58,113 @@ async def process_message(body: dict) -> dict:
 
     # Objeto com métodos e atributos do histórico de conversas.
     historico = HistoricoConversas(webhook.connectedPhone, webhook.phone)
-    await historico.carregar()
+    funnel_info = FunnelService(webhook.connectedPhone)
 
-    # Tratamento da mensagem (Audio e Debouncer)
-    webhook_process = WebhookProcessor(
-        webhook, config_info.tempo_espera_debounce)
-    await webhook_process.processar()
+    # Grafo de cargas: config e histórico em paralelo; o funil (só depende do cliente)
+    # segue em paralelo também durante a espera do debounce. O user_info depende do
+    # funil e é lido após o debounce, para enxergar o estado gravado pelo lote anterior.
+    funnel_task = asyncio.create_task(funnel_info.get())
+    try:
+        await asyncio.gather(config_info.get(), historico.carregar())
+
+        # Tratamento da mensagem (Audio e Debouncer)
+        webhook_process = WebhookProcessor(
+            webhook, config_info.tempo_espera_debounce)
+        await webhook_process.processar()
+
+        # Outro fragmento (neste ou em outro worker) ficou com o debounce da conversa.
+        if webhook_process.descartada:
+            elapsed = time.monotonic() - start_time
+            logger.info(
+                "[⏱️ Tempo de execução total, BOT*%s* - %s]: %.3f segundos", webhook.fromMe, webhook.connectedPhone, elapsed)
+            return
 
-    funnel_info = FunnelService(webhook.connectedPhone)
-    await funnel_info.get()
+        await funnel_task
+    finally:
+        if not funnel_task.done():
+            funnel_task.cancel()
 
     user_info = UserInfoService(
         webhook.connectedPhone, webhook.phone, funnel_info.funnel)
     await user_info.get()
 
+    # Histórico formatado uma vez e reutilizado por todas as chamadas LLM desta mensagem
+    contexto_historico = ContextoHistorico(historico.mensagens)
+
     updater = UserInfoUpdater(mensagem=webhook_process.mensagem_consolidada, user_info=user_info.user_info, funnel_info=funnel_info.funnel,
-                              telefone_cliente=webhook.connectedPhone, telefone_usuario=webhook.phone, historico=historico.mensagens)
+                              telefone_cliente=webhook.connectedPhone, telefone_usuario=webhook.phone, historico=contexto_historico)
 
     # Só processa se a mensagem não for do próprio bot/assistente
     if not webhook.fromMe and webhook_process.mensagem_consolidada != "":
-        # Responsável por atualizar os dados do cliente (UserInfo)
-        await updater.process()
+        # Só a metade LLM/resposta ocupa vaga do agendador (o debounce já terminou)
+        async with agendador.vaga(webhook.connectedPhone):
+            # Responsável por atualizar os dados do cliente (UserInfo)
+            await updater.process()
 
-        # Checa horário de atendimento.
-        horario_atendimento_permitido = config_info.time_window()
-        logger.info(
-            f"Time Window - {webhook.connectedPhone}-{webhook.phone}: {horario_atendimento_permitido}")
-        tipo_cliente = updater.user_info.state
-
-        if horario_atendimento_permitido:
-            if tipo_cliente != ('atendimento_humano'):
-
-                chunks = BuscadorChunks(
-                    config_info.pinecone_index_name, config_info.pinecone_namespace)
-                await chunks.buscar(webhook_process.mensagem_consolidada, historico.mensagens_usuario)
-
-                chat_input = ChatInput(
-                    mensagem=webhook_process.mensagem_consolidada,
-                    best_chunks=chunks.best_chunks,
-                    historico=historico.mensagens,
-                    prompt_base=funnel_info.funnel.prompt_base,
-                    prompt_state=updater.response_prompt,
-                    user_data=updater.user_info,
-                    apresentacao_inicial=(
-                        funnel_info.funnel.prompt_apresentacao_inicial if historico.primeiro_contato else None)
-                )
-                responder = ChatResponder(chat_input)
-                await responder.generate()
-
-                prepara_envio = MensagemDispatcher(
-                    webhook.phone, responder.resposta, config_info.zapi_instance_id, config_info.zapi_token)
-                await prepara_envio.enviar_resposta()
-
-            elif tipo_cliente == ('atendimento_humano') and tipo_cliente != updater.original_snapshot.get("state", ""):
-                encerramento = FallbackLLM(webhook_process.mensagem_consolidada, funnel_info.funnel.prompt_encerramento,
-                                           historico.mensagens, temperature=0.4, top_p=0.9, max_tokens=70)
-                resposta = await encerramento.generate_fallback_llm()
-                if resposta:
+            # Checa horário de atendimento.
+            horario_atendimento_permitido = config_info.time_window()
+            logger.info(
+                "Time Window - %s-%s: %s", webhook.connectedPhone, webhook.phone, horario_atendimento_permitido)
+            tipo_cliente = updater.user_info.state
+
+            if horario_atendimento_permitido:
+                if tipo_cliente != ('atendimento_humano'):
+
+                    chunks = BuscadorChunks(
+                        config_info.pinecone_index_name, config_info.pinecone_namespace,
+                        backend=config_info.busca_vetorial)
+                    await chunks.buscar(webhook_process.mensagem_consolidada, historico.mensagens_usuario)
+
+                    chat_input = ChatInput(
+                        mensagem=webhook_process.mensagem_consolidada,
+                        best_chunks=chunks.best_chunks,
+                        historico=contexto_historico,
+                        prompt_base=funnel_info.funnel.prompt_base,
+                        prompt_state=updater.response_prompt,
+                        user_data=updater.user_info,
+                        apresentacao_inicial=(
+                            funnel_info.funnel.prompt_apresentacao_inicial if historico.primeiro_contato else None)
+                    )
+                    # Cache semântico: só sem apresentação inicial, e na mesma etapa/prompt do funil
+                    usar_cache = config_info.cache_semantico and not historico.primeiro_contato
+                    assinatura = cache_semantico.assinatura(
+                        updater.user_info.state, updater.response_prompt, funnel_info.funnel.prompt_base)
+                    resposta_cacheada = cache_semantico.buscar(
+                        config_info.pinecone_namespace, assinatura, chunks.embedding,
+                        config_info.cache_semantico_limiar) if usar_cache else None
+
+                    responder = ChatResponder(chat_input)
+                    if resposta_cacheada:
+                        prepara_envio = MensagemDispatcher(
+                            webhook.phone, resposta_cacheada, config_info.zapi_instance_id, config_info.zapi_token,
+                            abreviacoes=config_info.abreviacoes)
+                        await prepara_envio.enviar_resposta()
+                    elif config_info.resposta_streaming:
+                        prepara_envio = MensagemDispatcher(
+                            webhook.phone, "", config_info.zapi_instance_id, config_info.zapi_token,
+                            abreviacoes=config_info.abreviacoes)
+                        await responder.generate_stream(prepara_envio)
+                    else:
+                        await responder.generate()
+
+                        prepara_envio = MensagemDispatcher(
+                            webhook.phone, responder.resposta, config_info.zapi_instance_id, config_info.zapi_token,
+                            abreviacoes=config_info.abreviacoes)
+                        await prepara_envio.enviar_resposta()
+
+                    if usar_cache and not resposta_cacheada and responder.completa:
+                        cache_semantico.guardar(
+                            webhook.connectedPhone, config_info.pinecone_namespace, assinatura,
+                            chunks.embedding, responder.resposta, updater.user_info.data)
+
+                elif tipo_cliente == ('atendimento_humano') and tipo_cliente != updater.original_snapshot.get("state", ""):
+                    encerramento = FallbackLLM(webhook_process.mensagem_consolidada, funnel_info.funnel.prompt_encerramento,
+                                               contexto_historico, temperature=0.4, top_p=0.9, max_tokens=70)
+                    resposta = await encerramento.generate_fallback_llm()
                     prepara_envio = MensagemDispatcher(
-                        webhook.phone, resposta, config_info.zapi_instance_id, config_info.zapi_token)
-                else:
-                    prepara_envio = "Obrigada pela informação, seu atendimento será em breve."
-                await prepara_envio.enviar_resposta()
+                        webhook.phone, resposta or "Obrigada pela informação, seu atendimento será em breve.",
+                        config_info.zapi_instance_id, config_info.zapi_token, abreviacoes=config_info.abreviacoes)
+                    await prepara_envio.enviar_resposta()
 
         historico.adicionar_interacao(
             "user", webhook_process.mensagem_consolidada)
@@ -123,12 +177,12 @@ async def process_message(body: dict) -> dict:
 
         if config_info.desativar_assistente(webhook_process.mensagem_consolidada):
             logger.info(
-                f"Parando assistente, humando em atendimento, palavra chave ativada.")
+                "Parando assistente, humando em atendimento, palavra chave ativada.")
             await updater.change_state()
 
     else:
         logger.info(
-            f"[🔕 IGNORADO] Mensagem do próprio bot/assistente: {webhook.phone} - {webhook.connectedPhone}")
+            "[🔕 IGNORADO] Mensagem do próprio bot/assistente: %s - %s", webhook.phone, webhook.connectedPhone)
         # funnel_result = await process_user_funnel(conversation['mensagem'], conversation['numero'], conversation['telefone_empresa'], conversation['nome_cliente'])
         # logger.info(f"[🚀 CONFIG_INFO ]\n {config_info} \n[🚀 CONFIG_INFO ]")
         # logger.info(f"[🚀 WEBHOOK_INFO ]\n {webhook_info} \n[🚀 WEBHOOK_INFO ]")
@@ -143,4 +197,4 @@ async def process_message(body: dict) -> dict:
 
     elapsed = time.monotonic() - start_time
     logger.info(
-        f"[⏱️ Tempo de execução total, BOT*{webhook.fromMe}*]: {elapsed:.3f} segundos")
+        "[⏱️ Tempo de execução total, BOT*%s*]: %.3f segundos", webhook.fromMe, elapsed)
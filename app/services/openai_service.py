@@ -1,9 +1,7 @@
-import requests
 import openai
-import os
 
 from app.config.config import API_KEY_OPENAI
-from app.utils.logger import logger
+from app.services.transcricao_service import transcricao_service
 
 # Inicializa APIs
 openai.api_key = API_KEY_OPENAI
@@ -14,18 +12,6 @@ async def extract_message_content(received_webhook: dict) -> str | None:
 
     # Se for áudio recebido
     if audio := received_webhook.url_audio:
-        try:
-            r = requests.get(audio)
-            with open("/tmp/audio.ogg", "wb") as f:
-                f.write(r.content)
-
-            with open("/tmp/audio.ogg", "rb") as audio_file:
-                transcription = openai.Audio.transcribe("whisper-1", audio_file)
-
-            mensagem = transcription.get("text")
-            return mensagem.strip() if mensagem else None
-        except Exception as e:
-            logger.exception(f"[ERRO AO TRANSCREVER ÁUDIO] {e}")
-            return None
+        return await transcricao_service.transcrever(audio)
 
     return None
\ No newline at end of file
@@ -0,0 +1,89 @@
+import io
+import asyncio
+import hashlib
+import httpx
+import openai
+from typing import Any, Optional
+
+from app.config.config import AUDIO_MAX_BYTES, AUDIO_TRANSCRICOES_SIMULTANEAS, AUDIO_CACHE_TTL
+from app.config.redis_client import redis_client
+from app.config.http_client import HttpClientPool, http_pool
+from app.utils.logger import logger
+
+
+class AudioMuitoGrande(Exception):
+    pass
+
+
+class TranscricaoService:
+    """
+    Baixa o áudio em streaming (cliente "audio" do pool HTTP) para a memória, sem arquivo
+    compartilhado em /tmp, transcreve com concorrência limitada e guarda o texto no Redis por URL e por hash do conteúdo.
+    """
+
+    def __init__(self, redis_client: Any = redis_client, max_bytes: int = AUDIO_MAX_BYTES,
+                 simultaneas: int = AUDIO_TRANSCRICOES_SIMULTANEAS, cache_ttl: int = AUDIO_CACHE_TTL,
+                 modelo: str = "whisper-1", http_pool: HttpClientPool = http_pool):
+        self.redis = redis_client
+        self.http_pool = http_pool
+        self.max_bytes = max_bytes
+        self.semaforo = asyncio.Semaphore(simultaneas)
+        self.cache_ttl = cache_ttl
+        self.modelo = modelo
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self.http_pool.get("audio")
+
+    @staticmethod
+    def _chave_url(url: str) -> str:
+        return f"transcricao:url:{hashlib.sha1(url.encode('utf-8')).hexdigest()}"
+
+    @staticmethod
+    def _chave_conteudo(conteudo: bytes) -> str:
+        return f"transcricao:sha:{hashlib.sha256(conteudo).hexdigest()}"
+
+    async def baixar(self, url: str) -> bytes:
+        buffer = bytearray()
+        async with self.client.stream("GET", url) as resp:
+            resp.raise_for_status()
+            tamanho = int(resp.headers.get("content-length") or 0)
+            if tamanho > self.max_bytes:
+                raise AudioMuitoGrande(f"Áudio com {tamanho} bytes excede o limite de {self.max_bytes}")
+            async for bloco in resp.aiter_bytes():
+                buffer.extend(bloco)
+                if len(buffer) > self.max_bytes:
+                    raise AudioMuitoGrande(f"Áudio excede o limite de {self.max_bytes} bytes")
+        return bytes(buffer)
+
+    async def _transcrever_bytes(self, conteudo: bytes) -> str:
+        arquivo = io.BytesIO(conteudo)
+        arquivo.name = "audio.ogg"  # a API usa a extensão para identificar o formato
+        async with self.semaforo:
+            transcription = await openai.Audio.atranscribe(self.modelo, arquivo)
+        return (transcription.get("text") or "").strip()
+
+    async def transcrever(self, url: str) -> Optional[str]:
+        chave_url = self._chave_url(url)
+        try:
+            if cache := await self.redis.get(chave_url):
+                return cache
+        except Exception as e:
+            logger.warning("[Transcrição] Falha ao ler cache: %s", e)
+
+        try:
+            conteudo = await self.baixar(url)
+            chave_conteudo = self._chave_conteudo(conteudo)
+            texto = await self.redis.get(chave_conteudo)
+            if not texto:
+                texto = await self._transcrever_bytes(conteudo)
+            if texto:
+                await self.redis.set(chave_url, texto, ex=self.cache_ttl)
+                await self.redis.set(chave_conteudo, texto, ex=self.cache_ttl)
+            return texto or None
+        except Exception as e:
+            logger.exception("[ERRO AO TRANSCREVER ÁUDIO] %s", e)
+            return None
+
+
+transcricao_service = TranscricaoService()
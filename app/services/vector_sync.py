@@ -0,0 +1,54 @@
+"""
+Exporta um namespace do Pinecone para o backend de busca local (NumPy).
+
+Uso:
+    python -m app.services.vector_sync <pinecone_index_name> <pinecone_namespace> [<namespace> ...]
+"""
+import sys
+import asyncio
+import argparse
+from typing import List
+
+from app.config.pinecone_client import pinecone_indices
+from app.models.local_vector_store import LocalVectorStore, local_vector_store
+from app.models.semantic_cache import PREFIXO_CONHECIMENTO
+from app.utils.local_cache import publicar_invalidacao
+from app.utils.logger import logger
+
+
+def exportar_namespace(index_name: str, namespace: str, store: LocalVectorStore = local_vector_store, lote: int = 100) -> int:
+    index = pinecone_indices.get(index_name)
+
+    ids: List[str] = []
+    for pagina in index.list(namespace=namespace):
+        ids.extend(pagina)
+
+    vetores, metadados, ids_ok = [], [], []
+    for i in range(0, len(ids), lote):
+        resp = index.fetch(ids=ids[i:i + lote], namespace=namespace)
+        for vid, vetor in resp.vectors.items():
+            ids_ok.append(vid)
+            vetores.append(vetor.values)
+            metadados.append(dict(vetor.metadata or {}))
+
+    store.salvar(namespace, ids_ok, vetores, metadados)
+    logger.info("[VectorSync] %s/%s: %s vetores exportados para %s", index_name, namespace, len(ids_ok), store.diretorio)
+    return len(ids_ok)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Sincroniza namespaces do Pinecone para a busca local.")
+    parser.add_argument("index_name")
+    parser.add_argument("namespaces", nargs="+")
+    args = parser.parse_args(argv)
+
+    for namespace in args.namespaces:
+        exportar_namespace(args.index_name, namespace)
+
+    # Base de conhecimento mudou: respostas em cache semântico desses namespaces ficam inválidas
+    asyncio.run(publicar_invalidacao(*(f"{PREFIXO_CONHECIMENTO}{ns}" for ns in args.namespaces)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""
+Serialização dos objetos guardados no Redis (config, funil, user_info, histórico).
+
+Formato v1: um byte de versão seguido de JSON compacto em UTF-8 gerado pelo orjson (sem espaços
+e sem escapar acentos). Valores sem o byte de versão são o JSON antigo (json.dumps) e continuam
+legíveis, então as chaves migram sozinhas na próxima gravação. O v1 é UTF-8 válido e funciona
+também no cliente com decode_responses=True.
+"""
+import json
+from typing import Any, Union
+
+from app.utils.logger import logger
+
+try:
+    import orjson
+except ImportError:  # mesmo formato, só mais lento
+    orjson = None
+    logger.warning("orjson não instalado: codec do cache usando json da biblioteca padrão")
+
+VERSAO_1 = b"\x01"
+_VERSAO_1_STR = VERSAO_1.decode()
+
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _loads(dados: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(dados)
+    return json.loads(dados)
+
+
+def codificar(obj: Any) -> bytes:
+    return VERSAO_1 + _dumps(obj)
+
+
+def decodificar(raw: Union[bytes, str]) -> Any:
+    if isinstance(raw, str):
+        return _loads(raw[1:]) if raw.startswith(_VERSAO_1_STR) else _loads(raw)
+    return _loads(raw[1:]) if raw.startswith(VERSAO_1) else _loads(raw)
@@ -0,0 +1,54 @@
+from typing import Any, Optional
+
+from app.config.config import WEBHOOK_DEDUP_TTL, WEBHOOK_DEDUP_LOCAL_MAX
+from app.config.redis_client import redis_client
+from app.utils.local_cache import LocalCache
+from app.utils.metrics import metricas
+from app.utils.logger import logger
+
+
+class DeduplicadorWebhook:
+    """
+    Descarta reentregas do mesmo webhook (a Z-API reenvia quando não recebe o 200 a tempo).
+    Filtro local de ids recentes (LRU) na frente de um SET NX com TTL no Redis, que vale entre workers.
+    Sem messageId, ou com o Redis fora, a mensagem segue (melhor duplicar que perder).
+    """
+
+    def __init__(self, redis_client: Any = redis_client, ttl: int = WEBHOOK_DEDUP_TTL,
+                 max_local: int = WEBHOOK_DEDUP_LOCAL_MAX):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.recentes = LocalCache(maxsize=max_local, ttl=ttl)
+
+    @staticmethod
+    def _chave(body: dict) -> Optional[str]:
+        message_id = body.get("messageId")
+        if not message_id:
+            return None
+        return f"webhook:dedup:{body.get('connectedPhone', '')}:{message_id}"
+
+    async def primeira_entrega(self, body: dict) -> bool:
+        chave = self._chave(body)
+        if chave is None:
+            return True
+
+        cliente = body.get("connectedPhone", "")
+        if self.recentes.get(chave):
+            metricas.duplicados.incrementar(cliente=cliente, origem="local")
+            return False
+
+        try:
+            nova = await self.redis.set(chave, 1, nx=True, ex=self.ttl)
+        except Exception as e:
+            logger.warning("[Dedup] Falha no Redis, seguindo sem deduplicar %s: %s", chave, e)
+            return True
+
+        self.recentes.set(chave, True)
+        if not nova:
+            metricas.duplicados.incrementar(cliente=cliente, origem="redis")
+            logger.info("[♻️ Webhook duplicado descartado] %s", chave)
+            return False
+        return True
+
+
+deduplicador = DeduplicadorWebhook()
@@ -0,0 +1,84 @@
+import re
+import hashlib
+import numpy as np
+from typing import Any, List, Optional
+from unidecode import unidecode
+
+from app.config.config import EMBEDDING_CACHE_TTL, EMBEDDING_CACHE_LOCAL_TTL, EMBEDDING_CACHE_MAXSIZE
+from app.config.redis_client import redis_binary_client
+from app.utils.local_cache import LocalCache
+from app.utils.logger import logger
+
+_ESPACOS = re.compile(r"\s+")
+
+
+def normalizar_query(texto: str) -> str:
+    return _ESPACOS.sub(" ", unidecode(texto or "")).strip().lower()
+
+
+class EmbeddingCache:
+    """
+    Cache de embeddings em dois níveis: LRU local (por processo) e Redis (compartilhado).
+    A chave é o modelo + hash da query normalizada; o vetor é guardado como bytes float32.
+    """
+
+    def __init__(self, redis_client: Any = redis_binary_client, ttl: int = EMBEDDING_CACHE_TTL,
+                 local_cache: Optional[LocalCache] = None):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.local = local_cache or LocalCache(maxsize=EMBEDDING_CACHE_MAXSIZE, ttl=EMBEDDING_CACHE_LOCAL_TTL)
+        self.hits_local = 0
+        self.hits_redis = 0
+        self.misses = 0
+
+    @staticmethod
+    def chave(model: str, query: str) -> str:
+        digest = hashlib.sha1(normalizar_query(query).encode("utf-8")).hexdigest()
+        return f"embedding:{model}:{digest}"
+
+    async def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = self.chave(model, query)
+        vetor = self.local.get(key)
+        if vetor is not None:
+            self.hits_local += 1
+            return vetor.tolist()
+
+        try:
+            raw = await self.redis.get(key)
+        except Exception as e:
+            logger.warning("[EmbeddingCache] Falha ao ler %s: %s", key, e)
+            raw = None
+
+        if raw:
+            vetor = np.frombuffer(raw, dtype=np.float32)
+            self.local.set(key, vetor)
+            self.hits_redis += 1
+            return vetor.tolist()
+
+        self.misses += 1
+        return None
+
+    async def set(self, model: str, query: str, embedding: List[float]) -> None:
+        key = self.chave(model, query)
+        vetor = np.asarray(embedding, dtype=np.float32)
+        self.local.set(key, vetor)
+        try:
+            await self.redis.set(key, vetor.tobytes(), ex=self.ttl)
+        except Exception as e:
+            logger.warning("[EmbeddingCache] Falha ao gravar %s: %s", key, e)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits_local + self.hits_redis + self.misses
+        return (self.hits_local + self.hits_redis) / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits_local": self.hits_local,
+            "hits_redis": self.hits_redis,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio, 4),
+        }
+
+
+embedding_cache = EmbeddingCache()
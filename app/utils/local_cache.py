@@ -0,0 +1,99 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
+
+from app.config.config import LOCAL_CACHE_TTL, LOCAL_CACHE_MAXSIZE, CACHE_INVALIDATION_CHANNEL
+from app.config.redis_client import redis_client
+from app.utils.logger import logger
+
+# Mensagem especial no canal para limpar todo o cache local.
+INVALIDAR_TUDO = "*"
+
+
+class LocalCache:
+    """
+    Cache em memória (por processo) com TTL e despejo LRU.
+    Guarda os objetos já parseados (ConfigInfo, FunnelInfo...), evitando GET + json.loads por mensagem.
+    """
+
+    def __init__(self, maxsize: int = LOCAL_CACHE_MAXSIZE, ttl: float = LOCAL_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._dados: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._dados.get(key)
+        if item is None:
+            return None
+        expira_em, valor = item
+        if expira_em < time.monotonic():
+            self._dados.pop(key, None)
+            return None
+        self._dados.move_to_end(key)
+        return valor
+
+    def set(self, key: str, valor: Any) -> None:
+        self._dados[key] = (time.monotonic() + self.ttl, valor)
+        self._dados.move_to_end(key)
+        while len(self._dados) > self.maxsize:
+            self._dados.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        if key == INVALIDAR_TUDO:
+            self._dados.clear()
+        else:
+            self._dados.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._dados)
+
+
+local_cache = LocalCache()
+
+# Outros caches locais (ex.: cache semântico) que também reagem às invalidações
+ouvintes_invalidacao: List[Callable[[str], None]] = []
+
+
+def _aplicar_invalidacao(key: str) -> None:
+    local_cache.invalidate(key)
+    for ouvinte in ouvintes_invalidacao:
+        try:
+            ouvinte(key)
+        except Exception as e:
+            logger.warning("[LocalCache] Erro em ouvinte de invalidação (%s): %s", key, e)
+
+
+async def publicar_invalidacao(*keys: str, redis_client: Any = redis_client) -> None:
+    """Invalida as chaves localmente e avisa os demais workers pelo canal pub/sub."""
+    for key in keys:
+        _aplicar_invalidacao(key)
+        try:
+            await redis_client.publish(CACHE_INVALIDATION_CHANNEL, key)
+        except Exception as e:
+            logger.warning("[LocalCache] Falha ao publicar invalidação de %s: %s", key, e)
+
+
+async def escutar_invalidacoes(redis_client: Any = redis_client, intervalo_reconexao: float = 5) -> None:
+    """Loop de fundo (um por processo) que aplica as invalidações publicadas por qualquer worker."""
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+            # Mensagens perdidas durante a desconexão: descarta tudo por segurança.
+            _aplicar_invalidacao(INVALIDAR_TUDO)
+            async for msg in pubsub.listen():
+                if msg.get("type") != "message":
+                    continue
+                data = msg.get("data")
+                _aplicar_invalidacao(data.decode() if isinstance(data, bytes) else data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("[LocalCache] Conexão pub/sub perdida, reconectando: %s", e)
+            await asyncio.sleep(intervalo_reconexao)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
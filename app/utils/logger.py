@@ -1,19 +1,142 @@
 import logging
+import logging.handlers
 import sys
 import os
+import json
+import queue
+import atexit
+import random
+from typing import Any, Dict
+
+from app.config.config import (
+    LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_FILA_MAX, LOG_MAX_CHARS,
+    LOG_PAYLOAD_MAX_CHARS, LOG_PAYLOAD_AMOSTRAGEM
+)
 
 os.makedirs("logs", exist_ok=True)
 
+
+def _truncar(texto: str, limite: int) -> str:
+    if limite and len(texto) > limite:
+        return f"{texto[:limite]}… (+{len(texto) - limite} chars)"
+    return texto
+
+
+class Payload:
+    """
+    Conteúdo grande (body do webhook, prompt, chunks) só convertido em texto na thread de escrita,
+    e cortado em LOG_PAYLOAD_MAX_CHARS.
+    """
+    __slots__ = ("conteudo",)
+
+    def __init__(self, conteudo: Any):
+        self.conteudo = conteudo
+
+    def __str__(self) -> str:
+        conteudo = self.conteudo
+        if isinstance(conteudo, (dict, list)):
+            try:
+                conteudo = json.dumps(conteudo, ensure_ascii=False, default=str)
+            except (TypeError, ValueError):
+                pass
+        return _truncar(str(conteudo), LOG_PAYLOAD_MAX_CHARS)
+
+
+class FormatterJSON(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "nivel": record.levelname,
+            "modulo": record.module,
+            "msg": _truncar(record.getMessage(), LOG_MAX_CHARS),
+        }
+        if record.exc_text:
+            dados["exc"] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False)
+
+
+class FormatterTexto(logging.Formatter):
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = _truncar(record.message, LOG_MAX_CHARS)
+        return super().formatMessage(record)
+
+
+class FiltroPorModulo(logging.Filter):
+    """Nível mínimo por módulo (nome do arquivo, ex.: "openai_service"), configurado em LOG_LEVELS."""
+
+    def __init__(self, nivel_padrao: int, niveis: Dict[str, int]):
+        super().__init__()
+        self.nivel_padrao = nivel_padrao
+        self.niveis = niveis
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.niveis.get(record.module, self.nivel_padrao)
+
+
+class QueueHandlerPreguicoso(logging.handlers.QueueHandler):
+    """
+    Enfileira o record sem formatar: o f-string/%-format, o JSON e o write no stdout ficam todos
+    com a thread do QueueListener. Com a fila cheia o record é descartado em vez de bloquear o loop.
+    """
+
+    descartados = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Traceback formatado aqui: não segura os frames da exceção até a escrita
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            QueueHandlerPreguicoso.descartados += 1
+
+
+def _parse_niveis(config: str) -> Dict[str, int]:
+    niveis = {}
+    for item in filter(None, (p.strip() for p in config.split(","))):
+        modulo, _, nivel = item.partition("=")
+        niveis[modulo.strip()] = logging.getLevelName(nivel.strip().upper())
+    return {m: n for m, n in niveis.items() if isinstance(n, int)}
+
+
+nivel_padrao = logging.getLevelName(LOG_LEVEL)
+if not isinstance(nivel_padrao, int):
+    nivel_padrao = logging.INFO
+niveis_modulo = _parse_niveis(LOG_LEVELS)
+
 logger = logging.getLogger("assistenteinteligente")
-logger.setLevel(logging.INFO)
+# O logger deixa passar o menor nível configurado; o filtro aplica o nível de cada módulo
+logger.setLevel(min([nivel_padrao, *niveis_modulo.values()]))
+logger.addFilter(FiltroPorModulo(nivel_padrao, niveis_modulo))
 
-formatter = logging.Formatter(
-    "[%(asctime)s] [%(levelname)s] %(message)s",
-    datefmt="%d/%m/%Y %H:%M:%S"
-)
+if LOG_FORMAT == "json":
+    formatter = FormatterJSON()
+else:
+    formatter = FormatterTexto(
+        "[%(asctime)s] [%(levelname)s] %(message)s",
+        datefmt="%d/%m/%Y %H:%M:%S"
+    )
 
 console_handler = logging.StreamHandler(sys.stdout)
 console_handler.setFormatter(formatter)
 
-logger.addHandler(console_handler)
-logger.propagate = True
\ No newline at end of file
+fila_logs: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_FILA_MAX)
+listener = logging.handlers.QueueListener(fila_logs, console_handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
+logger.addHandler(QueueHandlerPreguicoso(fila_logs))
+logger.propagate = False
+
+
+def log_payload(titulo: str, conteudo: Any, nivel: int = logging.INFO) -> None:
+    """Log de conteúdo grande: amostrado por LOG_PAYLOAD_AMOSTRAGEM e cortado (ver Payload)."""
+    if not logger.isEnabledFor(nivel):
+        return
+    if LOG_PAYLOAD_AMOSTRAGEM < 1 and random.random() >= LOG_PAYLOAD_AMOSTRAGEM:
+        return
+    logger.log(nivel, "%s %s", titulo, Payload(conteudo), stacklevel=2)
@@ -1,68 +1,70 @@
 import asyncio
-import os
-from redis.asyncio import Redis
-from datetime import datetime
+from typing import Any, Optional
 
 from app.utils.logger import logger
 from app.config.redis_client import redis_client
 
-debounce_tasks = {}
-debounce_futures = {}
-
-
-def _get_redis_key(phone: str, connected_phone: str) -> str:
-    return f"debounce:{phone}:{connected_phone}"
-
-
-async def debounce_and_collect(phone: str, connected_phone: str, mensagem: str, tempo_espera_debounce: int) -> str:
-    redis_key = _get_redis_key(phone, connected_phone)
-
-    task_key = f"{phone}:{connected_phone}"
-
-    # Armazena mensagem
-    await redis_client.rpush(redis_key, mensagem)
-
-    # Se já houver tarefa, cancela e remove
-    if task_key in debounce_tasks:
-        debounce_tasks[task_key].cancel()
-        debounce_tasks.pop(task_key, None)
-
-    if task_key in debounce_futures:
-        debounce_futures.pop(task_key, None)
-
-    # Cria future para aguardar resultado
-    future = asyncio.get_event_loop().create_future()
-    debounce_futures[task_key] = future
-
-    # Agenda nova tarefa debounce
-    debounce_tasks[task_key] = asyncio.create_task(
-        _espera_e_retorna(redis_key, task_key, future, tempo_espera_debounce)
-    )
-
-    # Aguarda resultado final
-    resultado = await future
-    return resultado
-
-
-async def _espera_e_retorna(redis_key: str, task_key: str, future: asyncio.Future, tempo_espera_debounce: int):
-    try:
-        logger.info(f"[⏳ Esperando 5s] {task_key}")
-        await asyncio.sleep(tempo_espera_debounce)
-        logger.info(f"[✅ Tempo de espera concluído]: {tempo_espera_debounce} segundos")
-
-        mensagens = await redis_client.lrange(redis_key, 0, -1)
-        logger.info(f"[📦 Mensagens encontradas] {mensagens}")
-
-        await redis_client.delete(redis_key)
-
-        resultado = ", ".join(mensagens)
-        if not future.done():
-            future.set_result(resultado)
-        else:
-            logger.warning(f"[⚠️ Future já resolvida] {task_key}")
-
-        debounce_tasks.pop(task_key, None)
-        debounce_futures.pop(task_key, None)
-        logger.info(f"[✅ Resultado final enviado] {resultado}")
-    except asyncio.CancelledError:
-        logger.info(f"[🚫 Debounce cancelado] {task_key}")
+# Cada fragmento recebe um token sequencial (INCR) e o buffer/sequência ganham TTL,
+# tudo de forma atômica. Quem chegou por último é o único dono do debounce.
+# Com id (ARGV[3]), o mesmo fragmento reprocessado não entra duas vezes no buffer.
+_LUA_ADICIONAR = """
+if ARGV[1] ~= '' and (ARGV[3] == '' or redis.call('SADD', KEYS[3], ARGV[3]) == 1) then
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+end
+local token = redis.call('INCR', KEYS[2])
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+redis.call('PEXPIRE', KEYS[2], ARGV[2])
+redis.call('PEXPIRE', KEYS[3], ARGV[2])
+return token
+"""
+
+# Flush atômico: só o dono do último token lê e apaga o buffer (sem corrida LRANGE/DELETE).
+_LUA_FLUSH = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return false
+end
+local mensagens = redis.call('LRANGE', KEYS[1], 0, -1)
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+return mensagens
+"""
+
+
+class RedisDebouncer:
+    """
+    Debounce distribuído: o estado (buffer + dono) fica no Redis, então
+    fragmentos da mesma conversa recebidos por workers diferentes disparam
+    um único pipeline.
+    """
+
+    def __init__(self, redis_client: Any = redis_client, prefixo: str = "debounce", margem_ttl_ms: int = 30000):
+        self.redis = redis_client
+        self.prefixo = prefixo
+        self.margem_ttl_ms = margem_ttl_ms
+        self._adicionar = self.redis.register_script(_LUA_ADICIONAR)
+        self._flush = self.redis.register_script(_LUA_FLUSH)
+
+    def _chaves(self, chave: str) -> list:
+        return [f"{self.prefixo}:{chave}", f"{self.prefixo}_seq:{chave}", f"{self.prefixo}_ids:{chave}"]
+
+    async def coletar(self, chave: str, mensagem: Optional[str], espera: float,
+                      id_fragmento: Optional[str] = None) -> Optional[str]:
+        """
+        Armazena o fragmento e aguarda `espera` segundos.
+        Retorna as mensagens consolidadas se este chamador for o dono do debounce,
+        ou None se um fragmento mais recente assumiu a conversa.
+        """
+        chaves = self._chaves(chave)
+        ttl_ms = int(espera * 1000) + self.margem_ttl_ms
+        token = await self._adicionar(keys=chaves, args=[mensagem or "", ttl_ms, id_fragmento or ""])
+
+        await asyncio.sleep(espera)
+
+        mensagens = await self._flush(keys=chaves, args=[token])
+        if mensagens is None:
+            logger.info("[⛔️ Debounce assumido por fragmento mais recente] %s", chave)
+            return None
+
+        return ", ".join(m.decode() if isinstance(m, bytes) else m for m in mensagens)
+
+
+debouncer = RedisDebouncer()
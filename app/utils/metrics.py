@@ -0,0 +1,160 @@
+"""
+Métricas por fase do processamento (histogramas de latência e contadores), expostas em /metrics
+no formato texto do Prometheus. Os valores são por processo.
+
+O cliente (connectedPhone) vem do contexto da mensagem: process_message chama `definir_cliente`
+e toda task/thread criada a partir dali herda o rótulo.
+"""
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+PREFIXO = "assistente"
+BUCKETS_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+cliente_atual: ContextVar[str] = ContextVar("cliente_atual", default="")
+
+
+def definir_cliente(telefone_cliente: str) -> None:
+    cliente_atual.set(telefone_cliente or "")
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(nomes: Sequence[str], valores: Sequence[str], extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class Contador:
+    def __init__(self, nome: str, descricao: str, rotulos: Sequence[str]):
+        self.nome = f"{PREFIXO}_{nome}"
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, valor: float = 1, **rotulos: str) -> None:
+        rotulos.setdefault("cliente", cliente_atual.get())
+        chave = tuple(str(rotulos.get(r, "")) for r in self.rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def exportar(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            for chave, valor in self._valores.items():
+                linhas.append(f"{self.nome}{_rotulos(self.rotulos, chave)} {valor}")
+        return linhas
+
+
+class Histograma:
+    def __init__(self, nome: str, descricao: str, rotulos: Sequence[str], buckets: Sequence[float] = BUCKETS_DURACAO):
+        self.nome = f"{PREFIXO}_{nome}"
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(sorted(buckets))
+        # rótulos -> [contagens por bucket..., soma, total]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, **rotulos: str) -> None:
+        rotulos.setdefault("cliente", cliente_atual.get())
+        chave = tuple(str(rotulos.get(r, "")) for r in self.rotulos)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [0] * (len(self.buckets) + 2)
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def exportar(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            for chave, serie in self._series.items():
+                for limite, contagem in zip(self.buckets, serie):
+                    le = f'le="{limite}"'
+                    linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {contagem}")
+                le = 'le="+Inf"'
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {serie[-1]}")
+                linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {serie[-2]}")
+                linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {serie[-1]}")
+        return linhas
+
+
+class Medicao:
+    """Preenchida dentro do bloco medido (ex.: origem = "redis" | "supabase")."""
+    __slots__ = ("origem", "cliente")
+
+    def __init__(self, origem: str = "", cliente: Optional[str] = None):
+        self.origem = origem
+        self.cliente = cliente
+
+
+class Metricas:
+    def __init__(self):
+        self.duracao = Histograma(
+            "fase_duracao_segundos", "Duração de cada fase do processamento de mensagens.",
+            ("cliente", "fase", "origem"))
+        self.retentativas = Contador(
+            "retentativas_total", "Novas tentativas após erro, por fase.", ("cliente", "fase"))
+        self.fallbacks = Contador(
+            "modelo_fallback_total", "Chamadas feitas com o modelo de fallback.", ("cliente", "fase", "modelo"))
+        self.hedges = Contador(
+            "llm_hedges_total", "Chamadas ao LLM duplicadas por demora da primeira.", ("cliente", "fase"))
+        self.tokens = Contador(
+            "llm_tokens_total", "Tokens consumidos no LLM (usage da API ou estimativa local no stream).",
+            ("cliente", "fase", "modelo", "tipo"))
+        self.duplicados = Contador(
+            "webhook_duplicados_total", "Reentregas de webhook descartadas, por onde foram detectadas.",
+            ("cliente", "origem"))
+
+    @contextmanager
+    def medir(self, fase: str, origem: str = "", cliente: Optional[str] = None) -> Iterator[Medicao]:
+        medicao = Medicao(origem, cliente)
+        inicio = time.perf_counter()
+        try:
+            yield medicao
+        finally:
+            rotulos = {"fase": fase, "origem": medicao.origem}
+            if medicao.cliente is not None:
+                rotulos["cliente"] = medicao.cliente
+            self.duracao.observar(time.perf_counter() - inicio, **rotulos)
+
+    def exportar(self, medidores: Optional[Dict[str, float]] = None) -> str:
+        linhas = (self.duracao.exportar() + self.retentativas.exportar() + self.fallbacks.exportar()
+                  + self.hedges.exportar() + self.tokens.exportar() + self.duplicados.exportar())
+        for nome, valor in (medidores or {}).items():
+            linhas += [f"# TYPE {PREFIXO}_{nome} gauge", f"{PREFIXO}_{nome} {valor}"]
+        return "\n".join(linhas) + "\n"
+
+
+metricas = Metricas()
+
+
+def cronometrado(fase: str, origem: Optional[str] = None) -> Callable:
+    """
+    Mede um método async na fase indicada. `origem` é o nome do atributo da instância que o
+    método preenche com a origem do dado (cache local, Redis, Supabase...).
+    """
+    def decorador(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            with metricas.medir(fase) as medicao:
+                try:
+                    return await func(self, *args, **kwargs)
+                finally:
+                    if origem:
+                        medicao.origem = getattr(self, origem, "") or ""
+        return wrapper
+    return decorador
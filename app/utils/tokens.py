@@ -0,0 +1,71 @@
+import time
+import threading
+from typing import Dict, Iterable
+from app.utils.logger import logger
+
+try:
+    import tiktoken
+except ImportError:  # contagem aproximada se o tiktoken não estiver instalado
+    tiktoken = None
+    logger.warning("tiktoken não instalado: contagem de tokens aproximada (4 caracteres/token)")
+
+MODELOS_PADRAO = ("gpt-4o-mini", "gpt-3.5-turbo", "gpt-4")
+# Depois de uma falha ao carregar (ex.: download do BPE), espera isso antes de tentar de novo
+RECARGA_APOS_FALHA_S = 300
+
+_encodings: Dict[str, object] = {}
+_ultima_tentativa: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def carregar_encoding(modelo: str) -> bool:
+    """
+    Carrega o encoding do modelo (na primeira vez o tiktoken baixa o arquivo BPE, de forma
+    síncrona). Bloqueia: chamar fora do event loop.
+    """
+    if tiktoken is None:
+        return False
+    if modelo in _encodings:
+        return True
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(modelo)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        _encodings[modelo] = encoding
+        return True
+    except Exception as e:
+        logger.warning("tiktoken: falha ao carregar o encoding de %s, usando aproximação: %s", modelo, e)
+        return False
+
+
+def aquecer_tokens(modelos: Iterable[str] = MODELOS_PADRAO) -> None:
+    """Carrega os encodings no startup (via asyncio.to_thread), antes da primeira mensagem."""
+    for modelo in modelos:
+        with _lock:
+            _ultima_tentativa[modelo] = time.monotonic()
+        carregar_encoding(modelo)
+
+
+def _carregar_em_segundo_plano(modelo: str) -> None:
+    with _lock:
+        ultima = _ultima_tentativa.get(modelo)
+        if ultima is not None and time.monotonic() - ultima < RECARGA_APOS_FALHA_S:
+            return
+        _ultima_tentativa[modelo] = time.monotonic()
+    threading.Thread(target=carregar_encoding, args=(modelo,), daemon=True).start()
+
+
+def contar_tokens(texto: str, modelo: str = "gpt-4o-mini") -> int:
+    if not texto:
+        return 0
+    encoding = _encodings.get(modelo)
+    if encoding is None and tiktoken is not None:
+        # Nunca carrega no caminho da mensagem: aproxima até o encoding ficar pronto
+        _carregar_em_segundo_plano(modelo)
+    if encoding is not None:
+        try:
+            return len(encoding.encode(texto, disallowed_special=()))
+        except Exception as e:
+            logger.warning("tiktoken: falha ao contar tokens (%s), usando aproximação: %s", modelo, e)
+    return len(texto) // 4 + 1
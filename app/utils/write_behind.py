@@ -0,0 +1,156 @@
+import json
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from app.config.config import WRITE_BEHIND_INTERVAL, WRITE_BEHIND_MAX_PENDENTES, WRITE_BEHIND_MAX_TENTATIVAS
+from app.config.redis_client import redis_client
+from app.config.supabase_client import supabase
+from app.utils.logger import logger
+
+DEAD_LETTER = "write_behind:dead_letter"
+
+
+class PersistenciaWriteBehind:
+    """
+    Persistência write-behind do user_data: o Redis segue como fonte da verdade no caminho quente,
+    e as linhas alteradas são acumuladas em memória (uma por id_cliente_usuario, campos mesclados)
+    e gravadas no Supabase em upserts multi-linha, por tempo ou por volume.
+
+    Se o upsert de um grupo falha, as linhas são regravadas uma a uma: uma linha recusada pelo
+    PostgREST não segura as demais. A linha que falha volta para o próximo flush e, depois de
+    max_tentativas flushes com erro, vai para o dead-letter no Redis.
+
+    Limitação: cada processo tem o próprio buffer e o upsert (merge-duplicates do PostgREST) não é
+    condicional ao updated_at. Dois processos que gravam a mesma linha podem fazer o flush fora de
+    ordem e um snapshot mais antigo de history/user_info sobrescrever um mais novo no Supabase, e
+    uma linha apagada (apagar) pode ser recriada pelo buffer de outro processo. O Redis continua
+    certo e é ele que o caminho quente lê; o Supabase converge na próxima gravação da conversa.
+    """
+
+    def __init__(self, table: str = "user_data", on_conflict: str = "id_cliente_usuario",
+                 intervalo: float = WRITE_BEHIND_INTERVAL, max_pendentes: int = WRITE_BEHIND_MAX_PENDENTES,
+                 max_tentativas: int = WRITE_BEHIND_MAX_TENTATIVAS, supabase_client: Any = supabase,
+                 redis_client: Any = redis_client):
+        self.table = table
+        self.on_conflict = on_conflict
+        self.intervalo = intervalo
+        self.max_pendentes = max_pendentes
+        self.max_tentativas = max_tentativas
+        self.supabase = supabase_client
+        self.redis = redis_client
+        self.pendentes: Dict[str, dict] = {}
+        # Flushes com erro por linha ainda pendente
+        self._tentativas: Dict[str, int] = {}
+        self.descartadas = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_antecipado = asyncio.Event()
+
+    def marcar(self, linha: dict) -> None:
+        """Registra (ou mescla) a linha suja; a gravação acontece no próximo flush."""
+        chave = linha[self.on_conflict]
+        self.pendentes.setdefault(chave, {}).update(linha)
+        if len(self.pendentes) >= self.max_pendentes:
+            self._flush_antecipado.set()
+
+    async def flush(self) -> int:
+        async with self._lock:
+            if not self.pendentes:
+                return 0
+            lote, self.pendentes = self.pendentes, {}
+
+            # PostgREST exige as mesmas colunas em todas as linhas de um upsert em lote
+            grupos: Dict[tuple, list] = {}
+            for linha in lote.values():
+                grupos.setdefault(tuple(sorted(linha)), []).append(linha)
+
+            gravadas = 0
+            for linhas in grupos.values():
+                try:
+                    await self.supabase.upsert(self.table, linhas, on_conflict=self.on_conflict)
+                    gravadas += self._gravadas(linhas)
+                    continue
+                except Exception as e:
+                    logger.error("[WriteBehind] Erro ao gravar %s linha(s) em %s: %s", len(linhas), self.table, e)
+                    if len(linhas) == 1:
+                        await self._falhou(linhas[0], e)
+                        continue
+
+                # Uma a uma, para isolar a linha recusada
+                for linha in linhas:
+                    try:
+                        await self.supabase.upsert(self.table, linha, on_conflict=self.on_conflict)
+                        gravadas += self._gravadas([linha])
+                    except Exception as e:
+                        await self._falhou(linha, e)
+            return gravadas
+
+    def _gravadas(self, linhas: List[dict]) -> int:
+        for linha in linhas:
+            self._tentativas.pop(linha[self.on_conflict], None)
+        return len(linhas)
+
+    async def _falhou(self, linha: dict, erro: Exception) -> None:
+        chave = linha[self.on_conflict]
+        tentativas = self._tentativas.get(chave, 0) + 1
+        if tentativas < self.max_tentativas:
+            self._tentativas[chave] = tentativas
+            # Devolve para a fila sem sobrescrever alterações mais novas
+            self.pendentes[chave] = {**linha, **self.pendentes.get(chave, {})}
+            return
+
+        self._tentativas.pop(chave, None)
+        self.descartadas += 1
+        logger.error("[WriteBehind] %s falhou %s vez(es) em %s — dead-letter: %s", chave, tentativas, self.table, erro)
+        registro = json.dumps({"tabela": self.table, "linha": linha, "erro": str(erro)}, default=str)
+        try:
+            await self.redis.lpush(DEAD_LETTER, registro)
+        except Exception as erro_dlq:
+            logger.critical("[WriteBehind] Falha ao mover %s para o dead-letter (%s); linha: %s", chave, erro_dlq, registro)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_antecipado.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_antecipado.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("[WriteBehind] Erro no flush: %s", e)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        gravadas = await self.flush()
+        logger.info("[WriteBehind] Flush de encerramento: %s linha(s)", gravadas)
+
+    async def apagar(self, chave: str) -> int:
+        """
+        Descarta as alterações pendentes da linha e a apaga do Supabase. Roda sob o mesmo lock do
+        flush: um flush em andamento termina antes e não recria a linha depois do delete.
+        """
+        async with self._lock:
+            self.pendentes.pop(chave, None)
+            self._tentativas.pop(chave, None)
+            return await self.supabase.delete(self.table, {self.on_conflict: chave})
+
+    def stats(self) -> dict:
+        return {
+            "pendentes": len(self.pendentes),
+            "com_erro": len(self._tentativas),
+            "descartadas_total": self.descartadas,
+        }
+
+
+persistencia = PersistenciaWriteBehind()
@@ -0,0 +1,85 @@
+"""
+Benchmark e verificação de saída do RespostaSegmentada.
+
+Compara o segmentador atual (passada única, regex pré-compilada) com a implementação
+anterior (um re.sub por abreviação + enumeração + split) num corpus de respostas reais,
+falhando se alguma segmentação divergir. As saídas de referência (que rodam no pytest) ficam em
+tests/test_segmentador.py.
+
+Uso:
+    python -m benchmarks.bench_segmentador [repeticoes]
+"""
+import os
+import re
+import sys
+import timeit
+
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+
+from app.models.send_message import RespostaSegmentada  # noqa: E402
+
+CORPUS = [
+    "Olá! Eu sou a Diana, assistente virtual da clínica. Como posso te ajudar hoje?",
+    "A consulta com a Dra. Fernanda custa R$ 350,00. O atendimento é na Av. Paulista, 1000. Posso te ajudar em algo mais?",
+    "Temos os seguintes procedimentos: 1. Limpeza de pele 2. Peeling químico 3. Botox. Qual deles te interessa?",
+    "O Dr. Carlos atende de segunda a sexta. A Profa. Marina coordena o curso. Confirma pra mim seu nome?",
+    "Claro! Trabalhamos com cirurgias, procedimentos estéticos, etc. Você já é paciente da clínica?",
+    "Entendi... Vou verificar a agenda. Um momento, por favor.",
+    "O endereço é Ed. Central, sala 12. Estacionamento no local. Tem mais alguma dúvida?",
+    "Perfeito, Sr. João! Seu interesse foi registrado.   Em breve a responsável vai te chamar por aqui.",
+    "Os valores variam conforme a avaliação. Ex. para harmonização facial, depende da quantidade de produto.",
+    "Sim!\nA avaliação é gratuita. Gostaria de agendar?",
+    "Pode ser Sra. Ana ou Sra Ana. 10. Fim",
+    "Oi",
+    "",
+    "Obrigada pela informação, seu atendimento será em breve.",
+]
+
+_LEGADO_ABBREVIATIONS = [r'Sr', r'Sra', r'Dr', r'Dra', r'Av', r'Ed', r'Prof', r'Profa', r'Profª', r'Ex', r'Exa', r'Adm', r'Assoc', r'etc']
+_LEGADO_PLACEHOLDER = '<DOT>'
+_LEGADO_ENUM = re.compile(r'(?m)(?P<number>\b\d+)\.(?=\s)')
+
+
+def segmentar_legado(texto: str) -> list:
+    # Implementação anterior, mantida só como referência de saída.
+    # (As abreviações p.e/p.ex ficam de fora: a versão antiga deixava uma barra invertida na saída.)
+    for abbr in _LEGADO_ABBREVIATIONS:
+        texto = re.sub(rf"\b{abbr}\.", f"{abbr}{_LEGADO_PLACEHOLDER}", texto)
+    texto = _LEGADO_ENUM.sub(lambda m: f"{m.group('number')}{_LEGADO_PLACEHOLDER}", texto)
+    frases = []
+    for parte in re.split(r'\.\s+', texto):
+        seg = parte.strip()
+        if not seg:
+            continue
+        seg = seg.replace(_LEGADO_PLACEHOLDER, '.')
+        if not seg.endswith(('.', '?', '!')):
+            seg += '.'
+        frases.append(seg)
+    return frases
+
+
+def verificar_saida() -> int:
+    divergencias = 0
+    for texto in CORPUS:
+        esperado = segmentar_legado(texto)
+        obtido = RespostaSegmentada(texto).resposta_segmentada
+        if esperado != obtido:
+            divergencias += 1
+            print(f"DIVERGÊNCIA\n  texto:    {texto!r}\n  esperado: {esperado}\n  obtido:   {obtido}")
+    return divergencias
+
+
+def main(repeticoes: int = 2000) -> int:
+    divergencias = verificar_saida()
+    print(f"Corpus: {len(CORPUS)} respostas, divergências: {divergencias}")
+
+    legado = timeit.timeit(lambda: [segmentar_legado(t) for t in CORPUS], number=repeticoes)
+    atual = timeit.timeit(lambda: [RespostaSegmentada(t).resposta_segmentada for t in CORPUS], number=repeticoes)
+    total = repeticoes * len(CORPUS)
+    print(f"legado: {total / legado:,.0f} respostas/s")
+    print(f"atual:  {total / atual:,.0f} respostas/s ({legado / atual:.1f}x)")
+    return 1 if divergencias else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,88 @@
+"""
+Compara o formato antigo do cache (json.dumps em texto) com o codec v1 (app/utils/codec.py):
+ops/s de codificação e decodificação e bytes guardados por objeto (config, funil, user_info e
+uma mensagem do histórico).
+
+Sem --redis-url o tamanho é o do valor serializado; com um Redis de verdade (o fakeredis não
+tem MEMORY USAGE) mede também a memória de cada chave com MEMORY USAGE.
+
+Uso:
+    python -m benchmarks.codec
+    python -m benchmarks.codec --redis-url redis://localhost:6379/15 --escala 0.5
+"""
+import sys
+import json
+import argparse
+from typing import List, Optional
+
+from benchmarks import fakes
+from benchmarks.run import Resultado, medir
+from app.utils.codec import codificar, decodificar
+
+OBJETOS = {
+    "config": fakes.CONFIG_INFO,
+    "funil": fakes.FUNNEL_INFO,
+    "user_info": {
+        "state": "procedimento",
+        "data": {"nome": "ana", "tipo_cliente": "novo_paciente", "procedimento": "avaliação ortodôntica",
+                 "horario_preferido": None, "convenio": None},
+    },
+    "historico_msg": {"role": "assistant", "content": fakes.RESPOSTA_CHAT},
+}
+
+
+def _memoria(redis_url: str, chave: str, valor: bytes) -> int:
+    import redis
+
+    cliente = redis.Redis.from_url(redis_url)
+    try:
+        cliente.set(chave, valor)
+        return cliente.memory_usage(chave, samples=0) or 0
+    finally:
+        cliente.delete(chave)
+        cliente.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark do codec do cache Redis.")
+    parser.add_argument("--escala", type=float, default=1.0, help="multiplica o número de iterações")
+    parser.add_argument("--redis-url", help="Redis real para medir MEMORY USAGE (usa chaves bench:codec:*)")
+    args = parser.parse_args(argv)
+    n = max(1, int(20000 * args.escala))
+
+    resultados: List[Resultado] = []
+    tamanhos = []
+    for nome, obj in OBJETOS.items():
+        legado = json.dumps(obj)
+        v1 = codificar(obj)
+        resultados += [
+            medir(f"{nome}_json_dumps", lambda: json.dumps(obj), n, aquecimento=100),
+            medir(f"{nome}_v1_codificar", lambda: codificar(obj), n, aquecimento=100),
+            medir(f"{nome}_json_loads", lambda: json.loads(legado), n, aquecimento=100),
+            medir(f"{nome}_v1_decodificar", lambda: decodificar(v1), n, aquecimento=100),
+        ]
+        linha = [nome, len(legado.encode("utf-8")), len(v1)]
+        if args.redis_url:
+            linha += [_memoria(args.redis_url, f"bench:codec:{nome}:json", legado.encode("utf-8")),
+                      _memoria(args.redis_url, f"bench:codec:{nome}:v1", v1)]
+        tamanhos.append(linha)
+
+    print(f"{'caso':<28}{'n':>8}{'ops/s':>14}{'p50 (µs)':>12}{'p99 (µs)':>12}")
+    for r in resultados:
+        print(f"{r.nome:<28}{r.n:>8}{r.ops_s:>14,.0f}{r.p50_us:>12,.1f}{r.p99_us:>12,.1f}")
+
+    print()
+    cabecalho = f"{'objeto':<16}{'json (B)':>10}{'v1 (B)':>10}{'redução':>10}"
+    if args.redis_url:
+        cabecalho += f"{'MEMORY json':>14}{'MEMORY v1':>12}"
+    print(cabecalho)
+    for nome, legado, v1, *memoria in tamanhos:
+        linha = f"{nome:<16}{legado:>10}{v1:>10}{1 - v1 / legado:>10.1%}"
+        if memoria:
+            linha += f"{memoria[0]:>14}{memoria[1]:>12}"
+        print(linha)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
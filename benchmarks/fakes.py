@@ -0,0 +1,284 @@
+"""
+Substitutos locais dos serviços externos para os benchmarks rodarem offline:
+
+- Redis: fakeredis (com Lua, via `fakeredis[lua]`), no lugar de app.config.redis_client
+- Supabase/PostgREST: tabelas em memória atrás de um httpx.MockTransport
+- Z-API: httpx.MockTransport que aceita os send-text
+- OpenAI: ChatCompletion/Embedding/Audio com latência configurável
+- Pinecone: índice em memória com matches fixos
+
+`instalar()` precisa rodar antes de qualquer import de `app.*`: os módulos capturam os clientes
+(redis_client, supabase, pinecone_indices...) como argumentos padrão na importação.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+TELEFONE_CLIENTE = "5511900000000"
+ZAPI_INSTANCE = "instancia-bench"
+DIM_EMBEDDING = 1536
+
+CONFIG_INFO = {
+    "zapi_token": "token-bench",
+    "zapi_instance_id": ZAPI_INSTANCE,
+    "pinecone_namespace": "clinica-bench",
+    "pinecone_index_name": "indice-bench",
+    "tempo_espera_debounce": 0,
+    "chave_parar_atendimento": "#humano",
+    "horario_atendimento": {"default": ["00:00", "23:59"]},
+}
+
+FUNNEL_INFO = {
+    "prompt_base": """
+        Você é a Diana, assistente virtual da clínica. Responda de forma curta, cordial e objetiva.
+        Nunca invente valores ou horários que não estejam no contexto da clínica.
+    """,
+    "prompt_apresentacao_inicial": "Apresente-se como Diana e pergunte como pode ajudar.",
+    "prompt_encerramento": "Agradeça e avise que a responsável vai continuar o atendimento.",
+    "funil": [
+        {"id": "nome", "prompt": "Pergunte o nome do paciente.", "obrigatorio": True,
+         "fallback_llm": "Extraia o primeiro nome do paciente ou responda nao_identificado."},
+        {"id": "tipo_cliente", "prompt": "Pergunte se já é paciente da clínica.", "obrigatorio": True,
+         "fallback_llm": "Responda novo_paciente, paciente_existente, outros_assuntos ou nao_identificado."},
+        {"id": "procedimento", "prompt": "Pergunte qual procedimento interessa.", "obrigatorio": False,
+         "permite_nova_entrada": True,
+         "fallback_llm": "Extraia o procedimento de interesse ou responda nao_identificado."},
+        {"id": "melhor_horario", "prompt": "Pergunte o melhor horário para contato.", "obrigatorio": False,
+         "fallback_llm": "Extraia o melhor horário de contato ou responda nao_identificado."},
+        {"id": "esperando_humano", "prompt": "Avise que em breve a responsável vai chamar.", "obrigatorio": False},
+    ],
+}
+
+RESPOSTA_CHAT = (
+    "Olá! A consulta com a Dra. Fernanda custa R$ 350,00. O atendimento é na Av. Paulista, 1000. "
+    "Temos os procedimentos: 1. Limpeza de pele 2. Peeling químico 3. Botox. Qual deles te interessa?"
+)
+
+CHUNKS = [
+    {"id": f"chunk-{i}", "score": 0.9 - i * 0.03, "metadata": {
+        "texto": f"Informação {i} da clínica: horários, valores e procedimentos. " * 8,
+        "categoria": ["valores", "procedimentos"], "fonte": "faq"}}
+    for i in range(3)
+]
+
+
+class Latencias:
+    """Latências simuladas (segundos), ajustáveis pela linha de comando do runner."""
+    openai_chat = 0.0
+    openai_embedding = 0.0
+    supabase = 0.0
+    zapi = 0.0
+    pinecone = 0.0
+
+
+def _definir_ambiente() -> None:
+    for chave, valor in {
+        "REDIS_URL": "redis://fake:6379/0",
+        "SUPABASE_URL": "http://supabase.fake",
+        "SUPABASE_KEY": "fake",
+        "API_KEY_OPENAI": "fake",
+        "API_KEY_PINECONE": "fake",
+        "LOG_LEVEL": "WARNING",
+        "ZAPI_PHONE_HEADER": "fake",
+        "ZAPI_RATE_POR_SEGUNDO": "100000",
+        "ZAPI_RATE_BURST": "100000",
+    }.items():
+        os.environ.setdefault(chave, valor)
+
+
+# ---------------------------------------------------------------- Supabase (PostgREST)
+
+class FakePostgREST:
+    """Subconjunto do PostgREST usado pelo SupabaseRepository: select/eq/order/limit, upsert, insert e delete."""
+
+    def __init__(self):
+        self.tabelas: Dict[str, List[dict]] = {
+            "account_data": [{
+                "id": 1,
+                "telefone_cliente": TELEFONE_CLIENTE,
+                "config_info": CONFIG_INFO,
+                "funnel_info": FUNNEL_INFO,
+            }],
+            "user_data": [],
+            "sor_table": [],
+        }
+
+    async def __call__(self, request):
+        import httpx
+
+        if Latencias.supabase:
+            await asyncio.sleep(Latencias.supabase)
+        tabela = request.url.path.rsplit("/", 1)[-1]
+        linhas = self.tabelas.setdefault(tabela, [])
+        params = {k: v[0] for k, v in parse_qs(request.url.query.decode()).items()}
+        filtros = {k: v[3:] for k, v in params.items() if v.startswith("eq.")}
+
+        def casa(linha: dict) -> bool:
+            return all(str(linha.get(k)) == v for k, v in filtros.items())
+
+        if request.method == "GET":
+            encontradas = [l for l in linhas if casa(l)]
+            if params.get("order", "").endswith(".desc"):
+                encontradas.reverse()
+            if "limit" in params:
+                encontradas = encontradas[:int(params["limit"])]
+            colunas = params.get("select", "*")
+            if colunas != "*":
+                nomes = [c.strip() for c in colunas.split(",")]
+                encontradas = [{c: l.get(c) for c in nomes} for l in encontradas]
+            return httpx.Response(200, json=encontradas)
+
+        if request.method == "POST":
+            novas = json.loads(request.content or b"[]")
+            novas = novas if isinstance(novas, list) else [novas]
+            conflito = params.get("on_conflict")
+            for nova in novas:
+                existente = next((l for l in linhas if conflito and l.get(conflito) == nova.get(conflito)), None)
+                if existente is not None:
+                    existente.update(nova)
+                else:
+                    linhas.append(dict(nova))
+            return httpx.Response(201)
+
+        if request.method == "DELETE":
+            removidas = [l for l in linhas if casa(l)]
+            self.tabelas[tabela] = [l for l in linhas if not casa(l)]
+            return httpx.Response(200, json=removidas)
+
+        return httpx.Response(405)
+
+
+# ---------------------------------------------------------------- Z-API
+
+class FakeZapi:
+    def __init__(self):
+        self.enviados = 0
+
+    async def __call__(self, request):
+        import httpx
+
+        if Latencias.zapi:
+            await asyncio.sleep(Latencias.zapi)
+        self.enviados += 1
+        return httpx.Response(200, json={"zaapId": f"z{self.enviados}", "messageId": f"m{self.enviados}"})
+
+
+# ---------------------------------------------------------------- OpenAI
+
+def _embedding_deterministico(texto: str) -> List[float]:
+    semente = int.from_bytes(hashlib.sha1(texto.encode("utf-8")).digest()[:8], "big")
+    gerador = random.Random(semente)
+    return [gerador.uniform(-1, 1) for _ in range(DIM_EMBEDDING)]
+
+
+def _resposta_chat(kwargs: dict) -> str:
+    if kwargs.get("response_format"):
+        return json.dumps({"nome": "nao_identificado", "tipo_cliente": "novo_paciente"})
+    if (kwargs.get("max_tokens") or 0) <= 30:
+        return "nao_identificado"
+    return RESPOSTA_CHAT
+
+
+async def _fake_chat_acreate(**kwargs):
+    from openai.openai_object import OpenAIObject
+
+    if Latencias.openai_chat:
+        await asyncio.sleep(Latencias.openai_chat)
+    texto = _resposta_chat(kwargs)
+
+    if not kwargs.get("stream"):
+        return OpenAIObject.construct_from({"choices": [{"message": {"role": "assistant", "content": texto}}]})
+
+    async def gerar():
+        for i in range(0, len(texto), 12):
+            yield OpenAIObject.construct_from({"choices": [{"delta": {"content": texto[i:i + 12]}}]})
+    return gerar()
+
+
+def _fake_embedding_create(input: str, model: str, **kwargs) -> dict:
+    if Latencias.openai_embedding:
+        time.sleep(Latencias.openai_embedding)
+    return {"data": [{"embedding": _embedding_deterministico(input)}]}
+
+
+async def _fake_audio_atranscribe(modelo: str, arquivo: Any, **kwargs) -> dict:
+    if Latencias.openai_chat:
+        await asyncio.sleep(Latencias.openai_chat)
+    return {"text": "Queria saber o valor da consulta."}
+
+
+# ---------------------------------------------------------------- Pinecone
+
+class FakePineconeIndex:
+    def query(self, vector, top_k: int, include_metadata: bool = True, namespace: Optional[str] = None) -> dict:
+        if Latencias.pinecone:
+            time.sleep(Latencias.pinecone)
+        return {"matches": CHUNKS[:top_k]}
+
+    def describe_index_stats(self) -> dict:
+        return {"namespaces": {CONFIG_INFO["pinecone_namespace"]: {"vector_count": len(CHUNKS)}}}
+
+
+class FakePinecone:
+    def Index(self, nome: str, **kwargs) -> FakePineconeIndex:
+        return FakePineconeIndex()
+
+
+# ----------------------------------------------------------------
+
+class Fakes:
+    def __init__(self, postgrest: FakePostgREST, zapi: FakeZapi, redis: Any):
+        self.postgrest = postgrest
+        self.zapi = zapi
+        self.redis = redis
+
+
+def instalar() -> Fakes:
+    _definir_ambiente()
+
+    import httpx
+    import openai
+    import fakeredis
+    from fakeredis import aioredis as fake_aioredis
+
+    servidor = fakeredis.FakeServer()
+    import app.config.redis_client as redis_module
+    redis_module.redis_client = fake_aioredis.FakeRedis(server=servidor, decode_responses=True)
+    redis_module.redis_binary_client = fake_aioredis.FakeRedis(server=servidor, decode_responses=False)
+
+    import app.config.pinecone_client as pinecone_module
+    pinecone_module.pinecone_client = FakePinecone()
+    pinecone_module.pinecone_indices.client = pinecone_module.pinecone_client
+
+    postgrest, zapi = FakePostgREST(), FakeZapi()
+    from app.config.http_client import http_pool
+    http_pool.registrar("supabase", base_url="http://supabase.fake/rest/v1", transport=httpx.MockTransport(postgrest))
+    http_pool.registrar("zapi", base_url="https://api.z-api.io", transport=httpx.MockTransport(zapi))
+
+    openai.ChatCompletion.acreate = staticmethod(_fake_chat_acreate)
+    openai.Embedding.create = staticmethod(_fake_embedding_create)
+    openai.Audio.atranscribe = staticmethod(_fake_audio_atranscribe)
+
+    # Sem tiktoken: o primeiro uso baixa o BPE e o benchmark não pode depender de rede
+    import app.utils.tokens as tokens_module
+    tokens_module.tiktoken = None
+
+    return Fakes(postgrest, zapi, redis_module.redis_client)
+
+
+def webhook_body(telefone_usuario: str, texto: str, from_me: bool = False) -> dict:
+    return {
+        "connectedPhone": TELEFONE_CLIENTE,
+        "isGroup": False,
+        "isEdit": False,
+        "phone": telefone_usuario,
+        "fromMe": from_me,
+        "momment": int(time.time() * 1000),
+        "senderName": "Paciente",
+        "text": {"message": texto},
+    }
@@ -0,0 +1,240 @@
+"""
+Suíte de benchmarks dos caminhos quentes, rodando offline com os substitutos de benchmarks/fakes.py
+(fakeredis, PostgREST/Z-API em memória, OpenAI e Pinecone falsos com latência configurável).
+
+Reporta ops/s, p50 e p99 de cada caso e compara com o baseline salvo em benchmarks/baseline.json;
+sai com código 1 se algum caso ficar mais lento que o baseline além da tolerância.
+
+O baseline versionado foi gravado numa VM Linux de 1 vCPU (Intel Xeon 2.10GHz), Python 3.11, com
+--escala 1 e latências zero (ver "meta" no arquivo). Em outra máquina os números absolutos mudam:
+grave um baseline local com --salvar-baseline antes de comparar.
+
+Uso:
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.run                      # roda tudo e compara com o baseline
+    python -m benchmarks.run --salvar-baseline    # grava os resultados como novo baseline
+    python -m benchmarks.run -k segment -k funnel --escala 0.2 --latencia-openai 0.05
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from itertools import count
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from benchmarks import fakes
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+@dataclass
+class Resultado:
+    nome: str
+    n: int
+    ops_s: float
+    p50_us: float
+    p99_us: float
+
+
+def _resumir(nome: str, duracoes: List[float], total: float) -> Resultado:
+    ordenadas = sorted(duracoes)
+    p50 = ordenadas[len(ordenadas) // 2]
+    p99 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.99))]
+    return Resultado(nome, len(duracoes), len(duracoes) / total, p50 * 1e6, p99 * 1e6)
+
+
+def medir(nome: str, func: Callable[[], object], n: int, aquecimento: int) -> Resultado:
+    for _ in range(aquecimento):
+        func()
+    duracoes = []
+    relogio = time.perf_counter
+    inicio = relogio()
+    for _ in range(n):
+        t0 = relogio()
+        func()
+        duracoes.append(relogio() - t0)
+    return _resumir(nome, duracoes, relogio() - inicio)
+
+
+async def medir_async(nome: str, func: Callable[[], Awaitable[object]], n: int, aquecimento: int) -> Resultado:
+    for _ in range(aquecimento):
+        await func()
+    duracoes = []
+    relogio = time.perf_counter
+    inicio = relogio()
+    for _ in range(n):
+        t0 = relogio()
+        await func()
+        duracoes.append(relogio() - t0)
+    return _resumir(nome, duracoes, relogio() - inicio)
+
+
+# ---------------------------------------------------------------- casos
+
+def casos_sincronos() -> Dict[str, tuple]:
+    from app.models.send_message import RespostaSegmentada
+    from app.models.openai_service import ChatInput, ChatResponder
+    from app.models.prompt_context import ContextoHistorico
+    from app.models.funnel_service import FunnelInfo
+    from app.models.user_info import UserInfo, UserInfoService
+    from app.models.config_info import ConfigInfo
+    from app.models.search_chunks import BuscadorChunks
+
+    funnel = FunnelInfo.from_dict(fakes.FUNNEL_INFO)
+    config = ConfigInfo.from_dict(fakes.CONFIG_INFO)
+    user_info = UserInfo(state="procedimento", data={"nome": "ana", "tipo_cliente": "novo_paciente", "extra": "x"})
+    servico_user = UserInfoService(fakes.TELEFONE_CLIENTE, "5511988887777", funnel)
+    mensagens = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"Mensagem {i} sobre valores e horários da clínica."}
+        for i in range(8)
+    ]
+    chunks = BuscadorChunks(config.pinecone_index_name, config.pinecone_namespace).formatar_chunks(fakes.CHUNKS)
+
+    def system_content():
+        chat_input = ChatInput(
+            mensagem="Quanto custa a consulta?", best_chunks=chunks, historico=ContextoHistorico(mensagens),
+            prompt_base=funnel.prompt_base, prompt_state=funnel.funil[2].prompt, user_data=user_info)
+        return ChatResponder(chat_input).build_system_content()
+
+    return {
+        "segmentador": (lambda: RespostaSegmentada(fakes.RESPOSTA_CHAT).resposta_segmentada, 20000),
+        "system_content": (system_content, 5000),
+        "funnel_from_dict": (lambda: FunnelInfo.from_dict(fakes.FUNNEL_INFO), 20000),
+        "sync_with_funnel": (lambda: servico_user.sync_with_funnel(user_info), 20000),
+        "time_window": (config.time_window, 20000),
+    }
+
+
+def casos_assincronos(instalados: fakes.Fakes) -> Dict[str, tuple]:
+    from app.services.message_handler import process_message
+    from app.services.fila_envio import fila_envio
+
+    usuarios = count()
+
+    async def pipeline():
+        # Usuários em rodízio: o histórico cresce até o corte, como numa conversa real
+        telefone = f"55119{next(usuarios) % 50:08d}"
+        await process_message(fakes.webhook_body(telefone, "Oi, quanto custa a consulta com a doutora?"))
+
+    async def envio_zapi():
+        telefone = f"55118{next(usuarios) % 50:08d}"
+        await fila_envio.enfileirar(telefone, ["Olá!", "A consulta custa R$ 350,00.", "Posso ajudar em algo mais?"],
+                                    fakes.ZAPI_INSTANCE, "token-bench", delay_typing=0)
+        await fila_envio._drenar_conversa(fila_envio._chave_conversa(fakes.ZAPI_INSTANCE, telefone))
+
+    return {
+        "process_message": (pipeline, 500),
+        "envio_zapi": (envio_zapi, 2000),
+    }
+
+
+# ---------------------------------------------------------------- baseline
+
+def carregar_baseline() -> Dict[str, dict]:
+    if not os.path.exists(BASELINE):
+        return {}
+    with open(BASELINE, encoding="utf-8") as f:
+        return json.load(f).get("resultados", {})
+
+
+def salvar_baseline(resultados: List[Resultado]) -> None:
+    dados = {
+        "meta": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "processador": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(),
+            "data": datetime.now().isoformat(timespec="seconds"),
+        },
+        "resultados": {r.nome: asdict(r) for r in resultados},
+    }
+    with open(BASELINE, "w", encoding="utf-8") as f:
+        json.dump(dados, f, indent=2, ensure_ascii=False)
+    print(f"Baseline salvo em {BASELINE}")
+
+
+def relatorio(resultados: List[Resultado], baseline: Dict[str, dict], tolerancia: float) -> int:
+    regressoes = 0
+    print(f"{'caso':<20}{'n':>8}{'ops/s':>14}{'p50 (µs)':>12}{'p99 (µs)':>12}  vs baseline")
+    for r in resultados:
+        linha = f"{r.nome:<20}{r.n:>8}{r.ops_s:>14,.0f}{r.p50_us:>12,.1f}{r.p99_us:>12,.1f}"
+        base = baseline.get(r.nome)
+        if base:
+            variacao = r.ops_s / base["ops_s"] - 1
+            marca = ""
+            if variacao < -tolerancia:
+                regressoes += 1
+                marca = "  ⚠ REGRESSÃO"
+            linha += f"  {variacao:+.1%} ops/s, p99 {r.p99_us / base['p99_us'] - 1:+.1%}{marca}"
+        print(linha)
+    return regressoes
+
+
+# ----------------------------------------------------------------
+
+async def _rodar_assincronos(instalados: fakes.Fakes, filtro: Callable[[str], bool], escala: float) -> List[Resultado]:
+    from app.config.http_client import http_pool
+    from app.services.llm_gateway import gateway_llm
+
+    resultados = []
+    try:
+        for nome, (func, n) in casos_assincronos(instalados).items():
+            if not filtro(nome):
+                continue
+            resultados.append(await medir_async(nome, func, max(1, int(n * escala)), aquecimento=20))
+            if nome == "process_message" and not await instalados.redis.xlen("zapi:outbound"):
+                raise RuntimeError("process_message não enfileirou nenhuma resposta: o pipeline não rodou até o envio")
+    finally:
+        await gateway_llm.aclose()
+        await http_pool.aclose()
+    return resultados
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks offline dos caminhos quentes.")
+    parser.add_argument("-k", dest="filtros", action="append", default=[], help="roda só casos cujo nome contém o texto")
+    parser.add_argument("--escala", type=float, default=1.0, help="multiplica o número de iterações de cada caso")
+    parser.add_argument("--salvar-baseline", action="store_true")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="queda de ops/s aceita antes de acusar regressão")
+    parser.add_argument("--latencia-openai", type=float, default=0.0)
+    parser.add_argument("--latencia-supabase", type=float, default=0.0)
+    parser.add_argument("--latencia-zapi", type=float, default=0.0)
+    parser.add_argument("--latencia-pinecone", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    fakes.Latencias.openai_chat = fakes.Latencias.openai_embedding = args.latencia_openai
+    fakes.Latencias.supabase = args.latencia_supabase
+    fakes.Latencias.zapi = args.latencia_zapi
+    fakes.Latencias.pinecone = args.latencia_pinecone
+    instalados = fakes.instalar()
+
+    def filtro(nome: str) -> bool:
+        return not args.filtros or any(f in nome for f in args.filtros)
+
+    resultados = []
+    for nome, (func, n) in casos_sincronos().items():
+        if filtro(nome):
+            resultados.append(medir(nome, func, max(1, int(n * args.escala)), aquecimento=100))
+    resultados += asyncio.run(_rodar_assincronos(instalados, filtro, args.escala))
+
+    if args.salvar_baseline:
+        relatorio(resultados, {}, args.tolerancia)
+        salvar_baseline(resultados)
+        return 0
+
+    baseline = carregar_baseline()
+    if not baseline:
+        print(f"Sem baseline em {BASELINE}: rode com --salvar-baseline para gravar um")
+    regressoes = relatorio(resultados, baseline, args.tolerancia)
+    if regressoes:
+        print(f"{regressoes} caso(s) abaixo do baseline (tolerância {args.tolerancia:.0%})")
+    return 1 if regressoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4 @@
+import os
+
+# app.config lê o ambiente na importação; os testes não abrem conexão com o Redis
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
@@ -0,0 +1,96 @@
+"""
+Saídas de referência do RespostaSegmentada (entrada -> segmentos enviados ao paciente) e
+equivalência do SegmentadorIncremental com a segmentação do texto completo.
+
+Mudou a segmentação de propósito? Atualize os pares abaixo no mesmo commit.
+"""
+import pytest
+
+from app.models.send_message import RespostaSegmentada, SegmentadorIncremental
+
+GOLDEN = [
+    # Respostas do assistente
+    ("Olá! Eu sou a Diana, assistente virtual da clínica. Como posso te ajudar hoje?",
+     ["Olá! Eu sou a Diana, assistente virtual da clínica.", "Como posso te ajudar hoje?"]),
+    ("O Dr. Carlos atende de segunda a sexta. A Profa. Marina coordena o curso. Confirma pra mim seu nome?",
+     ["O Dr. Carlos atende de segunda a sexta.", "A Profa. Marina coordena o curso.", "Confirma pra mim seu nome?"]),
+    ("Perfeito, Sr. João! Seu interesse foi registrado.   Em breve a responsável vai te chamar por aqui.",
+     ["Perfeito, Sr. João! Seu interesse foi registrado.", "Em breve a responsável vai te chamar por aqui."]),
+    ("Os valores variam conforme a avaliação. Ex. para harmonização facial, depende da quantidade de produto.",
+     ["Os valores variam conforme a avaliação.", "Ex. para harmonização facial, depende da quantidade de produto."]),
+    ("Sim!\nA avaliação é gratuita. Gostaria de agendar?",
+     ["Sim!\nA avaliação é gratuita.", "Gostaria de agendar?"]),
+    ("Entendi... Vou verificar a agenda. Um momento, por favor.",
+     ["Entendi..", "Vou verificar a agenda.", "Um momento, por favor."]),
+    ("Obrigada pela informação, seu atendimento será em breve.",
+     ["Obrigada pela informação, seu atendimento será em breve."]),
+    ("Ligamos às 14h. Tudo certo", ["Ligamos às 14h.", "Tudo certo."]),
+    ("Oi", ["Oi."]),
+    ("Obrigada. ", ["Obrigada."]),
+    ("", []),
+    ("   ", []),
+
+    # p.e / p.ex: inteiras, sem barra invertida na saída (a versão anterior deixava "p\.ex")
+    ("Aceitamos vários convênios, p.ex. Unimed e Amil. Qual é o seu?",
+     ["Aceitamos vários convênios, p.ex. Unimed e Amil.", "Qual é o seu?"]),
+    ("Alguns cuidados, p.e. evitar sol, são importantes. Entendeu?",
+     ["Alguns cuidados, p.e. evitar sol, são importantes.", "Entendeu?"]),
+    ("Use protetor p.ex.  diariamente. Ok?", ["Use protetor p.ex.  diariamente.", "Ok?"]),
+
+    # Enumeração: "N. " não corta a frase (nem um número seguido de ponto no fim da frase)
+    ("Temos os seguintes procedimentos: 1. Limpeza de pele 2. Peeling químico 3. Botox. Qual deles te interessa?",
+     ["Temos os seguintes procedimentos: 1. Limpeza de pele 2. Peeling químico 3. Botox.", "Qual deles te interessa?"]),
+    ("Passos: 1. Avaliação 2. Orçamento 3. Procedimento", ["Passos: 1. Avaliação 2. Orçamento 3. Procedimento."]),
+    ("A consulta com a Dra. Fernanda custa R$ 350,00. O atendimento é na Av. Paulista, 1000. Posso te ajudar em algo mais?",
+     ["A consulta com a Dra. Fernanda custa R$ 350,00. O atendimento é na Av. Paulista, 1000. Posso te ajudar em algo mais?"]),
+    ("O endereço é Ed. Central, sala 12. Estacionamento no local. Tem mais alguma dúvida?",
+     ["O endereço é Ed. Central, sala 12. Estacionamento no local.", "Tem mais alguma dúvida?"]),
+    ("Pode ser Sra. Ana ou Sra Ana. 10. Fim", ["Pode ser Sra. Ana ou Sra Ana.", "10. Fim."]),
+    ("Temos 2 horários. O das 10. 30 está livre.", ["Temos 2 horários.", "O das 10. 30 está livre."]),
+    ("Horário: 10.30. Pode ser?", ["Horário: 10.30. Pode ser?"]),
+
+    # Abreviações: só com o ponto seguido de espaço; caixa e palavra inteira importam
+    ("Claro! Trabalhamos com cirurgias, procedimentos estéticos, etc. Você já é paciente da clínica?",
+     ["Claro! Trabalhamos com cirurgias, procedimentos estéticos, etc. Você já é paciente da clínica?"]),
+    ("Etc. e tal. Fim.", ["Etc.", "e tal.", "Fim."]),
+    ("Fale com o Dr.Paulo. Ele atende hoje.", ["Fale com o Dr.Paulo.", "Ele atende hoje."]),
+    ("O Exame custa R$ 100. Ex. Hemograma. Ok.", ["O Exame custa R$ 100. Ex. Hemograma.", "Ok."]),
+    ("Ótimo!! Vamos agendar?? Sim.", ["Ótimo!! Vamos agendar?? Sim."]),
+]
+
+
+@pytest.mark.parametrize("texto,esperado", GOLDEN)
+def test_segmentacao(texto, esperado):
+    assert RespostaSegmentada(texto).resposta_segmentada == esperado
+
+
+def test_abreviacoes_do_cliente():
+    texto = "Fale com a Enfa. Paula. Ela confirma o Dr. Rui."
+    assert RespostaSegmentada(texto, abreviacoes=("Enfa",)).resposta_segmentada == [
+        "Fale com a Enfa. Paula.", "Ela confirma o Dr.", "Rui."]
+    assert RespostaSegmentada(texto, abreviacoes=()).resposta_segmentada == [
+        "Fale com a Enfa.", "Paula.", "Ela confirma o Dr.", "Rui."]
+
+
+def _incremental(texto: str, tamanho: int) -> list:
+    segmentador = SegmentadorIncremental()
+    frases = []
+    for i in range(0, len(texto), tamanho):
+        frases += segmentador.alimentar(texto[i:i + tamanho])
+    return frases + segmentador.finalizar()
+
+
+@pytest.mark.parametrize("tamanho", [1, 2, 3, 7, 1000])
+@pytest.mark.parametrize("texto", [texto for texto, _ in GOLDEN])
+def test_incremental_igual_ao_texto_completo(texto, tamanho):
+    assert _incremental(texto, tamanho) == RespostaSegmentada(texto).resposta_segmentada
+
+
+def test_incremental_so_libera_frase_fechada():
+    segmentador = SegmentadorIncremental()
+    assert segmentador.alimentar("Olá, Sr") == []
+    assert segmentador.alimentar(". João. Tudo") == ["Olá, Sr. João."]
+    # O espaço depois do ponto pode continuar no próximo delta: ainda não corta
+    assert segmentador.alimentar(" bem.") == []
+    assert segmentador.alimentar(" Posso ajudar?") == ["Tudo bem."]
+    assert segmentador.finalizar() == ["Posso ajudar?"]